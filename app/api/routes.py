@@ -1,7 +1,9 @@
 # app/api/routes.py
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
+from app import metrics
 from app.services.recommender_service import RecommenderService
+from app.config import ITEM_FILTER_COLUMNS
 
 # Define blueprint for API routes
 api_blueprint = Blueprint('api', __name__)
@@ -9,21 +11,76 @@ api_blueprint = Blueprint('api', __name__)
 # Initialize the recommendation service
 recommender = RecommenderService()
 
+def _filters(args) -> dict:
+    """
+    Item attribute filters among the query parameters, e.g. ?genre=comedy,drama&year=1990-1999
+    """
+    return {column: args[column] for column in ITEM_FILTER_COLUMNS if column in args}
+
+
 @api_blueprint.route('/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "API is running!"}), 200
 
 
+@api_blueprint.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Stage latency histograms, model build times and matrix sizes (Prometheus text format).
+    """
+    return Response(metrics.render_prometheus(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+@api_blueprint.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(recommender.cache_stats()), 200
+
+
+@api_blueprint.route('/batching/stats', methods=['GET'])
+def batching_stats():
+    return jsonify(recommender.batching_stats()), 200
+
+
 @api_blueprint.route('/recommend/user/<int:user_id>', methods=['GET'])
 def recommend_for_user(user_id):
     """
     Recommend items to a user using collaborative filtering.
-    Example: GET /api/recommend/user/42
+    Example: GET /api/recommend/user/42?genre=comedy&year=1990-1999
     """
     try:
         top_n = int(request.args.get("top_n", 10))
-        recommendations = recommender.recommend_for_user(user_id, top_n=top_n)
-        return jsonify({"user_id": user_id, "recommendations": recommendations}), 200
+        with metrics.timed("api.recommend_user.handler"):
+            recommendations = recommender.recommend_for_user(user_id, top_n=top_n, filters=_filters(request.args))
+        with metrics.timed("api.recommend_user.json"):
+            return jsonify({"user_id": user_id, "recommendations": recommendations}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@api_blueprint.route('/recommend/users', methods=['POST'])
+def recommend_for_users():
+    """
+    Recommend items to a batch of users in one pass.
+    Example: POST /api/recommend/users {"user_ids": [42, 43], "top_n": 10, "filters": {"genre": "comedy"}}
+    (filters may also be given as query parameters)
+    """
+    try:
+        payload = request.get_json(force=True) or {}
+        user_ids = [int(user_id) for user_id in payload.get("user_ids", [])]
+        top_n = int(payload.get("top_n", 10))
+        filters = payload.get("filters") or _filters(request.args)
+        with metrics.timed("api.recommend_users.handler"):
+            batch = recommender.recommend_for_users(user_ids, top_n=top_n, filters=filters)
+        with metrics.timed("api.recommend_users.json"):
+            results = [
+                {"user_id": user_id, "recommendations": recommendations}
+                for user_id, recommendations in zip(user_ids, batch)
+            ]
+            return jsonify({"results": results}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -32,11 +89,16 @@ def recommend_for_user(user_id):
 def recommend_similar_items(item_id):
     """
     Recommend similar items using content-based filtering.
-    Example: GET /api/recommend/item/15
+    Example: GET /api/recommend/item/15?year=2000-
     """
     try:
         top_n = int(request.args.get("top_n", 10))
-        recommendations = recommender.recommend_similar_items(item_id, top_n=top_n)
-        return jsonify({"item_id": item_id, "recommendations": recommendations}), 200
+        with metrics.timed("api.recommend_item.handler"):
+            recommendations = recommender.recommend_similar_items(item_id, top_n=top_n,
+                                                                  filters=_filters(request.args))
+        with metrics.timed("api.recommend_item.json"):
+            return jsonify({"item_id": item_id, "recommendations": recommendations}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
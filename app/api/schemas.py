@@ -8,6 +8,11 @@ class RecommendationRequest:
     user_id: int
     top_n: int = 10
 
+@dataclass
+class BatchRecommendationRequest:
+    user_ids: List[int]
+    top_n: int = 10
+
 @dataclass
 class ItemSimilarityRequest:
     item_id: int
@@ -24,6 +29,10 @@ class RecommendationResponse:
     user_id: int
     recommendations: List[Recommendation]
 
+@dataclass
+class BatchRecommendationResponse:
+    results: List[RecommendationResponse]
+
 @dataclass
 class SimilarItemsResponse:
     item_id: int
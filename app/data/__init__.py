@@ -5,9 +5,14 @@ This module handles access to datasets used in the recommendation system.
 You can use this file to expose common data loaders or constants.
 """
 
-from .loaders import load_ratings_data, load_items_data
+from .load_data import load_ratings_data, load_ratings_chunked, load_items_data
+from .id_mapper import IdMapper
+from .hashed_tfidf import HashedTfidf
 
 __all__ = [
     "load_ratings_data",
-    "load_items_data"
+    "load_ratings_chunked",
+    "load_items_data",
+    "IdMapper",
+    "HashedTfidf"
 ]
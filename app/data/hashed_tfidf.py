@@ -0,0 +1,98 @@
+# app/data/hashed_tfidf.py
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+from app.config import HASHING_N_FEATURES, PRECISION
+
+
+class HashedTfidf:
+    """
+    TF-IDF over hashed terms. Hashing needs no fitted vocabulary, so any batch
+    of texts can be vectorized on its own (and in parallel); the only state is
+    the document frequency of each hash bucket, updated as documents are added,
+    replaced or removed. IDF matches TfidfVectorizer's smooth_idf:
+    ln((1 + n_docs) / (1 + df)) + 1, and rows are L2-normalized.
+    """
+
+    def __init__(self, n_features: int = HASHING_N_FEATURES, stop_words: str = "english",
+                 n_jobs: int = 1, chunk_size: int = 10_000, dtype=PRECISION):
+        """
+        n_jobs: processes hashing chunks of chunk_size texts (tokenizing holds the GIL)
+        dtype: float dtype of the counts and weights
+        """
+        self.n_features = n_features
+        self.stop_words = stop_words
+        self.n_jobs = n_jobs or 1
+        self.chunk_size = chunk_size
+        self.dtype = np.dtype(dtype)
+        self.doc_freq = np.zeros(n_features, dtype=np.int64)
+        self.n_docs = 0
+
+    @classmethod
+    def from_state(cls, doc_freq: np.ndarray, n_docs: int, stop_words: str = "english",
+                   dtype=PRECISION) -> "HashedTfidf":
+        """
+        Continue from saved document frequencies (e.g. a model bundle); the
+        bucket count is taken from doc_freq, which is copied so it can be updated.
+        """
+        hasher = cls(n_features=len(doc_freq), stop_words=stop_words, dtype=dtype)
+        hasher.doc_freq = np.array(doc_freq, dtype=np.int64)
+        hasher.n_docs = int(n_docs)
+        return hasher
+
+    def _hasher(self) -> HashingVectorizer:
+        return HashingVectorizer(n_features=self.n_features, stop_words=self.stop_words,
+                                 alternate_sign=False, norm=None, dtype=self.dtype)
+
+    def term_counts(self, texts) -> sparse.csr_matrix:
+        """
+        Raw hashed term counts, one row per text. Stateless: the same text
+        always gets the same row, whatever was vectorized before.
+        """
+        texts = [text if isinstance(text, str) else "" for text in texts]
+        hasher = self._hasher()
+        if self.n_jobs == 1 or len(texts) <= self.chunk_size:
+            return hasher.transform(texts).tocsr()
+
+        chunks = [texts[start:start + self.chunk_size] for start in range(0, len(texts), self.chunk_size)]
+        with ProcessPoolExecutor(max_workers=self.n_jobs) as pool:
+            return sparse.vstack(list(pool.map(hasher.transform, chunks))).tocsr()
+
+    def add_documents(self, counts: sparse.csr_matrix):
+        """
+        Count the term-count rows of new documents into the document frequencies.
+        """
+        counts = sparse.csr_matrix(counts)
+        counts.eliminate_zeros()
+        self.doc_freq += np.bincount(counts.indices, minlength=self.n_features)
+        self.n_docs += counts.shape[0]
+
+    def remove_documents(self, counts: sparse.csr_matrix):
+        """
+        Undo add_documents for documents that were replaced or deleted.
+        """
+        counts = sparse.csr_matrix(counts)
+        counts.eliminate_zeros()
+        self.doc_freq -= np.bincount(counts.indices, minlength=self.n_features)
+        self.n_docs -= counts.shape[0]
+
+    def partial_fit(self, texts) -> sparse.csr_matrix:
+        """
+        Hash new documents, count them in, and return their term counts.
+        """
+        counts = self.term_counts(texts)
+        self.add_documents(counts)
+        return counts
+
+    def idf(self) -> np.ndarray:
+        return np.log((1 + self.n_docs) / (1 + self.doc_freq)) + 1
+
+    def weight(self, counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        """
+        TF-IDF rows for term counts, under the current document frequencies.
+        """
+        return normalize(sparse.csr_matrix(counts) @ sparse.diags(self.idf().astype(self.dtype))).tocsr()
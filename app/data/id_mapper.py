@@ -0,0 +1,242 @@
+# app/data/id_mapper.py
+
+import numpy as np
+import pandas as pd
+
+# Largest id range (relative to the number of ids) served by a direct lookup table
+MAX_TABLE_RATIO = 4
+MIN_TABLE_SIZE = 1024
+# Ids appended in hash mode go to a dict until they reach 1/MERGE_RATIO of the hash index
+MERGE_RATIO = 8
+
+
+class IdMapper:
+    """
+    Bidirectional mapping between external ids and dense indices 0..n-1.
+
+    Reverse lookup is a plain array read (ids[idx]). Forward lookup uses a
+    direct int32 table indexed by id when ids are non-negative integers in a
+    compact range, and a hash index otherwise; both are O(1) per id and
+    vectorized for bulk encode/decode. New ids are appended after the
+    existing ones, so indices already handed out never change.
+
+    Appends are amortized O(new ids): ids live in a buffer grown
+    geometrically, the table tracks the id range incrementally, and hash
+    mode keeps recently appended ids in a dict that is merged into the hash
+    index once it reaches 1/MERGE_RATIO of it.
+    """
+
+    def __init__(self, ids=None):
+        self._buffer = np.empty(0, dtype=np.int64)
+        self._size = 0
+        self._min = self._max = None
+        self._table = None
+        self._index = None      # hash index over the first len(self._index) ids
+        self._recent = {}       # id -> index of the ids appended after it was built
+        if ids is not None:
+            self.extend(ids)
+
+    @property
+    def ids(self) -> np.ndarray:
+        """
+        The ids in index order (a view of the growth buffer).
+        """
+        return self._buffer[:self._size]
+
+    @classmethod
+    def fit(cls, values) -> "IdMapper":
+        """
+        Mapper over the sorted unique values (same order as pivot_table/LabelEncoder).
+        """
+        return cls(np.unique(np.asarray(values)))
+
+    @classmethod
+    def fit_encode(cls, values):
+        """
+        Fit on the sorted unique values and return (mapper, codes of values).
+        """
+        codes, uniques = pd.factorize(np.asarray(values), sort=True)
+        return cls(uniques), codes
+
+    # -------------------------------
+    # Lookup
+    # -------------------------------
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, item_id) -> bool:
+        return self.get(item_id) >= 0
+
+    def __getitem__(self, indices):
+        return self.ids[indices]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.ids if dtype is None else self.ids.astype(dtype)
+
+    def to_numpy(self) -> np.ndarray:
+        return self.ids
+
+    def get(self, item_id, default: int = -1, limit: int = None) -> int:
+        """
+        Index of one id, or default if it is unknown.
+        limit: treat indices >= limit as unknown (a model built on a shared
+            mapper before it grew only covers its first `limit` ids)
+        """
+        if self._table is not None:
+            if isinstance(item_id, (int, np.integer)) and 0 <= item_id < len(self._table):
+                idx = int(self._table[item_id])
+            else:
+                idx = -1
+        else:
+            try:
+                idx = int(self._index.get_loc(item_id))
+            except (KeyError, TypeError, AttributeError):
+                idx = self._recent.get(item_id, -1) if self._recent else -1
+        return idx if 0 <= idx < (len(self) if limit is None else limit) else default
+
+    def get_loc(self, item_id) -> int:
+        """
+        Index of one id; raises KeyError if it is unknown.
+        """
+        idx = self.get(item_id)
+        if idx < 0:
+            raise KeyError(item_id)
+        return idx
+
+    def encode(self, values, limit: int = None) -> np.ndarray:
+        """
+        Vectorized forward lookup; unknown ids (or indices >= limit) map to -1.
+        """
+        values = np.asarray(values)
+        if self._table is not None:
+            codes = np.full(values.shape, -1, dtype=np.int64)
+            values = _as_int_ids(values)
+            if values is not None:
+                in_range = (values >= 0) & (values < len(self._table))
+                codes[in_range] = self._table[values[in_range]]
+        elif self._index is not None:
+            codes = self._index.get_indexer(values.ravel()).reshape(values.shape)
+            if self._recent:
+                missing = np.flatnonzero(codes.ravel() < 0)
+                codes.ravel()[missing] = [self._recent.get(value, -1) for value in values.ravel()[missing].tolist()]
+        else:
+            codes = np.full(values.shape, -1, dtype=np.int64)
+        if limit is not None:
+            codes[codes >= limit] = -1
+        return codes
+
+    get_indexer = encode
+
+    def decode(self, indices) -> np.ndarray:
+        """
+        Vectorized reverse lookup.
+        """
+        return self.ids[np.asarray(indices)]
+
+    # -------------------------------
+    # Growth
+    # -------------------------------
+
+    def extend(self, values) -> np.ndarray:
+        """
+        Append ids not seen before (in first-seen order) and return the codes of all values.
+        """
+        values = np.asarray(values)
+        codes = self.encode(values)
+        unknown = codes < 0
+        if unknown.any():
+            new_ids = np.asarray(pd.unique(values[unknown].ravel()))
+            start = self._size
+            self._append(new_ids)
+            self._add_to_lookup(new_ids, start)
+            codes[unknown] = self.encode(values[unknown])
+        return codes
+
+    def _append(self, new_ids: np.ndarray):
+        """
+        Copy ids into the buffer, doubling its capacity (or widening its dtype) when needed.
+        """
+        end = self._size + len(new_ids)
+        dtype = np.result_type(self._buffer, new_ids) if self._size else new_ids.dtype
+        if end > len(self._buffer) or dtype != self._buffer.dtype or not self._buffer.flags.writeable:
+            buffer = np.empty(max(end, 2 * self._size), dtype=dtype)
+            buffer[:self._size] = self.ids
+            self._buffer = buffer
+        self._buffer[self._size:end] = new_ids
+        self._size = end
+
+    def _add_to_lookup(self, new_ids: np.ndarray, start: int):
+        if new_ids.dtype.kind in "iu" and len(new_ids):
+            low, high = int(new_ids.min()), int(new_ids.max())
+            if start == 0 or self._min is not None:
+                self._min = low if start == 0 else min(self._min, low)
+                self._max = high if start == 0 else max(self._max, high)
+        else:
+            self._min = self._max = None
+
+        positions = np.arange(start, start + len(new_ids), dtype=np.int32)
+        if self._use_table():
+            size = max(self._max + 1, MIN_TABLE_SIZE)
+            if self._table is None or size > len(self._table):
+                # Grow geometrically so appends stay amortized O(new ids)
+                table = np.full(max(size, 2 * len(self._table) if self._table is not None else 0), -1, dtype=np.int32)
+                if self._table is not None:
+                    table[:len(self._table)] = self._table
+                else:
+                    table[self.ids[:start].astype(np.int64)] = np.arange(start, dtype=np.int32)
+                self._table = table
+            self._table[new_ids.astype(np.int64)] = positions
+            self._index, self._recent = None, {}
+            return
+
+        self._table = None
+        if self._index is not None and len(self._recent) + len(new_ids) < len(self._index) // MERGE_RATIO:
+            self._recent.update(zip(new_ids.tolist(), positions.tolist()))
+        else:
+            self._index = pd.Index(self.ids)
+            self._recent = {}
+
+    def _use_table(self) -> bool:
+        if self._min is None or self._size == 0 or self._min < 0:
+            return False
+        return self._max < max(MAX_TABLE_RATIO * self._size, MIN_TABLE_SIZE)
+
+    # -------------------------------
+    # Persistence
+    # -------------------------------
+
+    def save(self, path: str):
+        """
+        Save the ids as .npy; the lookup structures are rebuilt on load.
+        """
+        np.save(path, self.ids, allow_pickle=self.ids.dtype == object)
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str = None) -> "IdMapper":
+        return cls.from_ids(np.load(path, mmap_mode=mmap_mode, allow_pickle=mmap_mode is None))
+
+    @classmethod
+    def from_ids(cls, ids: np.ndarray) -> "IdMapper":
+        """
+        Wrap an existing array of unique ids (e.g. memory-mapped) without copying it.
+        """
+        mapper = cls()
+        mapper._buffer, mapper._size = ids, len(ids)
+        if len(ids):
+            mapper._add_to_lookup(np.asarray(ids), 0)
+        return mapper
+
+
+def _as_int_ids(values: np.ndarray):
+    """
+    values as an integer array if every value is integral (e.g. object or
+    float arrays coming from nullable pandas columns), else None.
+    """
+    if values.dtype.kind in "iu":
+        return values
+    try:
+        as_int = values.astype(np.int64)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return as_int if np.array_equal(as_int, values) else None
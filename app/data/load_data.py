@@ -1,7 +1,10 @@
 # app/data/load_data.py
 
 import pandas as pd
+import numpy as np
 import os
+import json
+import hashlib
 import logging
 
 # Setup logging
@@ -11,6 +14,11 @@ logger = logging.getLogger(__name__)
 # Define the directory where CSVs are stored
 DATA_DIR = os.path.dirname(__file__)
 
+# Compact dtypes the ratings columns are downcast to once each chunk is validated
+RATINGS_COLUMNS = {"user_id": np.int32, "item_id": np.int32, "rating": np.float32, "timestamp": np.int64}
+REQUIRED_RATINGS_COLUMNS = ("user_id", "item_id", "rating")
+CACHE_FORMAT = 2
+
 def load_ratings_data(file_name: str = "ratings.csv") -> pd.DataFrame:
     """
     Load user-item ratings data.
@@ -28,10 +36,121 @@ def load_ratings_data(file_name: str = "ratings.csv") -> pd.DataFrame:
     return pd.DataFrame()
 
 
-def load_items_data(file_name: str = "items.csv") -> pd.DataFrame:
+def load_ratings_chunked(file_name: str = "ratings.csv", chunksize: int = 1_000_000,
+                         use_cache: bool = True, strict: bool = False) -> pd.DataFrame:
+    """
+    Stream the ratings CSV in chunks with compact dtypes (int32 ids, float32
+    ratings). Each chunk is parsed permissively and validated as it is read:
+    rows with malformed or missing ids/ratings, non-integral or out-of-range
+    ids, or ratings outside 0-5 are dropped (a missing timestamp becomes 0).
+    The result is cached as .npy columns in <file>.cache/, keyed by a hash of
+    the CSV, so later loads skip parsing entirely.
+    Expected columns: user_id, item_id, rating (timestamp optional)
+    strict: re-raise a missing or unreadable file instead of returning an empty frame
+    """
+    path = os.path.join(DATA_DIR, file_name)
+    cache_dir = path + ".cache"
+    try:
+        digest = _file_digest(path)
+        if use_cache:
+            cached = _read_column_cache(cache_dir, digest)
+            if cached is not None:
+                logger.info(f"Loaded ratings cache from {cache_dir}, shape={cached.shape}")
+                return cached
+
+        columns, dropped = {}, 0
+        reader = pd.read_csv(path, usecols=lambda c: c in RATINGS_COLUMNS, chunksize=chunksize)
+        for chunk in reader:
+            arrays, invalid = _parse_ratings_chunk(chunk)
+            dropped += invalid
+            for name, array in arrays.items():
+                columns.setdefault(name, []).append(array)
+
+        arrays = {name: np.concatenate(parts) for name, parts in columns.items()}
+        df = pd.DataFrame(arrays, copy=False)
+        logger.info(f"Loaded ratings data from {path} in chunks, shape={df.shape}, dropped {dropped} invalid rows")
+        if use_cache:
+            _write_column_cache(cache_dir, digest, arrays)
+        return df
+    except FileNotFoundError:
+        logger.error(f"Ratings file not found: {path}")
+        if strict:
+            raise
+    except Exception as e:
+        logger.error(f"Error loading ratings data: {e}")
+        if strict:
+            raise
+    return pd.DataFrame()
+
+
+def _parse_ratings_chunk(chunk: pd.DataFrame):
+    """
+    Validated, downcast columns of one raw ratings chunk and the number of rows dropped.
+    Columns are coerced to numbers (malformed values become NaN) before any
+    narrowing, so one bad value only costs its own row.
+    """
+    missing = [name for name in REQUIRED_RATINGS_COLUMNS if name not in chunk]
+    if missing:
+        raise KeyError(f"Ratings CSV lacks columns {missing}")
+
+    values = {name: pd.to_numeric(chunk[name], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+              for name in RATINGS_COLUMNS if name in chunk}
+    int32 = np.iinfo(np.int32)
+    valid = (values["rating"] >= 0.0) & (values["rating"] <= 5.0)
+    for name in ("user_id", "item_id"):
+        ids = values[name]
+        valid &= (ids == np.floor(ids)) & (ids >= int32.min) & (ids <= int32.max)
+
+    arrays = {}
+    for name, column in values.items():
+        column = column[valid]
+        if name == "timestamp":
+            column = np.nan_to_num(column, nan=0.0)
+        arrays[name] = column.astype(RATINGS_COLUMNS[name])
+    return arrays, int(len(valid) - np.count_nonzero(valid))
+
+
+def _file_digest(path: str, block_size: int = 8 * 2 ** 20) -> str:
+    """
+    BLAKE2 hash of a file, read in blocks.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_column_cache(cache_dir: str, digest: str):
+    meta_path = os.path.join(cache_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get("format") != CACHE_FORMAT or meta.get("digest") != digest:
+        return None
+    arrays = {name: np.load(os.path.join(cache_dir, f"{name}.npy")) for name in meta["columns"]}
+    return pd.DataFrame(arrays, copy=False)
+
+
+def _write_column_cache(cache_dir: str, digest: str, arrays: dict):
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(cache_dir, f"{name}.npy"), array)
+        # Written last: a cache without a matching meta.json is never read
+        with open(os.path.join(cache_dir, "meta.json"), "w") as f:
+            json.dump({"format": CACHE_FORMAT, "digest": digest, "columns": list(arrays)}, f)
+        logger.info(f"Wrote ratings cache to {cache_dir}")
+    except OSError as e:
+        logger.warning(f"Could not write ratings cache: {e}")
+
+
+def load_items_data(file_name: str = "items.csv", strict: bool = False) -> pd.DataFrame:
     """
     Load item metadata.
     Expected columns: item_id, description
+    strict: re-raise a missing or unreadable file instead of returning an empty frame
     """
     path = os.path.join(DATA_DIR, file_name)
     try:
@@ -40,21 +159,28 @@ def load_items_data(file_name: str = "items.csv") -> pd.DataFrame:
         return df
     except FileNotFoundError:
         logger.error(f"Items file not found: {path}")
+        if strict:
+            raise
     except Exception as e:
         logger.error(f"Error loading items data: {e}")
+        if strict:
+            raise
     return pd.DataFrame()
 
 
-def clean_ratings_data(df: pd.DataFrame) -> pd.DataFrame:
+def clean_ratings_data(df: pd.DataFrame, log: bool = True) -> pd.DataFrame:
     """
     Clean missing or invalid ratings.
+    Builds a single validity mask, so the data is filtered with one copy.
     """
     initial_shape = df.shape
-    df = df.dropna(subset=["user_id", "item_id", "rating"])
-    df["rating"] = pd.to_numeric(df["rating"], errors="coerce")
-    df = df.dropna(subset=["rating"])
-    df = df[df["rating"].between(0.0, 5.0)]
-    logger.info(f"Cleaned ratings data: {initial_shape} -> {df.shape}")
+    ratings = pd.to_numeric(df["rating"], errors="coerce")
+    valid = df["user_id"].notna() & df["item_id"].notna() & ratings.between(0.0, 5.0)
+    df = df.loc[valid]
+    if ratings.dtype != df["rating"].dtype:
+        df = df.assign(rating=ratings[valid])
+    if log:
+        logger.info(f"Cleaned ratings data: {initial_shape} -> {df.shape}")
     return df
 
 
@@ -1,9 +1,13 @@
 # app/data/preprocessing.py
 
+import numpy as np
 import pandas as pd
 import logging
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.preprocessing import LabelEncoder
+
+from app.data.hashed_tfidf import HashedTfidf
+from app.data.id_mapper import IdMapper
+from app.config import CONTENT_VECTORIZE_JOBS, PRECISION
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -14,32 +18,38 @@ logger = logging.getLogger(__name__)
 # Collaborative Filtering Prep
 # -------------------------------
 
-def encode_user_item_ids(df: pd.DataFrame) -> pd.DataFrame:
+def encode_user_item_ids(df: pd.DataFrame, user_mapper: IdMapper = None, item_mapper: IdMapper = None):
     """
     Encode user_id and item_id into numeric labels.
     Useful for matrix factorization-based models.
+    Pass existing mappers to keep their indices and append unseen ids;
+    the (possibly extended) mappers are returned for reuse and persistence.
     """
     df = df.copy()
-    user_encoder = LabelEncoder()
-    item_encoder = LabelEncoder()
-
-    df['user_idx'] = user_encoder.fit_transform(df['user_id'])
-    df['item_idx'] = item_encoder.fit_transform(df['item_id'])
+    if user_mapper is None:
+        user_mapper, df['user_idx'] = IdMapper.fit_encode(df['user_id'])
+    else:
+        df['user_idx'] = user_mapper.extend(df['user_id'])
+    if item_mapper is None:
+        item_mapper, df['item_idx'] = IdMapper.fit_encode(df['item_id'])
+    else:
+        df['item_idx'] = item_mapper.extend(df['item_id'])
 
     logger.info("Encoded user_id and item_id into indices.")
-    return df, user_encoder, item_encoder
+    return df, user_mapper, item_mapper
 
 
 # -------------------------------
 # Content-Based Filtering Prep
 # -------------------------------
 
-def vectorize_item_descriptions(items_df: pd.DataFrame, max_features: int = 1000):
+def vectorize_item_descriptions(items_df: pd.DataFrame, max_features: int = 1000, dtype=PRECISION):
     """
     Apply TF-IDF vectorization to item descriptions.
+    dtype: float dtype of the feature matrix (config PRECISION)
     Returns feature matrix and vectorizer.
     """
-    tfidf = TfidfVectorizer(stop_words='english', max_features=max_features)
+    tfidf = TfidfVectorizer(stop_words='english', max_features=max_features, dtype=np.dtype(dtype).type)
     try:
         tfidf_matrix = tfidf.fit_transform(items_df['description'].fillna(""))
         logger.info(f"TF-IDF vectorization complete. Shape: {tfidf_matrix.shape}")
@@ -49,6 +59,20 @@ def vectorize_item_descriptions(items_df: pd.DataFrame, max_features: int = 1000
         return None, None
 
 
+def hash_item_descriptions(items_df: pd.DataFrame, hasher: HashedTfidf = None, dtype=PRECISION):
+    """
+    TF-IDF over hashed terms; no vocabulary is fitted, so new items can be
+    vectorized later with the returned hasher (see ContentBasedFiltering.add_items).
+    dtype: float dtype of a new hasher's features (a given hasher keeps its own)
+    Returns feature matrix and hasher.
+    """
+    hasher = hasher or HashedTfidf(n_jobs=CONTENT_VECTORIZE_JOBS, dtype=dtype)
+    counts = hasher.partial_fit(items_df['description'].fillna(""))
+    tfidf_matrix = hasher.weight(counts)
+    logger.info(f"Hashed TF-IDF vectorization complete. Shape: {tfidf_matrix.shape}")
+    return tfidf_matrix, hasher
+
+
 # -------------------------------
 # Hybrid Filtering Prep
 # -------------------------------
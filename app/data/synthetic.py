@@ -0,0 +1,66 @@
+# app/data/synthetic.py
+
+import numpy as np
+import pandas as pd
+
+GENRES = ["action", "adventure", "animation", "comedy", "crime", "documentary", "drama",
+          "fantasy", "horror", "musical", "mystery", "romance", "sci-fi", "thriller", "western"]
+
+
+def power_law_weights(n: int, exponent: float, rng: np.random.Generator) -> np.ndarray:
+    """
+    Zipf-like activity weights (rank^-exponent) in random id order, summing to 1.
+    """
+    weights = np.arange(1, n + 1, dtype=np.float64) ** -exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def generate_ratings(n_users: int = 1000, n_items: int = 2000, n_ratings: int = 50_000,
+                     user_exponent: float = 0.8, item_exponent: float = 1.0,
+                     start_time: int = 946_684_800, span_days: int = 3650, seed: int = 42) -> pd.DataFrame:
+    """
+    MovieLens-like ratings [user_id, item_id, rating, timestamp].
+    User and item activity follow power laws (a few heavy users and
+    blockbuster items, a long tail of both). Ratings are 1-5 stars from
+    per-user and per-item biases plus noise. Duplicate (user, item) draws are
+    dropped, so slightly fewer than n_ratings rows may be returned.
+    """
+    rng = np.random.default_rng(seed)
+    users = rng.choice(n_users, size=n_ratings, p=power_law_weights(n_users, user_exponent, rng))
+    items = rng.choice(n_items, size=n_ratings, p=power_law_weights(n_items, item_exponent, rng))
+
+    user_bias = rng.normal(0, 0.5, n_users)
+    item_bias = rng.normal(0, 0.7, n_items)
+    stars = 3.5 + user_bias[users] + item_bias[items] + rng.normal(0, 0.8, n_ratings)
+    ratings = np.clip(np.rint(stars), 1, 5)
+    timestamps = start_time + rng.integers(0, span_days * 86_400, n_ratings)
+
+    df = pd.DataFrame({
+        "user_id": users.astype(np.int32) + 1,
+        "item_id": items.astype(np.int32) + 1,
+        "rating": ratings.astype(np.float32),
+        "timestamp": timestamps.astype(np.int64),
+    })
+    return df.drop_duplicates(["user_id", "item_id"], keep="last").reset_index(drop=True)
+
+
+def generate_items(n_items: int = 2000, vocab_size: int = 5000, words_per_item: int = 30,
+                   word_exponent: float = 1.1, seed: int = 42) -> pd.DataFrame:
+    """
+    Item metadata [item_id, title, description, genre, year] with Zipf-distributed
+    description words, so TF-IDF sees realistic term frequencies.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f"term{i}" for i in range(vocab_size)])
+    words = rng.choice(vocab_size, size=(n_items, words_per_item),
+                       p=power_law_weights(vocab_size, word_exponent, rng))
+
+    genre_weights = power_law_weights(len(GENRES), 1.0, rng)
+    return pd.DataFrame({
+        "item_id": np.arange(1, n_items + 1, dtype=np.int32),
+        "title": [f"Item {i}" for i in range(1, n_items + 1)],
+        "description": [" ".join(row) for row in vocabulary[words]],
+        "genre": rng.choice(GENRES, size=n_items, p=genre_weights),
+        "year": rng.integers(1950, 2025, n_items).astype(np.int16),
+    })
@@ -0,0 +1,202 @@
+# app/metrics.py
+
+import bisect
+import threading
+import time
+import numpy as np
+from scipy import sparse
+
+# Default buckets for batch sizes and for latencies in seconds
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+STAGE_METRIC = "recsys_stage_seconds"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with cumulative (Prometheus-style) counts.
+    Safe to observe from many threads.
+    """
+
+    def __init__(self, name: str, buckets, description: str = "", labels: dict = None):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self.description = description
+        self.labels = labels or {}
+        self._counts = [0] * (len(self.buckets) + 1)    # last slot: above every bucket
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[slot] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        """
+        {"buckets": {upper_bound: observations <= bound}, "count", "sum", "mean"}
+        """
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        cumulative, running = {}, 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = count
+        return {"buckets": cumulative, "count": count, "sum": total,
+                "mean": total / count if count else 0.0}
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self._sum = 0.0
+            self._count = 0
+
+
+class Gauge:
+    """
+    Last-value metric, e.g. a model build time or a matrix size.
+    """
+
+    def __init__(self, name: str, description: str = "", labels: dict = None):
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = float(value)
+
+    def snapshot(self) -> float:
+        return self.value
+
+
+class StageTimer:
+    """
+    Context manager adding the elapsed wall time of a block to a histogram
+    (also kept as .elapsed once the block exits).
+    """
+    __slots__ = ("histogram", "started", "elapsed")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        self.histogram.observe(self.elapsed)
+        return False
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+_stage_histograms = {}
+
+
+def _register(cls, name: str, labels: dict, *args):
+    key = (name, tuple(sorted(labels.items())))
+    metric = _registry.get(key)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.setdefault(key, cls(name, *args, labels=labels))
+    return metric
+
+
+def histogram(name: str, buckets=LATENCY_BUCKETS, description: str = "", **labels) -> Histogram:
+    """
+    Get or create the process-wide histogram registered under name and labels.
+    """
+    return _register(Histogram, name, labels, buckets, description)
+
+
+def gauge(name: str, description: str = "", **labels) -> Gauge:
+    """
+    Get or create the process-wide gauge registered under name and labels.
+    """
+    return _register(Gauge, name, labels, description)
+
+
+def timed(stage: str) -> StageTimer:
+    """
+    Time a block into the per-stage latency histogram:
+        with metrics.timed("cf.score"): ...
+    """
+    stage_histogram = _stage_histograms.get(stage)
+    if stage_histogram is None:
+        stage_histogram = histogram(STAGE_METRIC, LATENCY_BUCKETS, "Latency of a serving stage", stage=stage)
+        _stage_histograms[stage] = stage_histogram
+    return StageTimer(stage_histogram)
+
+
+def record_build(model: str, seconds: float, **matrices):
+    """
+    Record a model's build time and the shape, stored entries and bytes of its matrices.
+    """
+    gauge("recsys_model_build_seconds", "Duration of the last model build", model=model).set(seconds)
+    for matrix_name, matrix in matrices.items():
+        if matrix is None:
+            continue
+        if sparse.issparse(matrix):
+            stored, nbytes = matrix.nnz, matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+        else:
+            matrix = np.asarray(matrix)
+            stored, nbytes = matrix.size, matrix.nbytes
+        labels = {"model": model, "matrix": matrix_name}
+        gauge("recsys_matrix_rows", "Rows of a model matrix", **labels).set(matrix.shape[0])
+        gauge("recsys_matrix_cols", "Columns of a model matrix", **labels).set(matrix.shape[1])
+        gauge("recsys_matrix_stored_entries", "Stored entries of a model matrix", **labels).set(stored)
+        gauge("recsys_matrix_bytes", "Memory held by a model matrix", **labels).set(nbytes)
+
+
+def snapshot() -> dict:
+    """
+    Snapshot of every registered metric, keyed by its Prometheus series name.
+    """
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {_series(metric.name, metric.labels): metric.snapshot() for metric in metrics}
+
+
+def render_prometheus() -> str:
+    """
+    Every registered metric in the Prometheus text exposition format.
+    """
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+
+    lines, described = [], set()
+    for metric in metrics:
+        kind = "histogram" if isinstance(metric, Histogram) else "gauge"
+        if metric.name not in described:
+            described.add(metric.name)
+            lines.append(f"# HELP {metric.name} {metric.description or metric.name}")
+            lines.append(f"# TYPE {metric.name} {kind}")
+        if kind == "gauge":
+            lines.append(f"{_series(metric.name, metric.labels)} {metric.value!r}")
+            continue
+        state = metric.snapshot()
+        for bound, count in state["buckets"].items():
+            lines.append(f"{_series(metric.name + '_bucket', {**metric.labels, 'le': bound})} {count}")
+        lines.append(f"{_series(metric.name + '_sum', metric.labels)} {state['sum']!r}")
+        lines.append(f"{_series(metric.name + '_count', metric.labels)} {state['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _series(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return f"{name}{{{pairs}}}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -7,6 +7,9 @@ def get_model(model_type: str):
     elif model_type == "content_based":
         from .content_based import ContentBasedFiltering
         return ContentBasedFiltering()
+    elif model_type == "matrix_factorization":
+        from .matrix_factorization import MatrixFactorization
+        return MatrixFactorization()
     elif model_type == "hybrid":
         from .hybrid import HybridRecommender
         return HybridRecommender()
@@ -0,0 +1,189 @@
+# app/models/ann.py
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from app.models.utils import to_dense, top_n_indices, top_n_rows
+
+class IVFIndex:
+    """
+    Inverted-file ANN index in pure NumPy.
+    Vectors are grouped by a spherical k-means coarse quantizer; a query scores
+    only the vectors in its n_probe closest lists. Raising n_probe trades
+    latency for recall (n_probe == n_lists is exact search).
+    """
+
+    def __init__(self, n_lists: int = 100, n_probe: int = 8, metric: str = "ip",
+                 n_iter: int = 10, random_state: int = 42):
+        """
+        metric: "ip" (inner product, e.g. MF factors) or "cosine" (e.g. TF-IDF rows)
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.metric = metric
+        self.n_iter = n_iter
+        self.random_state = random_state
+
+        self.centroids = None
+        self.list_offsets = None
+        self.list_ids = None
+        self.vectors = None
+
+    def build(self, vectors) -> "IVFIndex":
+        """
+        Cluster the vectors (dense array or sparse matrix, one row per item)
+        and lay them out list by list.
+        """
+        if self.metric == "cosine":
+            vectors = normalize(vectors)
+        self.n_lists = max(1, min(self.n_lists, vectors.shape[0]))
+        assignments = self._fit_centroids(vectors)
+
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=self.n_lists)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.list_ids = order
+        self.vectors = vectors[order]
+        return self
+
+    def update(self, vectors, positions) -> "IVFIndex":
+        """
+        Insert new item positions, or replace the vectors of existing ones,
+        without reclustering: each vector joins the list of its closest
+        centroid. Call build() again once the catalog has drifted.
+        """
+        positions = np.asarray(positions)
+        if self.metric == "cosine":
+            vectors = normalize(vectors)
+        new_lists = np.asarray(to_dense(normalize(vectors) @ self.centroids.T).argmax(axis=1)).ravel()
+
+        keep = ~np.isin(self.list_ids, positions)
+        old_lists = np.repeat(np.arange(self.n_lists), np.diff(self.list_offsets))[keep]
+        lists = np.concatenate([old_lists, new_lists])
+        ids = np.concatenate([self.list_ids[keep], positions])
+        if sparse.issparse(self.vectors):
+            all_vectors = sparse.vstack([self.vectors[np.flatnonzero(keep)], vectors]).tocsr()
+        else:
+            all_vectors = np.vstack([self.vectors[keep], to_dense(vectors)])
+
+        order = np.argsort(lists, kind="stable")
+        counts = np.bincount(lists, minlength=self.n_lists)
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.list_ids = ids[order]
+        self.vectors = all_vectors[order]
+        return self
+
+    def _fit_centroids(self, vectors) -> np.ndarray:
+        """
+        Spherical k-means; returns the list assignment of every vector.
+        """
+        rng = np.random.default_rng(self.random_state)
+        unit = normalize(vectors)
+        seeds = rng.choice(unit.shape[0], self.n_lists, replace=False)
+        self.centroids = to_dense(unit[seeds])
+
+        for _ in range(self.n_iter):
+            assignments = np.asarray(to_dense(unit @ self.centroids.T).argmax(axis=1)).ravel()
+            members = sparse.csr_matrix(
+                (np.ones(len(assignments)), (assignments, np.arange(len(assignments)))),
+                shape=(self.n_lists, unit.shape[0]),
+            )
+            sums = to_dense(members @ unit)
+            empty = np.asarray(members.sum(axis=1)).ravel() == 0
+            sums[empty] = self.centroids[empty]
+            self.centroids = normalize(sums)
+        return np.asarray(to_dense(unit @ self.centroids.T).argmax(axis=1)).ravel()
+
+    def search(self, query, top_n: int = 10, exclude=None, n_probe: int = None, allowed: np.ndarray = None):
+        """
+        Approximate top-N for one query vector.
+        exclude: item positions that must not be returned (e.g. rated items)
+        allowed: boolean mask over item positions of the only ones that may be returned
+        Returns (item_positions, scores), best first.
+        """
+        query = to_dense(query).ravel()
+        if self.metric == "cosine":
+            norm = np.linalg.norm(query)
+            query = query / norm if norm > 0 else query
+
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        probe = top_n_indices(self.centroids @ query, n_probe)
+        rows = np.concatenate([
+            np.arange(self.list_offsets[l], self.list_offsets[l + 1]) for l in probe
+        ])
+        scores = np.asarray(to_dense(self.vectors[rows] @ query)).ravel()
+        candidates = self.list_ids[rows]
+
+        excluded = np.isin(candidates, exclude) if exclude is not None else None
+        top = top_n_indices(scores, top_n, exclude=excluded,
+                            allowed=allowed[candidates] if allowed is not None else None)
+        return candidates[top], scores[top]
+
+    def save(self, path: str, item_ids=None):
+        """
+        Save the index as a single .npz file.
+        item_ids: ids of the item positions it was built over, saved with it
+            so loaders can check it still matches their items
+        """
+        arrays = {
+            "params": np.array([self.n_lists, self.n_probe, self.n_iter, self.random_state]),
+            "metric": np.array(self.metric),
+            "centroids": self.centroids,
+            "list_offsets": self.list_offsets,
+            "list_ids": self.list_ids,
+        }
+        if sparse.issparse(self.vectors):
+            vectors = sparse.csr_matrix(self.vectors)
+            arrays.update(vectors_data=vectors.data, vectors_indices=vectors.indices,
+                          vectors_indptr=vectors.indptr, vectors_shape=np.array(vectors.shape))
+        else:
+            arrays["vectors"] = self.vectors
+        if item_ids is not None:
+            arrays["item_ids"] = np.asarray(item_ids)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str, item_ids=None):
+        """
+        Load an index saved with save().
+        item_ids: ids the item positions must have; returns None when the index
+            was saved without ids or for other items (so the caller rebuilds it)
+        """
+        with np.load(path) as stored:
+            if item_ids is not None and ("item_ids" not in stored or
+                                         not np.array_equal(stored["item_ids"], np.asarray(item_ids))):
+                return None
+            n_lists, n_probe, n_iter, random_state = stored["params"].tolist()
+            index = cls(n_lists, n_probe, str(stored["metric"]), n_iter, random_state)
+            index.centroids = stored["centroids"]
+            index.list_offsets = stored["list_offsets"]
+            index.list_ids = stored["list_ids"]
+            if "vectors" in stored:
+                index.vectors = stored["vectors"]
+            else:
+                index.vectors = sparse.csr_matrix(
+                    (stored["vectors_data"], stored["vectors_indices"], stored["vectors_indptr"]),
+                    shape=tuple(stored["vectors_shape"]),
+                )
+        return index
+
+
+def recall_at_k(index: IVFIndex, vectors, queries, k: int = 10, probes=(1, 2, 4, 8, 16)) -> dict:
+    """
+    Recall@K of the index against exact search, for each n_probe setting.
+    vectors: the matrix the index was built from; queries: one query per row.
+    Returns {n_probe: recall}.
+    """
+    if index.metric == "cosine":
+        vectors, queries = normalize(vectors), normalize(queries)
+    exact = top_n_rows(to_dense(queries @ vectors.T), k)
+
+    report = {}
+    for n_probe in probes:
+        hits = sum(
+            len(np.intersect1d(index.search(queries[row], k, n_probe=n_probe)[0], truth))
+            for row, truth in enumerate(exact)
+        )
+        report[n_probe] = hits / max(sum(len(truth) for truth in exact), 1)
+    return report
@@ -0,0 +1,148 @@
+# app/models/attributes.py
+
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from app.data.id_mapper import IdMapper
+from app.config import FILTER_MASK_CACHE, ITEM_FILTER_COLUMNS
+
+
+class AttributeIndex:
+    """
+    Packed bitmaps of item attributes (genre, year, category, ...) for
+    filtered recommendations. Each indexed column keeps one bitmap row per
+    distinct value over the positions of an item IdMapper, the one the models
+    share. A filter ORs the bitmaps of the values it accepts in a column and
+    ANDs the columns, so the mask costs a few vectorized byte operations and
+    top-N selection applies it together with the rated-item mask.
+
+    Filter expressions map a column to comma-separated values, e.g.
+        {"genre": "action,comedy", "year": "1990-1999"}
+    Numeric columns also accept inclusive ranges "lo-hi" (either side open).
+    """
+
+    def __init__(self, items_df: pd.DataFrame, item_mapper: IdMapper = None,
+                 columns=ITEM_FILTER_COLUMNS, cache_size: int = FILTER_MASK_CACHE):
+        """
+        items_df: item metadata [item_id, <columns>...]; columns it lacks are not indexed
+        item_mapper: IdMapper shared with the models, so masks line up with their item axes
+        cache_size: decoded masks kept for repeated filters
+        """
+        self.item_index = item_mapper if item_mapper is not None else IdMapper()
+        self.columns = [column for column in columns if column in items_df]
+        self.numeric = {column: pd.api.types.is_numeric_dtype(items_df[column]) for column in self.columns}
+        self.n_items = 0
+        self.raw = {}       # column -> attribute value per item position (NaN/None: missing)
+        self.values = {}    # column -> sorted distinct values
+        self.bitmaps = {}   # column -> packed bitmaps, one row per value
+        self.cache_size = cache_size
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+        self.update(items_df)
+
+    def update(self, items_df: pd.DataFrame):
+        """
+        Add or change the attributes of items and rebuild the bitmaps
+        (columns items_df lacks are left as they are).
+        """
+        rows = self.item_index.extend(items_df["item_id"])
+        self.n_items = len(self.item_index)
+        for column in self.columns:
+            raw = self.raw.get(column)
+            grow = self.n_items - (0 if raw is None else len(raw))
+            given = column in items_df
+            if self.numeric[column]:
+                raw = np.full(grow, np.nan) if raw is None else np.pad(raw, (0, grow), constant_values=np.nan)
+                if given:
+                    raw[rows] = pd.to_numeric(items_df[column], errors="coerce").to_numpy(dtype=np.float64)
+                present = ~np.isnan(raw)
+            else:
+                raw = np.full(grow, None, dtype=object) if raw is None else np.concatenate([raw, np.full(grow, None)])
+                if given:
+                    raw[rows] = items_df[column].astype("string").str.casefold().to_numpy(dtype=object, na_value=None)
+                present = pd.notna(raw)
+            self.raw[column] = raw
+            self.values[column], self.bitmaps[column] = _build_bitmaps(raw, present)
+        with self._lock:
+            self._masks.clear()
+
+    def key(self, filters: dict):
+        """
+        Canonical, hashable form of a filter dict (e.g. for result cache keys),
+        or None for no filters. Raises ValueError for columns that are not indexed.
+        """
+        if not filters:
+            return None
+        unknown = set(filters) - set(self.columns)
+        if unknown:
+            raise ValueError(f"Cannot filter on {sorted(unknown)}; indexed columns: {self.columns}")
+        return tuple(sorted(
+            (column, ",".join(map(str, value)) if isinstance(value, (list, tuple)) else str(value))
+            for column, value in filters.items()
+        ))
+
+    def mask(self, filters: dict, n_items: int = None):
+        """
+        Boolean mask of the item positions matching every filter, or None for no filters.
+        n_items: length of the item axis it is applied to; positions beyond
+            the indexed items (no metadata) never match
+        """
+        key = self.key(filters)
+        if key is None:
+            return None
+
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+        if mask is None:
+            bitmap = None
+            for column, expression in key:
+                selected = self.bitmaps[column][self._value_codes(column, expression)]
+                column_bits = np.bitwise_or.reduce(selected, axis=0) if len(selected) else \
+                    np.zeros(self.bitmaps[column].shape[1], dtype=np.uint8)
+                bitmap = column_bits if bitmap is None else bitmap & column_bits
+            mask = np.unpackbits(bitmap, count=self.n_items).view(bool)
+            with self._lock:
+                self._masks[key] = mask
+                while len(self._masks) > self.cache_size:
+                    self._masks.popitem(last=False)
+
+        if n_items is None or n_items == len(mask):
+            return mask
+        if n_items < len(mask):
+            return mask[:n_items]
+        return np.concatenate([mask, np.zeros(n_items - len(mask), dtype=bool)])
+
+    def _value_codes(self, column: str, expression: str) -> np.ndarray:
+        """
+        Bitmap rows of the values one column's expression accepts.
+        """
+        values = self.values[column]
+        parts = [part.strip() for part in expression.split(",") if part.strip()]
+        if not self.numeric[column]:
+            return np.flatnonzero(np.isin(values, [part.casefold() for part in parts]))
+
+        accepted = np.zeros(len(values), dtype=bool)
+        for part in parts:
+            low, is_range, high = part.partition("-")
+            if is_range:
+                accepted |= (values >= float(low or -np.inf)) & (values <= float(high or np.inf))
+            else:
+                accepted |= values == float(part)
+        return np.flatnonzero(accepted)
+
+
+def _build_bitmaps(raw: np.ndarray, present: np.ndarray):
+    """
+    Sorted distinct values of a column and one packed bitmap per value.
+    """
+    values, codes = np.unique(raw[present], return_inverse=True)
+    item_codes = np.full(len(raw), -1, dtype=np.int64)
+    item_codes[present] = codes
+    bitmaps = np.empty((len(values), (len(raw) + 7) // 8), dtype=np.uint8)
+    for code in range(len(values)):
+        bitmaps[code] = np.packbits(item_codes == code)
+    return values, bitmaps
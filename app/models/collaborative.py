@@ -1,87 +1,583 @@
 # app/models/collaborative.py
 
+import time
 import pandas as pd
 import numpy as np
+from scipy import sparse as sp
 from sklearn.metrics.pairwise import cosine_similarity
 
+from app import metrics
+from app.data.id_mapper import IdMapper
+from app.models.memory import choose_strategy, collaborative_footprint, float_dtype
+from app.models.utils import to_dense, top_n_indices, top_n_rows
+from app.config import MEMORY_BUDGET, PRECISION
+
+# Pending rating/similarity corrections are summed into their CSR matrix once
+# they hold this fraction of its entries (see apply_ratings)
+MERGE_FRACTION = 0.05
+
 class CollaborativeFiltering:
-    def __init__(self, ratings_df: pd.DataFrame, similarity_type: str = "user"):
+    def __init__(self, ratings_df: pd.DataFrame, similarity_type: str = "user", sparse: bool = False,
+                 user_mapper: IdMapper = None, item_mapper: IdMapper = None, dtype=PRECISION,
+                 memory_budget: int = MEMORY_BUDGET):
         """
         ratings_df: DataFrame with columns [user_id, item_id, rating]
         similarity_type: "user" or "item"
+        sparse: keep the user-item and similarity matrices in scipy CSR format
+        user_mapper, item_mapper: IdMappers shared with other models; ids not
+            in them yet are appended (fresh mappers are created by default)
+        dtype: float dtype of the rating and similarity matrices
+        memory_budget: peak build bytes; a dense build estimated over it
+            switches to sparse or is refused (see app.models.memory)
         """
         self.ratings_df = ratings_df
         self.similarity_type = similarity_type
+        self.sparse = sparse
+        self.dtype = float_dtype(dtype)
+        self.memory_budget = memory_budget
         self.user_item_matrix = None
         self.similarity_matrix = None
+        self.user_index = user_mapper if user_mapper is not None else IdMapper()
+        self.item_index = item_mapper if item_mapper is not None else IdMapper()
+        self._item_user = None
+        self._norms = None
+        self._values = None
+        self._pending = {}
         self._prepare()
 
+    @classmethod
+    def from_arrays(cls, user_index, item_index, user_item_matrix, similarity_matrix,
+                    similarity_type: str = "user") -> "CollaborativeFiltering":
+        """
+        Rebuild a fitted model from stored arrays (e.g. a memory-mapped bundle)
+        without touching the ratings data. A CSR user_item_matrix means sparse mode.
+        """
+        model = cls.__new__(cls)
+        model.ratings_df = None
+        model.similarity_type = similarity_type
+        model.sparse = sp.issparse(user_item_matrix)
+        model.dtype = user_item_matrix.dtype
+        model.memory_budget = MEMORY_BUDGET
+        model.user_index = user_index if isinstance(user_index, IdMapper) else IdMapper.from_ids(user_index)
+        model.item_index = item_index if isinstance(item_index, IdMapper) else IdMapper.from_ids(item_index)
+        model._values = None
+        if model.sparse:
+            model.user_item_matrix = user_item_matrix
+        else:
+            model.user_item_matrix = pd.DataFrame(
+                user_item_matrix, index=model.user_index.ids, columns=model.item_index.ids, copy=False
+            )
+        model.similarity_matrix = similarity_matrix
+        model.sim_index = model.user_index if similarity_type == "user" else model.item_index
+        model._item_user = None
+        model._norms = None
+        model._pending = {}
+        return model
+
     def _prepare(self):
-        # Create user-item matrix (rows: users, columns: items)
-        self.user_item_matrix = self.ratings_df.pivot_table(
-            index="user_id", columns="item_id", values="rating"
-        ).fillna(0)
+        started = time.perf_counter()
+        # Sorted ids, like pivot_table, so fresh mappers match the pivoted layout
+        self.user_index.extend(np.unique(self.ratings_df["user_id"]))
+        self.item_index.extend(np.unique(self.ratings_df["item_id"]))
+        self._plan_build()
+
+        self._build_sparse_matrix()
+        if self.sparse:
+            ratings = self.user_item_matrix
+        else:
+            # Dense user-item matrix (rows: users, columns: items), straight from
+            # the CSR build so no float64 pivot table is materialized
+            ratings = self.user_item_matrix.toarray()
+            self._set_dense(ratings)
 
-        # Compute similarity matrix
+        # Compute similarity matrix (stays sparse in sparse mode)
         if self.similarity_type == "user":
-            self.similarity_matrix = cosine_similarity(self.user_item_matrix)
-            self.sim_index = self.user_item_matrix.index
+            self.similarity_matrix = cosine_similarity(ratings, dense_output=not self.sparse)
+            self.sim_index = self.user_index
         else:  # item-based
-            self.similarity_matrix = cosine_similarity(self.user_item_matrix.T)
-            self.sim_index = self.user_item_matrix.columns
+            self.similarity_matrix = cosine_similarity(ratings.T, dense_output=not self.sparse)
+            self.sim_index = self.item_index
+
+        metrics.record_build("collaborative", time.perf_counter() - started,
+                             user_item=ratings, similarity=self.similarity_matrix)
+
+    def _plan_build(self):
+        """
+        Keep the requested dense/sparse layout if its estimated footprint fits
+        the memory budget, else switch (or refuse) before allocating anything.
+        """
+        other = "item_id" if self.similarity_type == "user" else "user_id"
+        co_ratings = int(np.sum(self.ratings_df[other].value_counts().to_numpy(dtype=np.int64) ** 2))
+        estimates = collaborative_footprint(len(self.user_index), len(self.item_index), len(self.ratings_df),
+                                            co_ratings, self.similarity_type, self.dtype)
+        strategy = choose_strategy("collaborative", estimates, "sparse" if self.sparse else "dense",
+                                   self.memory_budget)
+        self.sparse = strategy == "sparse"
+
+    def _build_sparse_matrix(self):
+        """
+        Build the user-item matrix as CSR straight from the rating triples.
+        Rows and columns follow the mappers, and duplicate (user, item) pairs
+        are averaged, so both modes see the same ratings.
+        """
+        user_codes = self.user_index.encode(self.ratings_df["user_id"])
+        item_codes = self.item_index.encode(self.ratings_df["item_id"])
+
+        shape = (len(self.user_index), len(self.item_index))
+        ratings = self.ratings_df["rating"].to_numpy(dtype=self.dtype)
+        totals = sp.csr_matrix((ratings, (user_codes, item_codes)), shape=shape)
+        counts = sp.csr_matrix((np.ones_like(ratings), (user_codes, item_codes)), shape=shape)
+
+        # Both matrices share the same sparsity structure after summing duplicates
+        totals.data /= counts.data
+        totals.eliminate_zeros()
+        self.user_item_matrix = totals
+
+    # -------------------------------
+    # Incremental updates
+    # -------------------------------
+
+    def apply_ratings(self, delta_df: pd.DataFrame):
+        """
+        Apply new or changed ratings [user_id, item_id, rating] without a full rebuild.
+        Similarities are recomputed only for the touched users (user-based) or
+        items (item-based), using maintained norms, and written to their rows
+        and the symmetric column entries. Unknown ids are appended after the
+        existing ones. A rating of 0 removes the entry.
+
+        Dense mode assigns in place. Sparse mode keeps the changes as small CSR
+        corrections next to the rating, item-major and similarity matrices
+        (reads add them to the rows they fetch) and sums them in once they
+        reach MERGE_FRACTION of a matrix, so an update costs
+        O(touched rows x neighbors) plus the size of the pending correction.
+        """
+        delta_df = delta_df.drop_duplicates(["user_id", "item_id"], keep="last")
+        if delta_df.empty:
+            return
+        self._append_ids(delta_df["user_id"].unique(), delta_df["item_id"].unique())
+
+        users = self.user_index.encode(delta_df["user_id"])
+        items = self.item_index.encode(delta_df["item_id"])
+        ratings = delta_df["rating"].to_numpy(dtype=self.dtype)
+        if self.sparse:
+            self._apply_sparse(users, items, ratings)
+        else:
+            self._apply_dense(users, items, ratings)
+
+    def merge_updates(self):
+        """
+        Sum the pending sparse corrections into user_item_matrix and
+        similarity_matrix, e.g. before they are saved or read directly.
+        """
+        for name, pending in self._pending.items():
+            setattr(self, name, _merged(getattr(self, name), pending))
+        self._pending.clear()
+
+    def _append_ids(self, user_ids: np.ndarray, item_ids: np.ndarray):
+        self.user_index.extend(user_ids)
+        self.item_index.extend(item_ids)
+        n_users, n_items = self.user_item_matrix.shape
+        if (n_users, n_items) == (len(self.user_index), len(self.item_index)):
+            return
+
+        self.sim_index = self.user_index if self.similarity_type == "user" else self.item_index
+        n_sim = len(self.sim_index)
+        if self.sparse:
+            # Appending empty rows/columns only touches the CSR shape and indptr
+            self.user_item_matrix.resize((len(self.user_index), len(self.item_index)))
+            self.similarity_matrix.resize((n_sim, n_sim))
+            if self._item_user is not None:
+                self._item_user.resize((len(self.item_index), len(self.user_index)))
+            for name, pending in self._pending.items():
+                pending.resize(getattr(self, name).shape)
+            if self._norms is not None:
+                self._norms = np.pad(self._norms, (0, n_sim - len(self._norms)))
+        else:
+            grow = (len(self.user_index) - n_users, len(self.item_index) - n_items)
+            self._set_dense(np.pad(self.user_item_matrix.values, ((0, grow[0]), (0, grow[1]))))
+            grow = n_sim - self.similarity_matrix.shape[0]
+            self.similarity_matrix = np.pad(self.similarity_matrix, ((0, grow), (0, grow)))
+
+    def _apply_sparse(self, users: np.ndarray, items: np.ndarray, ratings: np.ndarray):
+        if self._norms is None:
+            # Item-major copy of the ratings and similarity norms, built once
+            self.merge_updates()
+            base = self.user_item_matrix if self.similarity_type == "user" else self._item_ratings()
+            self._norms = np.sqrt(np.asarray(base.multiply(base).sum(axis=1)).ravel())
+        self._item_ratings()
+
+        # Rating correction: new minus current value at the delta entries only
+        current = self._entries(users, items)
+        change = sp.csr_matrix((ratings - current, (users, items)), shape=self.user_item_matrix.shape)
+        self._correct("user_item_matrix", change)
+        self._correct("_item_user", change.T.tocsr())
+
+        if self.similarity_type == "user":
+            touched = np.unique(users)
+            touched_rows, others = self._rating_rows(touched), "_item_user"
+        else:
+            touched = np.unique(items)
+            touched_rows, others = self._item_rows(touched), "user_item_matrix"
+
+        # Cosine of the touched rows against everything: the product only reads
+        # the rows of the entries the touched rows have
+        self._norms[touched] = np.sqrt(np.asarray(touched_rows.multiply(touched_rows).sum(axis=1)).ravel())
+        inverse_norms = np.divide(1.0, self._norms, out=np.zeros_like(self._norms), where=self._norms > 0)
+        block = sp.diags(inverse_norms[touched]) @ self._times(touched_rows, others) @ sp.diags(inverse_norms)
+
+        # Symmetric correction: the touched rows, mirrored into the touched
+        # columns of every other row
+        change = sp.csr_matrix(block - self._similarity_rows(touched)).tocoo()
+        rows, cols = touched[change.row], change.col
+        mirror = ~np.isin(cols, touched)
+        change = sp.csr_matrix(
+            (np.concatenate([change.data, change.data[mirror]]),
+             (np.concatenate([rows, cols[mirror]]), np.concatenate([cols, rows[mirror]]))),
+            shape=self.similarity_matrix.shape,
+        )
+        self._correct("similarity_matrix", change)
+
+    def stored_ratings(self, user_ids, item_ids) -> np.ndarray:
+        """
+        Current rating of each (user_id, item_id) pair, 0 where there is none
+        (e.g. to tell new ratings from edits before apply_ratings).
+        """
+        n_users, n_items = self.user_item_matrix.shape
+        users = self.user_index.encode(user_ids, limit=n_users)
+        items = self.item_index.encode(item_ids, limit=n_items)
+        known = (users >= 0) & (items >= 0)
+        ratings = np.zeros(len(users), dtype=self.dtype)
+        if known.any():
+            ratings[known] = self._entries(users[known], items[known])
+        return ratings
+
+    def _entries(self, users: np.ndarray, items: np.ndarray) -> np.ndarray:
+        """
+        Rating matrix entries at (users[k], items[k]), pending corrections included.
+        """
+        if not self.sparse:
+            return self.user_item_matrix.values[users, items]
+        entries = np.asarray(self.user_item_matrix[users, items]).ravel()
+        pending = self._pending.get("user_item_matrix")
+        if pending is not None:
+            entries = entries + np.asarray(pending[users, items]).ravel()
+        return entries
+
+    def _correct(self, name: str, change: sp.csr_matrix):
+        """
+        Add a correction to the pending one of a sparse matrix attribute,
+        summing them into the matrix once they reach MERGE_FRACTION of it.
+        """
+        pending = self._pending.get(name)
+        pending = change if pending is None else pending + change
+        matrix = getattr(self, name)
+        if pending.nnz > MERGE_FRACTION * matrix.nnz:
+            setattr(self, name, _merged(matrix, pending))
+            self._pending.pop(name, None)
+        else:
+            self._pending[name] = pending
+
+    def _apply_dense(self, users: np.ndarray, items: np.ndarray, ratings: np.ndarray):
+        values = self._values
+        if values is None or not values.flags.writeable:
+            # Private writable copy of loaded (e.g. memory-mapped) ratings, taken once
+            values = np.array(self.user_item_matrix.values)
+            self._set_dense(values)
+        values[users, items] = ratings
+
+        if self.similarity_type == "user":
+            touched, matrix = np.unique(users), values
+        else:
+            touched, matrix = np.unique(items), values.T
+        block = cosine_similarity(matrix[touched], matrix)
+
+        if not self.similarity_matrix.flags.writeable:
+            self.similarity_matrix = np.array(self.similarity_matrix)
+        self.similarity_matrix[touched, :] = block
+        self.similarity_matrix[:, touched] = block.T
+
+    def _set_dense(self, values: np.ndarray):
+        """
+        Wrap a dense rating array as user_item_matrix, keeping the array so
+        updates can write to it in place.
+        """
+        self._values = values
+        self.user_item_matrix = pd.DataFrame(
+            values, index=self.user_index.ids, columns=self.item_index.ids, copy=False
+        )
+
+    def _ratings_values(self):
+        """
+        Raw rating matrix: ndarray in dense mode, CSR in sparse mode
+        (pending corrections are merged first).
+        """
+        if not self.sparse:
+            return self.user_item_matrix.values
+        self.merge_updates()
+        return self.user_item_matrix
+
+    def _item_ratings(self):
+        """
+        Item-major ratings (items x users): a transposed view in dense mode,
+        a CSR copy built once (and kept updated) in sparse mode.
+        """
+        if not self.sparse:
+            return self.user_item_matrix.values.T
+        if self._item_user is None:
+            self.merge_updates()
+            self._item_user = self.user_item_matrix.T.tocsr()
+        return self._item_user
+
+    def _rating_rows(self, user_rows: np.ndarray):
+        """
+        Rating rows of some users: ndarray in dense mode, CSR in sparse mode.
+        """
+        if not self.sparse:
+            return self.user_item_matrix.values[user_rows]
+        return self._overlay_rows("user_item_matrix", user_rows)
+
+    def _item_rows(self, item_cols: np.ndarray):
+        """
+        Rating columns of some items, as rows (items x users).
+        """
+        if not self.sparse:
+            return self.user_item_matrix.values.T[item_cols]
+        self._item_ratings()
+        return self._overlay_rows("_item_user", item_cols)
+
+    def _similarity_rows(self, rows: np.ndarray):
+        """
+        Similarity rows of some users (user-based) or items (item-based).
+        """
+        if not self.sparse:
+            return self.similarity_matrix[rows]
+        return self._overlay_rows("similarity_matrix", rows)
+
+    def _overlay_rows(self, name: str, rows: np.ndarray) -> sp.csr_matrix:
+        block = getattr(self, name)[rows]
+        pending = self._pending.get(name)
+        return block if pending is None else _merged(block, pending[rows])
+
+    def _times(self, left, name: str):
+        """
+        left @ a matrix attribute ("user_item_matrix", "_item_user" or
+        "similarity_matrix"), pending correction included.
+        """
+        if name == "user_item_matrix" and not self.sparse:
+            return left @ self.user_item_matrix.values
+        product = left @ getattr(self, name)
+        pending = self._pending.get(name)
+        return product if pending is None else product + left @ pending
+
+    def _user_ratings(self, user_idx: int) -> np.ndarray:
+        """
+        Dense rating vector of a user over all items.
+        """
+        if self.sparse:
+            return self._rating_rows([user_idx]).toarray().ravel()
+        return self.user_item_matrix.values[user_idx]
+
+    def _similarity_row(self, idx: int) -> np.ndarray:
+        """
+        Dense similarity vector of a user (user-based) or item (item-based).
+        """
+        if self.sparse:
+            return self._similarity_rows([idx]).toarray().ravel()
+        return self.similarity_matrix[idx]
 
-    def recommend_for_user(self, user_id: int, top_n: int = 10) -> list:
+    def user_rows(self, user_ids) -> np.ndarray:
+        """
+        Rating matrix rows of a batch of users (-1 for users the model has no row for).
+        """
+        return self.user_index.encode(user_ids, limit=self.user_item_matrix.shape[0])
+
+    def _user_row(self, user_id) -> int:
+        return self.user_index.get(user_id, limit=self.user_item_matrix.shape[0])
+
+    def get_rated_items(self, user_id: int) -> list:
+        """
+        Returns the ids of the items a user has rated.
+        """
+        user_idx = self._user_row(user_id)
+        if user_idx < 0:
+            return []
+        user_ratings = self._user_ratings(user_idx)
+        return self.item_index.decode(np.flatnonzero(user_ratings > 0)).tolist()
+
+    def recommend_for_user(self, user_id: int, top_n: int = 10, allowed: np.ndarray = None) -> list:
         """
         Recommend top-N items for a user based on collaborative filtering.
+        allowed: boolean mask of the item columns that may be returned
+            (e.g. AttributeIndex.mask), applied inside the top-N selection
         Returns a list of (item_id, predicted_score).
         """
         if self.similarity_type == "user":
-            return self._user_based_recommend(user_id, top_n)
+            return self._user_based_recommend(user_id, top_n, allowed)
+        else:
+            return self._item_based_recommend(user_id, top_n, allowed)
+
+    def recommend_for_users(self, user_ids: list, top_n: int = 10, allowed: np.ndarray = None) -> list:
+        """
+        Recommend top-N items for a batch of users with one block matrix product.
+        Returns one list of (item_id, predicted_score) per user, in input order.
+        """
+        results = [[] for _ in user_ids]
+        with metrics.timed("cf.lookup"):
+            rows = self.user_rows(user_ids)
+            positions = np.flatnonzero(rows >= 0)
+        if not len(positions):
+            return results
+
+        rows = rows[positions]
+        scores, rated_mask = self.score_users(rows)
+        with metrics.timed("cf.top_n"):
+            for row, (pos, top) in enumerate(zip(positions, top_n_rows(scores, top_n, rated_mask, allowed))):
+                results[pos] = list(zip(self.item_index[top].tolist(), scores[row, top].tolist()))
+        return results
+
+    def score_items(self, user_rows: np.ndarray, items: np.ndarray) -> np.ndarray:
+        """
+        Predicted scores of a block of user rows for the given item columns
+        only (rows x items), e.g. a few hundred retrieval candidates instead
+        of the whole catalog.
+        """
+        with metrics.timed("cf.score"):
+            if self.similarity_type == "user":
+                similarities = self._similarity_rows(user_rows)
+                scores = to_dense(similarities @ self._item_rows(items).T)
+                sim_sums = np.asarray(similarities.sum(axis=1)).ravel()
+                nonzero = sim_sums != 0
+                scores[nonzero] /= sim_sums[nonzero, None]
+                return scores
+            # Only the similarity rows of the block's rated items are read
+            ratings = self.rating_rows(user_rows)
+            rated = np.unique(ratings.indices)
+            return to_dense(ratings[:, rated] @ self._similarity_rows(rated)[:, items])
+
+    def candidate_items(self, user_rows: np.ndarray, limit: int, n_neighbors: int = 50,
+                        allowed: np.ndarray = None) -> list:
+        """
+        Up to limit unrated item columns per user row suggested by its
+        neighborhood: items rated by the n_neighbors most similar users
+        (user-based), or most similar to the user's n_neighbors top-rated
+        items (item-based). The whole block is one sparse product of the
+        neighbor weights, so only those neighbor rows contribute.
+        allowed: boolean mask of the item columns that may be suggested
+        Returns one array of item columns per user row, best first.
+        """
+        user_rows = np.asarray(user_rows)
+        ratings = to_dense(self._rating_rows(user_rows))
+        if self.similarity_type == "user":
+            weights = np.array(to_dense(self._similarity_rows(user_rows)))
+            weights[np.arange(len(user_rows)), user_rows] = 0
+            name = "user_item_matrix"
         else:
-            return self._item_based_recommend(user_id, top_n)
+            weights = np.array(ratings)
+            name = "similarity_matrix"
+        neighbors = np.zeros(weights.shape, dtype=bool)
+        for row, top in enumerate(top_n_rows(weights, n_neighbors, exclude=weights <= 0)):
+            neighbors[row, top] = True
+        scores = to_dense(self._times(sp.csr_matrix(np.where(neighbors, weights, 0)), name))
+        return top_n_rows(scores, limit, exclude=(ratings != 0) | (scores <= 0), allowed=allowed)
+
+    def rating_counts(self, user_rows: np.ndarray) -> np.ndarray:
+        """
+        Number of ratings of each user row (0 for rows < 0).
+        """
+        user_rows = np.asarray(user_rows)
+        counts = np.zeros(len(user_rows), dtype=np.int64)
+        known = user_rows >= 0
+        if self.sparse:
+            counts[known] = np.diff(self._rating_rows(user_rows[known]).indptr)
+        else:
+            counts[known] = np.count_nonzero(self.user_item_matrix.values[user_rows[known]], axis=1)
+        return counts
+
+    def item_counts(self) -> np.ndarray:
+        """
+        Number of ratings of each item column.
+        """
+        if self.sparse:
+            self._item_ratings()
+            item_user = self._overlay_rows("_item_user", slice(None))
+            return np.diff(item_user.indptr)
+        return np.count_nonzero(self.user_item_matrix.values, axis=0)
+
+    def rating_rows(self, user_rows: np.ndarray) -> sp.csr_matrix:
+        """
+        Ratings of a block of user rows as CSR (only the rated entries are stored).
+        """
+        return sp.csr_matrix(self._rating_rows(user_rows))
+
+    def score_users(self, user_rows: np.ndarray):
+        """
+        Predicted scores for a block of user rows.
+        Returns (scores, rated_mask), both shaped (len(user_rows), n_items).
+        """
+        ratings = self._rating_rows(user_rows)
+        with metrics.timed("cf.score"):
+            if self.similarity_type == "user":
+                similarities = self._similarity_rows(user_rows)
+                scores = to_dense(self._times(similarities, "user_item_matrix"))
+                sim_sums = np.asarray(similarities.sum(axis=1)).ravel()
+                nonzero = sim_sums != 0
+                scores[nonzero] /= sim_sums[nonzero, None]
+            else:
+                scores = to_dense(self._times(ratings, "similarity_matrix"))
 
-    def _user_based_recommend(self, user_id: int, top_n: int = 10):
-        if user_id not in self.user_item_matrix.index:
+        with metrics.timed("cf.mask"):
+            rated_mask = to_dense(ratings) != 0
+        return scores, rated_mask
+
+    def _user_based_recommend(self, user_id: int, top_n: int = 10, allowed: np.ndarray = None):
+        with metrics.timed("cf.lookup"):
+            user_idx = self._user_row(user_id)
+        if user_idx < 0:
             return []
 
-        user_idx = self.user_item_matrix.index.get_loc(user_id)
-        similarity_scores = self.similarity_matrix[user_idx]
+        with metrics.timed("cf.score"):
+            similarity_scores = self._similarity_row(user_idx)
 
-        # Compute weighted sum of other users' ratings
-        weighted_ratings = np.dot(similarity_scores, self.user_item_matrix.values)
-        sim_sum = similarity_scores.sum()
+            # Compute weighted sum of other users' ratings
+            weighted_ratings = np.asarray(self._times(similarity_scores, "user_item_matrix")).ravel()
+            sim_sum = similarity_scores.sum()
 
-        predicted_scores = weighted_ratings / sim_sum if sim_sum != 0 else weighted_ratings
+            predicted_scores = weighted_ratings / sim_sum if sim_sum != 0 else weighted_ratings
 
         # Recommend items not already rated by the user
-        user_rated_items = self.user_item_matrix.loc[user_id]
-        unrated_items = user_rated_items[user_rated_items == 0]
+        with metrics.timed("cf.mask"):
+            rated_mask = self._user_ratings(user_idx) != 0
+        return self._top_items(predicted_scores, top_n, rated_mask, allowed)
+
+    def _item_based_recommend(self, user_id: int, top_n: int = 10, allowed: np.ndarray = None):
+        with metrics.timed("cf.lookup"):
+            user_idx = self._user_row(user_id)
+        if user_idx < 0:
+            return []
 
-        recommendations = {
-            item_id: predicted_scores[self.user_item_matrix.columns.get_loc(item_id)]
-            for item_id in unrated_items.index
-        }
+        with metrics.timed("cf.score"):
+            user_ratings = self._user_ratings(user_idx)
+            rated = np.flatnonzero(user_ratings)
 
-        # Sort and return top-N
-        return sorted(recommendations.items(), key=lambda x: x[1], reverse=True)[:top_n]
+            # Rating-weighted sum of the similarity rows of every rated item
+            scores = np.asarray(self._similarity_rows(rated).T @ user_ratings[rated]).ravel()
+        with metrics.timed("cf.mask"):
+            rated_mask = user_ratings != 0
+        return self._top_items(scores, top_n, rated_mask, allowed)
+
+    def _top_items(self, scores: np.ndarray, top_n: int, rated_mask: np.ndarray, allowed: np.ndarray = None) -> list:
+        """
+        Top-N unrated (and allowed) items as (item_id, score) pairs of plain Python values.
+        """
+        with metrics.timed("cf.top_n"):
+            top = top_n_indices(scores, top_n, exclude=rated_mask, allowed=allowed)
+            return list(zip(self.item_index[top].tolist(), scores[top].tolist()))
 
-    def _item_based_recommend(self, user_id: int, top_n: int = 10):
-        if user_id not in self.user_item_matrix.index:
-            return []
 
-        user_ratings = self.user_item_matrix.loc[user_id]
-        scored_items = {}
-
-        for item_id, rating in user_ratings.items():
-            if rating == 0:
-                continue
-            item_idx = self.user_item_matrix.columns.get_loc(item_id)
-            similarity_scores = self.similarity_matrix[item_idx]
-            for i, score in enumerate(similarity_scores):
-                target_item = self.user_item_matrix.columns[i]
-                if user_ratings[target_item] == 0:
-                    scored_items[target_item] = scored_items.get(target_item, 0) + rating * score
-
-        # Sort and return top-N
-        sorted_scores = sorted(scored_items.items(), key=lambda x: x[1], reverse=True)
-        return sorted_scores[:top_n]
+def _merged(matrix: sp.csr_matrix, pending: sp.csr_matrix) -> sp.csr_matrix:
+    """
+    CSR sum of a matrix and its correction; entries cancelled to 0 are dropped.
+    """
+    merged = sp.csr_matrix(matrix + pending)
+    merged.eliminate_zeros()
+    return merged
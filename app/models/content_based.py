@@ -1,52 +1,362 @@
 # app/models/content_based.py
 
+import time
+import numpy as np
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy import sparse
 from sklearn.metrics.pairwise import cosine_similarity
 
+from app import metrics
+from app.data.id_mapper import IdMapper
+from app.models.ann import IVFIndex
+from app.data.hashed_tfidf import HashedTfidf
+from app.models.memory import choose_strategy, content_footprint, float_dtype, knn_block_bytes
+from app.models.similarity import build_knn_graph, neighbors_of, save_neighbor_graph, update_knn_graph
+from app.models.utils import replace_rows, to_dense, top_n_indices, top_n_rows
+from app.config import (
+    CONTENT_FEATURES,
+    CONTENT_NUM_NEIGHBORS,
+    CONTENT_VECTORIZE_JOBS,
+    MEMORY_BUDGET,
+    PRECISION,
+    SIMILARITY_MEMORY_LIMIT,
+    SIMILARITY_N_JOBS
+)
+
 class ContentBasedFiltering:
-    def __init__(self, item_df: pd.DataFrame, text_column: str = "description"):
+    def __init__(self, item_df: pd.DataFrame, text_column: str = "description",
+                 num_neighbors: int = None, neighbor_graph=None, item_mapper: IdMapper = None,
+                 features: str = CONTENT_FEATURES, hasher: HashedTfidf = None, dtype=PRECISION,
+                 memory_budget: int = MEMORY_BUDGET, n_jobs: int = SIMILARITY_N_JOBS,
+                 memory_limit: int = SIMILARITY_MEMORY_LIMIT, block_dir: str = None):
         """
         item_df: DataFrame with at least [item_id, <text_column>]
         text_column: column to base similarity on (e.g., title, tags, genres, or description)
+        num_neighbors: keep only the K most similar items per item as a sparse
+            kNN graph instead of the full N x N similarity matrix
+        neighbor_graph: precomputed kNN graph (e.g. from load_neighbor_graph)
+        item_mapper: IdMapper shared with other models; TF-IDF rows follow its
+            indices, with empty rows for ids that have no item_df entry
+        features: "tfidf" fits a vocabulary over the catalog; "hashed" uses
+            HashedTfidf, so add_items can vectorize new items on their own
+        hasher: HashedTfidf to continue from in hashed mode (a new one by default)
+        dtype: float dtype of the TF-IDF and similarity matrices
+        memory_budget: peak build bytes; a dense similarity matrix estimated
+            over it becomes a blockwise kNN graph or is refused (see app.models.memory)
+        n_jobs, memory_limit, block_dir: threads, bytes of dense blocks in flight
+            and optional on-disk block directory of the kNN build (see build_knn_graph)
         """
         self.item_df = item_df
         self.text_column = text_column
+        self.num_neighbors = num_neighbors
+        self.features = features
+        self.hasher = hasher
+        self.dtype = float_dtype(dtype)
+        self.memory_budget = memory_budget
+        self.n_jobs = n_jobs
+        self.memory_limit = memory_limit
+        self.block_dir = block_dir
+        self.vectorizer = None
+        self.term_counts = None
         self.tfidf_matrix = None
         self.similarity_matrix = None
-        self.item_index_map = {}
+        self.neighbor_graph = neighbor_graph
+        self.ann_index = None
+        self.item_index = item_mapper if item_mapper is not None else IdMapper()
         self._prepare()
 
+    @classmethod
+    def from_arrays(cls, item_ids, tfidf_matrix, similarity_matrix=None, neighbor_graph=None,
+                    text_column: str = "description", hasher: HashedTfidf = None,
+                    term_counts=None) -> "ContentBasedFiltering":
+        """
+        Rebuild a fitted model from stored arrays (e.g. a memory-mapped bundle)
+        without refitting the vectorizer. Pass either similarity_matrix or neighbor_graph.
+        hasher, term_counts: saved HashedTfidf state and raw counts of a hashed
+            model, so add_items and rebuild keep working after a restore
+        """
+        model = cls.__new__(cls)
+        model.item_df = None
+        model.text_column = text_column
+        model.num_neighbors = None if neighbor_graph is None else int(np.diff(neighbor_graph.indptr).max(initial=0))
+        model.features = "tfidf" if hasher is None else "hashed"
+        model.hasher = hasher
+        model.dtype = tfidf_matrix.dtype
+        model.memory_budget = MEMORY_BUDGET
+        model.n_jobs = SIMILARITY_N_JOBS
+        model.memory_limit = SIMILARITY_MEMORY_LIMIT
+        model.block_dir = None
+        model.vectorizer = None
+        model.term_counts = term_counts
+        model.tfidf_matrix = tfidf_matrix
+        model.similarity_matrix = similarity_matrix
+        model.neighbor_graph = neighbor_graph
+        model.ann_index = None
+        model.item_index = item_ids if isinstance(item_ids, IdMapper) else IdMapper.from_ids(item_ids)
+        return model
+
     def _prepare(self):
+        started = time.perf_counter()
         # Fill NA with empty string to prevent TF-IDF errors
         self.item_df[self.text_column] = self.item_df[self.text_column].fillna("")
 
-        # Build TF-IDF matrix
-        vectorizer = TfidfVectorizer(stop_words="english")
-        self.tfidf_matrix = vectorizer.fit_transform(self.item_df[self.text_column])
+        # Build TF-IDF matrix (raw hashed counts in hashed mode, weighted below)
+        if self.features == "hashed":
+            if self.hasher is None:
+                self.hasher = HashedTfidf(n_jobs=CONTENT_VECTORIZE_JOBS, dtype=self.dtype)
+            matrix = self.hasher.term_counts(self.item_df[self.text_column])
+        else:
+            self.vectorizer = TfidfVectorizer(stop_words="english", dtype=self.dtype.type)
+            matrix = self.vectorizer.fit_transform(self.item_df[self.text_column])
+
+        # Map item_id to TF-IDF row, and back
+        rows = self.item_index.extend(self.item_df["item_id"])
+        if len(self.item_index) != len(rows) or not np.array_equal(rows, np.arange(len(rows))):
+            # Place rows at the shared mapper's indices (the last duplicate id wins)
+            keep = np.zeros(len(rows), dtype=bool)
+            keep[len(rows) - 1 - np.unique(rows[::-1], return_index=True)[1]] = True
+            n_kept = int(keep.sum())
+            placement = sparse.csr_matrix(
+                (np.ones(n_kept, dtype=matrix.dtype), (rows[keep], np.arange(n_kept))),
+                shape=(len(self.item_index), n_kept)
+            )
+            matrix = placement @ matrix[keep]
+
+        if self.features == "hashed":
+            self.term_counts = sparse.csr_matrix(matrix)
+            self.hasher.add_documents(self.term_counts)
+            self.tfidf_matrix = self.hasher.weight(self.term_counts)
+        else:
+            self.tfidf_matrix = matrix
+
+        if self.neighbor_graph is None:
+            self._build_similarities()
+
+        metrics.record_build("content_based", time.perf_counter() - started, tfidf=self.tfidf_matrix,
+                             similarity=self.similarity_matrix, neighbors=self.neighbor_graph)
+
+    def _build_similarities(self):
+        n_items = self.tfidf_matrix.shape[0]
+        estimates = content_footprint(n_items, self.tfidf_matrix.nnz,
+                                      self.num_neighbors or CONTENT_NUM_NEIGHBORS, self.dtype)
+        strategy = choose_strategy("content_based", estimates, "dense" if self.num_neighbors is None else "knn",
+                                   self.memory_budget)
+
+        if strategy == "knn":
+            self.num_neighbors = self.num_neighbors or CONTENT_NUM_NEIGHBORS
+            memory_limit = self.memory_limit
+            if self.memory_budget is not None:
+                # Dense blocks get what the graph and features leave of the budget
+                spare = self.memory_budget - estimates["knn"] + knn_block_bytes(n_items, self.dtype)
+                memory_limit = min(memory_limit, spare)
+            # Keep only the top-K neighbors per item, built blockwise
+            self.neighbor_graph = build_knn_graph(
+                self.tfidf_matrix, self.num_neighbors,
+                n_jobs=self.n_jobs, memory_limit=memory_limit, block_dir=self.block_dir,
+            )
+        else:
+            # Compute cosine similarity between all items
+            self.similarity_matrix = cosine_similarity(self.tfidf_matrix)
+
+    def add_items(self, item_df: pd.DataFrame):
+        """
+        Add new items, or replace the text of existing ones, without refitting
+        (hashed mode only). Just these rows are vectorized, and only their
+        neighbor lists or similarity rows are recomputed. Existing rows keep
+        the IDF weights they were built with until rebuild().
+        """
+        if self.hasher is None:
+            raise ValueError("add_items needs features='hashed'; rebuild the model instead.")
+        started = time.perf_counter()
+        item_df = item_df.drop_duplicates("item_id", keep="last")
+        counts = self.hasher.term_counts(item_df[self.text_column].fillna(""))
+
+        n_old = self.tfidf_matrix.shape[0]
+        rows = self.item_index.extend(item_df["item_id"])
+        order = np.argsort(rows)
+        rows, counts = rows[order], counts[order]
+
+        # Grow to the (possibly shared) mapper, then swap in the new rows
+        n_items = len(self.item_index)
+        self.term_counts.resize((n_items, self.term_counts.shape[1]))
+        self.tfidf_matrix = sparse.csr_matrix(self.tfidf_matrix)
+        self.tfidf_matrix.resize((n_items, self.tfidf_matrix.shape[1]))
+        self.hasher.remove_documents(self.term_counts[rows[rows < n_old]])
+        self.hasher.add_documents(counts)
+        self.term_counts = replace_rows(self.term_counts, rows, counts)
+        self.tfidf_matrix = replace_rows(self.tfidf_matrix, rows, self.hasher.weight(counts))
+
+        if self.neighbor_graph is not None:
+            k = self.num_neighbors or int(np.diff(self.neighbor_graph.indptr).max(initial=0))
+            self.neighbor_graph = update_knn_graph(self.neighbor_graph, self.tfidf_matrix, rows, k)
+        elif self.similarity_matrix is not None:
+            block = cosine_similarity(self.tfidf_matrix[rows], self.tfidf_matrix)
+            grow = n_items - self.similarity_matrix.shape[0]
+            self.similarity_matrix = np.pad(self.similarity_matrix, ((0, grow), (0, grow)))
+            self.similarity_matrix[rows, :] = block
+            self.similarity_matrix[:, rows] = block.T
+        if self.ann_index is not None:
+            self.ann_index.update(self.tfidf_matrix[rows], rows)
+
+        if self.item_df is not None:
+            replaced = self.item_df["item_id"].isin(item_df["item_id"])
+            self.item_df = pd.concat([self.item_df[~replaced], item_df], ignore_index=True)
+        metrics.record_build("content_based.add_items", time.perf_counter() - started,
+                             tfidf=self.tfidf_matrix, neighbors=self.neighbor_graph)
+
+    def rebuild(self):
+        """
+        Periodic full refresh in hashed mode: re-weight every row with the
+        current IDF and rebuild the similarities (and the ANN index, if any).
+        """
+        if self.hasher is None:
+            raise ValueError("rebuild needs features='hashed'; refit the model instead.")
+        started = time.perf_counter()
+        if self.neighbor_graph is not None and self.num_neighbors is None:
+            self.num_neighbors = int(np.diff(self.neighbor_graph.indptr).max(initial=0))
+        self.tfidf_matrix = self.hasher.weight(self.term_counts)
+        self.neighbor_graph = self.similarity_matrix = None
+        self._build_similarities()
+        if self.ann_index is not None:
+            self.build_ann_index(self.ann_index.n_lists, self.ann_index.n_probe)
+        metrics.record_build("content_based", time.perf_counter() - started, tfidf=self.tfidf_matrix,
+                             similarity=self.similarity_matrix, neighbors=self.neighbor_graph)
+
+    def build_ann_index(self, n_lists: int = 100, n_probe: int = 8) -> IVFIndex:
+        """
+        Build an IVF index over the TF-IDF rows; recommend_similar_items then
+        searches it instead of reading the similarity matrix.
+        """
+        self.ann_index = IVFIndex(n_lists=n_lists, n_probe=n_probe, metric="cosine").build(self.tfidf_matrix)
+        return self.ann_index
 
-        # Compute cosine similarity between all items
-        self.similarity_matrix = cosine_similarity(self.tfidf_matrix)
+    def save_ann_index(self, path: str):
+        """
+        Persist the ANN index with the ids of its rows (see load_ann_index).
+        """
+        if self.ann_index is None:
+            raise ValueError("No ANN index built; call build_ann_index first.")
+        self.ann_index.save(path, self.item_index[:self.tfidf_matrix.shape[0]])
 
-        # Map item_id to index in similarity matrix
-        self.item_index_map = {
-            item_id: idx for idx, item_id in enumerate(self.item_df["item_id"])
-        }
+    def load_ann_index(self, path: str):
+        """
+        Use an index saved with save_ann_index if it was built over these TF-IDF
+        rows (same item ids and feature width). Returns it, or None.
+        """
+        index = IVFIndex.load(path, self.item_index[:self.tfidf_matrix.shape[0]])
+        if index is None or index.vectors.shape[1] != self.tfidf_matrix.shape[1]:
+            return None
+        self.ann_index = index
+        return index
 
-    def recommend_similar_items(self, item_id: int, top_n: int = 10) -> list:
+    def save_neighbor_graph(self, path: str):
+        """
+        Persist the kNN graph so serving processes can load it instead of rebuilding.
+        """
+        if self.neighbor_graph is None:
+            raise ValueError("No neighbor graph built; pass num_neighbors to build one.")
+        save_neighbor_graph(self.neighbor_graph, path, self.item_index.ids)
+
+    def score_profiles(self, profiles) -> np.ndarray:
+        """
+        Content scores for a block of item profiles (rows x items, e.g. rated items),
+        computed as one product with the similarity matrix or the kNN graph.
+        """
+        similarities = self.neighbor_graph if self.neighbor_graph is not None else self.similarity_matrix
+        with metrics.timed("cb.score"):
+            return to_dense(profiles @ similarities)
+
+    def score_items(self, profiles, items: np.ndarray) -> np.ndarray:
+        """
+        Content scores of a block of item profiles (rows x profiled items) for
+        the given item rows only: just the similarity rows of the profiled
+        items are read.
+        """
+        profiles = sparse.csr_matrix(profiles)
+        profiled = np.unique(profiles.indices)
+        similarities = self.neighbor_graph if self.neighbor_graph is not None else self.similarity_matrix
+        with metrics.timed("cb.score"):
+            block = similarities[profiled][:, items]
+            return to_dense(profiles[:, profiled] @ block)
+
+    def similar_item_rows(self, item_ids, top_n: int = 10) -> list:
+        """
+        Rows of the top_n content neighbors of a batch of items, best first,
+        one array per item (empty for unknown items). The kNN graph or the
+        similarity matrix is read in one slice for the whole batch.
+        """
+        rows = self.item_index.encode(item_ids, limit=self.tfidf_matrix.shape[0])
+        found = [np.empty(0, dtype=np.int64) for _ in rows]
+        known = np.flatnonzero(rows >= 0)
+        if not len(known):
+            return found
+
+        if self.ann_index is not None:
+            with metrics.timed("cb.ann_search"):
+                for i in known:
+                    found[i] = self.ann_index.search(self.tfidf_matrix[rows[i]], top_n, exclude=[rows[i]])[0]
+        elif self.neighbor_graph is not None:
+            with metrics.timed("cb.neighbors"):
+                block = self.neighbor_graph[rows[known]]
+                for row, i in enumerate(known):
+                    found[i] = neighbors_of(block, row)[0][:top_n]
+        else:
+            with metrics.timed("cb.top_n"):
+                block = self.similarity_matrix[rows[known]]
+                query_mask = np.zeros(block.shape, dtype=bool)
+                query_mask[np.arange(len(known)), rows[known]] = True
+                for i, top in zip(known, top_n_rows(block, top_n, exclude=query_mask)):
+                    found[i] = top
+        return found
+
+    def recommend_similar_items(self, item_id: int, top_n: int = 10, allowed: np.ndarray = None) -> list:
         """
         Recommend similar items based on content.
+        allowed: boolean mask of the item rows that may be returned (e.g.
+            AttributeIndex.mask). The dense matrix applies it inside the top-N
+            selection; ANN and kNN-graph answers are filtered, and if fewer
+            than top_n survive, the allowed rows alone are scored exactly.
         Returns list of (item_id, similarity_score).
         """
-        if item_id not in self.item_index_map:
+        with metrics.timed("cb.lookup"):
+            idx = self.item_index.get(item_id, limit=self.tfidf_matrix.shape[0])
+        if idx < 0:
             return []
 
-        idx = self.item_index_map[item_id]
-        sim_scores = list(enumerate(self.similarity_matrix[idx]))
+        if self.ann_index is not None:
+            with metrics.timed("cb.ann_search"):
+                neighbors, scores = self.ann_index.search(self.tfidf_matrix[idx], top_n, exclude=[idx],
+                                                          allowed=allowed)
+        elif self.neighbor_graph is not None:
+            # Answered straight from the stored neighbor list
+            with metrics.timed("cb.neighbors"):
+                neighbors, scores = neighbors_of(self.neighbor_graph, idx)
+                if allowed is not None:
+                    keep = allowed[neighbors]
+                    neighbors, scores = neighbors[keep], scores[keep]
+                neighbors, scores = neighbors[:top_n], scores[:top_n]
+        else:
+            # Partial top-N selection, excluding the item itself
+            with metrics.timed("cb.mask"):
+                scores = self.similarity_matrix[idx]
+                query_mask = np.zeros(len(scores), dtype=bool)
+                query_mask[idx] = True
+            with metrics.timed("cb.top_n"):
+                neighbors = top_n_indices(scores, top_n, exclude=query_mask, allowed=allowed)
+                scores = scores[neighbors]
 
-        # Sort by similarity score, exclude the item itself
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-        top_matches = [(self.item_df["item_id"].iloc[i], score)
-                       for i, score in sim_scores if self.item_df["item_id"].iloc[i] != item_id]
+        if allowed is not None and len(neighbors) < top_n and self.similarity_matrix is None:
+            neighbors, scores = self._allowed_neighbors(idx, top_n, allowed)
+        return list(zip(self.item_index[neighbors].tolist(), scores.tolist()))
 
-        return top_matches[:top_n]
+    def _allowed_neighbors(self, idx: int, top_n: int, allowed: np.ndarray):
+        """
+        Exact top-N neighbors of one item among the allowed rows only.
+        """
+        with metrics.timed("cb.filtered"):
+            rows = np.flatnonzero(allowed)
+            rows = rows[rows != idx]
+            scores = cosine_similarity(self.tfidf_matrix[idx], self.tfidf_matrix[rows]).ravel()
+            top = top_n_indices(scores, top_n)
+            return rows[top], scores[top]
@@ -0,0 +1,217 @@
+# app/models/evaluation.py
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
+
+from app.data.id_mapper import IdMapper
+from app.models.collaborative import CollaborativeFiltering
+from app.models.content_based import ContentBasedFiltering
+from app.models.hybrid import HybridRecommender
+from app.models.matrix_factorization import MatrixFactorization
+from app.models.utils import to_dense, top_n_rows
+from app.config import CONTENT_NUM_NEIGHBORS, EVAL_BATCH_SIZE, EVAL_RELEVANCE_THRESHOLD, EVAL_TOP_K
+
+
+class ContentProfileRecommender:
+    """
+    User-level scoring for ContentBasedFiltering: a user's training ratings
+    are the item profile, so content models are evaluated like the others.
+    """
+
+    def __init__(self, cb_model: ContentBasedFiltering, ratings_df: pd.DataFrame):
+        self.cb_model = cb_model
+        self.item_index = cb_model.item_index
+        self.user_index, users = IdMapper.fit_encode(ratings_df["user_id"])
+        n_items = cb_model.tfidf_matrix.shape[0]
+        items = cb_model.item_index.encode(ratings_df["item_id"], limit=n_items)
+        known = items >= 0
+        self.ratings = sparse.csr_matrix(
+            (ratings_df["rating"].to_numpy(dtype=cb_model.dtype)[known], (users[known], items[known])),
+            shape=(len(self.user_index), n_items),
+        )
+
+    def user_rows(self, user_ids) -> np.ndarray:
+        return self.user_index.encode(user_ids)
+
+    def score_users(self, user_rows: np.ndarray):
+        profiles = self.ratings[user_rows]
+        return self.cb_model.score_profiles(profiles), to_dense(profiles) != 0
+
+
+# -------------------------------
+# Model builders (train split -> model)
+# -------------------------------
+
+def build_cf_user(train_df: pd.DataFrame, items_df: pd.DataFrame):
+    return CollaborativeFiltering(train_df, similarity_type="user", sparse=True)
+
+
+def build_cf_item(train_df: pd.DataFrame, items_df: pd.DataFrame):
+    return CollaborativeFiltering(train_df, similarity_type="item", sparse=True)
+
+
+def build_mf(train_df: pd.DataFrame, items_df: pd.DataFrame):
+    return MatrixFactorization(train_df)
+
+
+def build_content(train_df: pd.DataFrame, items_df: pd.DataFrame):
+    cb_model = ContentBasedFiltering(items_df.copy(), num_neighbors=CONTENT_NUM_NEIGHBORS)
+    return ContentProfileRecommender(cb_model, train_df)
+
+
+def build_hybrid(train_df: pd.DataFrame, items_df: pd.DataFrame):
+    cb_model = ContentBasedFiltering(items_df.copy(), num_neighbors=CONTENT_NUM_NEIGHBORS)
+    cf_model = CollaborativeFiltering(train_df, similarity_type="user", sparse=True,
+                                      item_mapper=cb_model.item_index)
+    return HybridRecommender(cf_model, cb_model, alpha=0.7)
+
+
+MODEL_BUILDERS = {
+    "cf_user": build_cf_user,
+    "cf_item": build_cf_item,
+    "mf": build_mf,
+    "content": build_content,
+    "hybrid": build_hybrid,
+}
+
+
+# -------------------------------
+# Splits
+# -------------------------------
+
+def kfold_splits(ratings_df: pd.DataFrame, n_folds: int = 5, seed: int = 42) -> list:
+    """
+    Random K-fold split of the rating rows. Returns (train_positions, test_positions) per fold.
+    """
+    folds = np.random.default_rng(seed).permutation(len(ratings_df)) % n_folds
+    return [(np.flatnonzero(folds != fold), np.flatnonzero(folds == fold)) for fold in range(n_folds)]
+
+
+def time_splits(ratings_df: pd.DataFrame, n_splits: int = 3) -> list:
+    """
+    Expanding-window splits on timestamp: split i trains on everything before
+    the i-th cut and tests on the ratings up to the next cut.
+    """
+    timestamps = ratings_df["timestamp"].to_numpy()
+    cuts = np.quantile(timestamps, np.linspace(0, 1, n_splits + 2)[1:])
+    cuts[-1] = np.inf
+    return [
+        (np.flatnonzero(timestamps < start), np.flatnonzero((timestamps >= start) & (timestamps < stop)))
+        for start, stop in zip(cuts[:-1], cuts[1:])
+    ]
+
+
+# -------------------------------
+# Metrics
+# -------------------------------
+
+def evaluate_model(model, test_df: pd.DataFrame, k: int = EVAL_TOP_K,
+                   threshold: float = EVAL_RELEVANCE_THRESHOLD, batch_size: int = EVAL_BATCH_SIZE) -> dict:
+    """
+    Ranking metrics of a model (anything with user_rows / score_users) on a test split.
+    Test ratings >= threshold are the relevant items; users the model cannot
+    score are skipped. All users are scored in batches with one row-wise
+    top-K selection, and hits are found with one vectorized membership test.
+    Returns precision@K, recall@K, NDCG@K, MAP@K and catalog coverage
+    (plus RMSE/MAE for models that predict ratings).
+    """
+    relevant = test_df[test_df["rating"] >= threshold]
+    user_ids = relevant["user_id"].unique()
+    rows = model.user_rows(user_ids)
+    scored = np.flatnonzero(rows >= 0)
+
+    # Top-K positions on the model's item axis, -1 padded
+    top = np.full((len(scored), k), -1, dtype=np.int64)
+    item_axis = None
+    for start in range(0, len(scored), batch_size):
+        scores, rated_mask = model.score_users(rows[scored[start:start + batch_size]])
+        if item_axis is None:
+            item_axis = _item_axis(model, scores.shape[1])
+        for offset, positions in enumerate(top_n_rows(scores, k, rated_mask)):
+            top[start + offset, :len(positions)] = positions
+
+    result = {"users": len(scored), "skipped_users": len(user_ids) - len(scored)}
+    if item_axis is None:
+        return result
+
+    # Relevant (user, item) pairs as codes on the item axis; unknown items still count for recall
+    user_pos = IdMapper.from_ids(user_ids[scored]).encode(relevant["user_id"])
+    item_pos = IdMapper.from_ids(item_axis).encode(relevant["item_id"])
+    in_eval = user_pos >= 0
+    n_relevant = np.bincount(user_pos[in_eval], minlength=len(scored))
+    known = in_eval & (item_pos >= 0)
+    relevant_codes = np.unique(user_pos[known] * len(item_axis) + item_pos[known])
+
+    codes = np.arange(len(scored))[:, None] * len(item_axis) + top
+    hits = np.isin(codes, relevant_codes) & (top >= 0)
+    discounts = 1 / np.log2(np.arange(2, k + 2))
+    ideal = np.cumsum(discounts)[np.minimum(n_relevant, k) - 1]
+    precision_at = np.cumsum(hits, axis=1) / np.arange(1, k + 1)
+
+    result.update({
+        f"precision@{k}": float(np.mean(hits.sum(axis=1) / k)),
+        f"recall@{k}": float(np.mean(hits.sum(axis=1) / n_relevant)),
+        f"ndcg@{k}": float(np.mean((hits * discounts).sum(axis=1) / ideal)),
+        f"map@{k}": float(np.mean((precision_at * hits).sum(axis=1) / np.minimum(n_relevant, k))),
+        "coverage": len(np.unique(top[top >= 0])) / len(item_axis),
+    })
+
+    if hasattr(model, "predict_ratings"):
+        errors = test_df["rating"].to_numpy() - model.predict_ratings(test_df["user_id"], test_df["item_id"])
+        result.update(rmse=float(np.sqrt(np.mean(errors ** 2))), mae=float(np.mean(np.abs(errors))))
+    return result
+
+
+def _item_axis(model, n_items: int) -> np.ndarray:
+    """
+    Item ids of the score columns.
+    """
+    if isinstance(model, HybridRecommender):
+        return np.asarray(model.item_ids)
+    return np.asarray(model.item_index[:n_items])
+
+
+# -------------------------------
+# Cross-validation
+# -------------------------------
+
+# Data shared with each worker process by the pool initializer
+_ratings_df = None
+_items_df = None
+
+
+def _init_worker(ratings_df: pd.DataFrame, items_df: pd.DataFrame):
+    global _ratings_df, _items_df
+    _ratings_df, _items_df = ratings_df, items_df
+
+
+def _evaluate_split(model_name: str, split: int, train_positions: np.ndarray, test_positions: np.ndarray,
+                    k: int, threshold: float) -> dict:
+    """
+    Train one model on one split and evaluate it; runs inside a worker process.
+    """
+    train_df = _ratings_df.iloc[train_positions]
+    test_df = _ratings_df.iloc[test_positions]
+    model = MODEL_BUILDERS[model_name](train_df, _items_df)
+    return {"model": model_name, "split": split, **evaluate_model(model, test_df, k, threshold)}
+
+
+def cross_validate(model_names: list, ratings_df: pd.DataFrame, items_df: pd.DataFrame, splits: list,
+                   k: int = EVAL_TOP_K, threshold: float = EVAL_RELEVANCE_THRESHOLD,
+                   workers: int = 1) -> pd.DataFrame:
+    """
+    Evaluate every (model, split) pair, in parallel across worker processes.
+    Returns one row of metrics per pair.
+    """
+    tasks = [(name, split, train, test) for name in model_names for split, (train, test) in enumerate(splits)]
+    if workers == 1:
+        _init_worker(ratings_df, items_df)
+        rows = [_evaluate_split(*task, k, threshold) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(ratings_df, items_df)) as pool:
+            futures = [pool.submit(_evaluate_split, *task, k, threshold) for task in tasks]
+            rows = [future.result() for future in futures]
+    return pd.DataFrame(rows)
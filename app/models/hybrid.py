@@ -1,8 +1,13 @@
 # app/models/hybrid.py
 
+import time
 from typing import List, Tuple
+import numpy as np
+from scipy import sparse
+from app import metrics
 from app.models.collaborative import CollaborativeFiltering
 from app.models.content_based import ContentBasedFiltering
+from app.models.utils import top_n_indices, top_n_rows
 
 class HybridRecommender:
     def __init__(self, cf_model: CollaborativeFiltering, cb_model: ContentBasedFiltering, alpha: float = 0.5):
@@ -14,44 +19,159 @@ class HybridRecommender:
         self.cf_model = cf_model
         self.cb_model = cb_model
         self.alpha = alpha
+        self.item_ids = None
+        # Blended scores keep the models' precision (float32 unless either is float64)
+        self.dtype = np.result_type(cf_model.dtype, cb_model.dtype)
+        self.align_items()
 
-    def recommend_for_user(self, user_id: int, top_n: int = 10) -> List[Tuple[int, float]]:
+    def align_items(self):
+        """
+        Map CF columns and CB rows onto one shared item axis (CF items first).
+        Call again after either model gains items.
+        """
+        started = time.perf_counter()
+        n_cf = self.cf_model.user_item_matrix.shape[1]
+        n_cb = self.cb_model.tfidf_matrix.shape[0]
+        cf_items = self.cf_model.item_index[:n_cf]
+        cb_items = self.cb_model.item_index[:n_cb]
+
+        # Both models read the same mapper when it is shared, so this is just bounds checks
+        cb_in_cf = self.cf_model.item_index.encode(cb_items, limit=n_cf)
+        extra = cb_in_cf < 0
+        self.item_ids = np.concatenate([cf_items, cb_items[extra]])
+
+        self._cb_positions = cb_in_cf
+        self._cb_positions[extra] = n_cf + np.arange(int(extra.sum()))
+        self._cf_to_cb = self.cb_model.item_index.encode(cf_items, limit=n_cb)
+        self._axis_to_cb = np.full(len(self.item_ids), -1, dtype=np.int64)
+        self._axis_to_cb[self._cb_positions] = np.arange(n_cb)
+        metrics.record_build("hybrid", time.perf_counter() - started)
+
+    def recommend_for_user(self, user_id: int, top_n: int = 10,
+                           allowed: np.ndarray = None) -> List[Tuple[int, float]]:
         """
         Combines CF and CBF recommendations for a user.
+        Both score vectors come from one product each, are blended as arrays,
+        and a single partial top-N selection picks the result.
+        allowed: boolean mask on item_ids of the items that may be returned
+            (e.g. AttributeIndex.mask), applied inside that selection
         Returns top-N items with hybrid scores.
         """
-        cf_results = dict(self.cf_model.recommend_for_user(user_id, top_n=100))
-        cb_results = {}
-
-        # Extract user's rated items
-        rated_items = set(self.cf_model.user_item_matrix.loc[user_id][
-            self.cf_model.user_item_matrix.loc[user_id] > 0].index
-        ) if user_id in self.cf_model.user_item_matrix.index else set()
-
-        # Build CB recommendations by aggregating similar items from rated ones
-        for item_id in rated_items:
-            similar_items = self.cb_model.recommend_similar_items(item_id, top_n=20)
-            for sim_item_id, sim_score in similar_items:
-                if sim_item_id not in rated_items:
-                    cb_results[sim_item_id] = cb_results.get(sim_item_id, 0) + sim_score
-
-        # Normalize CB scores
-        if cb_results:
-            max_cb = max(cb_results.values())
-            cb_results = {k: v / max_cb for k, v in cb_results.items()}
-
-        # Normalize CF scores
-        if cf_results:
-            max_cf = max(cf_results.values())
-            cf_results = {k: v / max_cf for k, v in cf_results.items()}
-
-        # Merge both scores
-        all_items = set(cf_results.keys()).union(cb_results.keys())
-        hybrid_scores = {
-            item_id: self.alpha * cf_results.get(item_id, 0) +
-                      (1 - self.alpha) * cb_results.get(item_id, 0)
-            for item_id in all_items
-        }
-
-        # Sort and return top-N
-        return sorted(hybrid_scores.items(), key=lambda x: x[1], reverse=True)[:top_n]
+        with metrics.timed("hybrid.lookup"):
+            rows = self.cf_model.user_rows([user_id])
+        if rows[0] < 0:
+            return []
+
+        scores, rated_mask = self.score_users(rows)
+        with metrics.timed("hybrid.top_n"):
+            top = top_n_indices(scores[0], top_n, exclude=rated_mask[0], allowed=allowed)
+            return list(zip(self.item_ids[top].tolist(), scores[0, top].tolist()))
+
+    def recommend_for_users(self, user_ids: List[int], top_n: int = 10,
+                            allowed: np.ndarray = None) -> List[List[Tuple[int, float]]]:
+        """
+        Hybrid recommendations for a batch of users, scored as one block product per model.
+        Returns one top-N list per user, in input order.
+        """
+        results = [[] for _ in user_ids]
+        with metrics.timed("hybrid.lookup"):
+            rows = self.cf_model.user_rows(user_ids)
+            positions = np.flatnonzero(rows >= 0)
+        if not len(positions):
+            return results
+
+        rows = rows[positions]
+        scores, rated_mask = self.score_users(rows)
+        with metrics.timed("hybrid.top_n"):
+            for row, (pos, top) in enumerate(zip(positions, top_n_rows(scores, top_n, rated_mask, allowed))):
+                results[pos] = list(zip(self.item_ids[top].tolist(), scores[row, top].tolist()))
+        return results
+
+    def recommend_block(self, user_rows: np.ndarray, top_n: int = 10):
+        """
+        Fixed-width top-N for a block of CF user rows, for bulk precomputation.
+        Returns (item_positions, scores) on the item_ids axis, padded with -1 / NaN.
+        """
+        scores, rated_mask = self.score_users(user_rows)
+        positions = np.full((len(user_rows), top_n), -1, dtype=np.int32)
+        values = np.full((len(user_rows), top_n), np.nan, dtype=np.float32)
+        for row, top in enumerate(top_n_rows(scores, top_n, rated_mask)):
+            positions[row, :len(top)] = top
+            values[row, :len(top)] = scores[row, top]
+        return positions, values
+
+    def score_candidates(self, user_rows: np.ndarray, positions: np.ndarray,
+                         candidates: np.ndarray = None) -> np.ndarray:
+        """
+        Blended scores of a block of CF user rows for candidate positions on
+        the item axis only (rows x positions), one product per part.
+        candidates: boolean (rows x positions) mask of each row's own
+            candidates when the positions are the union of several (default: all)
+        Each part is normalized by the row's best own candidate rather than
+        its best catalog item, which is the re-ranking approximation.
+        """
+        user_rows = np.asarray(user_rows)
+        if candidates is None:
+            candidates = np.ones((len(user_rows), len(positions)), dtype=bool)
+        n_cf = self.cf_model.user_item_matrix.shape[1]
+        scores = np.zeros(candidates.shape, dtype=self.dtype)
+        in_cf = positions < n_cf
+        if in_cf.any():
+            cf_scores = self.cf_model.score_items(user_rows, positions[in_cf])
+            scores[:, in_cf] = self.alpha * _normalize_rows(cf_scores, ~candidates[:, in_cf])
+
+        cb_rows = self._axis_to_cb[positions]
+        in_cb = cb_rows >= 0
+        if in_cb.any():
+            cb_scores = self.cb_model.score_items(self._profiles(user_rows), cb_rows[in_cb])
+            scores[:, in_cb] += (1 - self.alpha) * _normalize_rows(cb_scores, ~candidates[:, in_cb])
+        return scores
+
+    def user_rows(self, user_ids) -> np.ndarray:
+        """
+        CF user rows of a batch of users (-1 for users the CF model does not know).
+        """
+        return self.cf_model.user_rows(user_ids)
+
+    def score_users(self, user_rows: np.ndarray):
+        """
+        Blended scores for a block of CF user rows on the shared item axis.
+        Returns (scores, rated_mask).
+        """
+        cf_scores, cf_rated = self.cf_model.score_users(user_rows)
+        n_users, n_cf_items = cf_scores.shape
+
+        rated_mask = np.zeros((n_users, len(self.item_ids)), dtype=bool)
+        rated_mask[:, :n_cf_items] = cf_rated
+
+        cb_scores = self.cb_model.score_profiles(self._profiles(user_rows))
+
+        with metrics.timed("hybrid.blend"):
+            scores = np.zeros(rated_mask.shape, dtype=self.dtype)
+            scores[:, :n_cf_items] = self.alpha * _normalize_rows(cf_scores, cf_rated)
+            scores[:, self._cb_positions] += (1 - self.alpha) * _normalize_rows(
+                cb_scores, rated_mask[:, self._cb_positions]
+            )
+        return scores, rated_mask
+
+    def _profiles(self, user_rows) -> sparse.csr_matrix:
+        """
+        Content profiles: each user's rating vector moved onto the CB item axis,
+        so content scores are one sparse product with the item similarities.
+        """
+        with metrics.timed("hybrid.profile"):
+            in_catalog = np.flatnonzero(self._cf_to_cb >= 0)
+            ratings = self.cf_model.rating_rows(user_rows)[:, in_catalog]
+            return sparse.csr_matrix(
+                (ratings.data, self._cf_to_cb[in_catalog][ratings.indices], ratings.indptr),
+                shape=(len(user_rows), len(self._cb_positions)),
+            )
+
+
+def _normalize_rows(scores: np.ndarray, exclude: np.ndarray) -> np.ndarray:
+    """
+    Divide each row by its largest non-excluded score (rows without a positive max are kept).
+    """
+    row_max = np.where(exclude, -np.inf, scores).max(axis=1, initial=-np.inf)
+    row_max = np.where(row_max > 0, row_max, 1.0)
+    return scores / row_max[:, None]
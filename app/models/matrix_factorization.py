@@ -0,0 +1,232 @@
+# app/models/matrix_factorization.py
+
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from scipy import sparse as sp
+
+from app.config import NUM_FACTORS, NUM_EPOCHS, LEARNING_RATE
+from app.data.id_mapper import IdMapper
+from app.models.ann import IVFIndex
+from app.models.utils import to_dense, top_n_indices, top_n_rows
+
+class MatrixFactorization:
+    def __init__(self, ratings_df: pd.DataFrame, n_factors: int = NUM_FACTORS, n_epochs: int = NUM_EPOCHS,
+                 learning_rate: float = LEARNING_RATE, reg: float = 0.02, batch_size: int = 4096,
+                 n_jobs: int = None, random_state: int = 42,
+                 user_mapper: IdMapper = None, item_mapper: IdMapper = None):
+        """
+        Biased matrix factorization (SVD-style) trained with vectorized mini-batch SGD.
+        ratings_df: DataFrame with columns [user_id, item_id, rating]
+        n_jobs: training threads; each round gives them disjoint user and item rows,
+            and they overlap only where numpy releases the GIL (BLAS, large ufuncs)
+        user_mapper, item_mapper: IdMappers shared with other models (fresh ones by default)
+        """
+        self.ratings_df = ratings_df
+        self.n_factors = n_factors
+        self.n_epochs = n_epochs
+        self.learning_rate = learning_rate
+        self.reg = reg
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.random_state = random_state
+
+        self.user_index = user_mapper if user_mapper is not None else IdMapper()
+        self.item_index = item_mapper if item_mapper is not None else IdMapper()
+        self.user_item_matrix = None
+        self.user_factors = None
+        self.item_factors = None
+        self.user_bias = None
+        self.item_bias = None
+        self.global_mean = 0.0
+        self.ann_index = None
+        self._prepare()
+
+    def _prepare(self):
+        self.user_index.extend(np.unique(self.ratings_df["user_id"]))
+        self.item_index.extend(np.unique(self.ratings_df["item_id"]))
+        user_codes = self.user_index.encode(self.ratings_df["user_id"])
+        item_codes = self.item_index.encode(self.ratings_df["item_id"])
+        ratings = self.ratings_df["rating"].to_numpy(dtype=np.float64)
+
+        # Training ratings, kept to mask already-rated items at serving time
+        self.user_item_matrix = sp.csr_matrix(
+            (ratings, (user_codes, item_codes)), shape=(len(self.user_index), len(self.item_index))
+        )
+        self._fit(user_codes, item_codes, ratings)
+
+    def _fit(self, users: np.ndarray, items: np.ndarray, ratings: np.ndarray):
+        rng = np.random.default_rng(self.random_state)
+        self.global_mean = float(ratings.mean()) if len(ratings) else 0.0
+        self.user_factors = rng.normal(0, 0.1, (len(self.user_index), self.n_factors))
+        self.item_factors = rng.normal(0, 0.1, (len(self.item_index), self.n_factors))
+        self.user_bias = np.zeros(len(self.user_index))
+        self.item_bias = np.zeros(len(self.item_index))
+
+        # Users and items are split into n_blocks blocks each. An epoch runs n_blocks
+        # rounds; in round s, thread k trains the ratings of user block k and item
+        # block (k + s) % n_blocks, so no two threads ever update the same row
+        n_blocks = max(1, min(self.n_jobs, len(self.user_index), len(self.item_index)))
+        user_block = rng.permutation(len(self.user_index)) % n_blocks
+        item_block = rng.permutation(len(self.item_index)) % n_blocks
+        stratum = (item_block[items] - user_block[users]) % n_blocks
+
+        with ThreadPoolExecutor(max_workers=n_blocks) as pool:
+            for _ in range(self.n_epochs):
+                order = rng.permutation(len(ratings))
+                for s in range(n_blocks):
+                    in_round = order[stratum[order] == s]
+                    shards = [in_round[user_block[users[in_round]] == k] for k in range(n_blocks)]
+                    list(pool.map(lambda shard: self._sgd_shard(users, items, ratings, shard), shards))
+
+    def _sgd_shard(self, users: np.ndarray, items: np.ndarray, ratings: np.ndarray, shard: np.ndarray):
+        """
+        One pass of mini-batch SGD over a shard of rating positions.
+        Per-rating gradients are summed per user/item with a sparse error matrix
+        and averaged over each user's/item's ratings in the batch.
+        """
+        lr, reg = self.learning_rate, self.reg
+        for start in range(0, len(shard), self.batch_size):
+            batch = shard[start:start + self.batch_size]
+            batch_users, u = np.unique(users[batch], return_inverse=True)
+            batch_items, i = np.unique(items[batch], return_inverse=True)
+            pu, qi = self.user_factors[batch_users], self.item_factors[batch_items]
+            bu, bi = self.user_bias[batch_users], self.item_bias[batch_items]
+
+            errors = ratings[batch] - (
+                self.global_mean + bu[u] + bi[i] + np.einsum("ij,ij->i", pu[u], qi[i])
+            )
+            error_matrix = sp.csr_matrix((errors, (u, i)), shape=(len(batch_users), len(batch_items)))
+            # Average each entity's gradient over its ratings in the batch: a summed
+            # gradient would step a popular item count x lr and diverge
+            user_counts = np.bincount(u, minlength=len(batch_users))[:, None]
+            item_counts = np.bincount(i, minlength=len(batch_items))[:, None]
+
+            self.user_bias[batch_users] += lr * (np.bincount(u, weights=errors) / user_counts[:, 0] - reg * bu)
+            self.item_bias[batch_items] += lr * (np.bincount(i, weights=errors) / item_counts[:, 0] - reg * bi)
+            self.user_factors[batch_users] += lr * ((error_matrix @ qi) / user_counts - reg * pu)
+            self.item_factors[batch_items] += lr * ((error_matrix.T @ pu) / item_counts - reg * qi)
+
+    def item_vectors(self) -> np.ndarray:
+        """
+        Item factors with the item bias appended, so that [user_factors, 1] . vector
+        ranks items exactly like the full prediction.
+        """
+        return np.hstack([self.item_factors, self.item_bias[:, None]])
+
+    def build_ann_index(self, n_lists: int = 100, n_probe: int = 8) -> IVFIndex:
+        """
+        Build an IVF index over the item factors; recommend_for_user then
+        searches it instead of scoring every item.
+        """
+        self.ann_index = IVFIndex(n_lists=n_lists, n_probe=n_probe, metric="ip").build(self.item_vectors())
+        return self.ann_index
+
+    def save_ann_index(self, path: str):
+        """
+        Persist the ANN index with the ids of its item positions (see load_ann_index).
+        """
+        if self.ann_index is None:
+            raise ValueError("No ANN index built; call build_ann_index first.")
+        self.ann_index.save(path, self.item_index[:len(self.item_bias)])
+
+    def load_ann_index(self, path: str):
+        """
+        Use an index saved with save_ann_index if it was built over these item
+        factors (same item ids and width). Returns it, or None.
+        """
+        index = IVFIndex.load(path, self.item_index[:len(self.item_bias)])
+        if index is None or index.vectors.shape[1] != self.n_factors + 1:
+            return None
+        self.ann_index = index
+        return index
+
+    def predict(self, user_id, item_id) -> float:
+        """
+        Predicted rating for one (user, item) pair.
+        """
+        return float(self.predict_ratings([user_id], [item_id])[0])
+
+    def predict_ratings(self, user_ids, item_ids) -> np.ndarray:
+        """
+        Vectorized predictions for aligned arrays of user and item ids.
+        Unknown users or items fall back to the biases that are known.
+        """
+        u = self.user_index.encode(user_ids, limit=len(self.user_bias))
+        i = self.item_index.encode(item_ids, limit=len(self.item_bias))
+        known_u, known_i = u >= 0, i >= 0
+        predictions = np.full(len(u), self.global_mean)
+        predictions[known_u] += self.user_bias[u[known_u]]
+        predictions[known_i] += self.item_bias[i[known_i]]
+        both = known_u & known_i
+        predictions[both] += np.einsum(
+            "ij,ij->i", self.user_factors[u[both]], self.item_factors[i[both]]
+        )
+        return predictions
+
+    def user_rows(self, user_ids) -> np.ndarray:
+        """
+        Factor rows of a batch of users (-1 for users the model was not trained on).
+        """
+        return self.user_index.encode(user_ids, limit=len(self.user_bias))
+
+    def get_rated_items(self, user_id: int) -> list:
+        """
+        Returns the ids of the items a user rated in the training data.
+        """
+        user_idx = self.user_index.get(user_id, limit=len(self.user_bias))
+        if user_idx < 0:
+            return []
+        row = self.user_item_matrix.getrow(user_idx)
+        return self.item_index[row.indices].tolist()
+
+    def score_users(self, user_rows: np.ndarray):
+        """
+        Predicted ratings for a block of user rows over all items (one GEMM).
+        Returns (scores, rated_mask), both shaped (len(user_rows), n_items).
+        """
+        scores = self.user_factors[user_rows] @ self.item_factors.T
+        scores += self.global_mean + self.user_bias[user_rows, None] + self.item_bias
+        return scores, to_dense(self.user_item_matrix[user_rows]) != 0
+
+    def recommend_for_user(self, user_id: int, top_n: int = 10) -> list:
+        """
+        Recommend top-N unrated items for a user; scoring every item is one GEMV.
+        Returns a list of (item_id, predicted_rating).
+        """
+        user_idx = self.user_index.get(user_id, limit=len(self.user_bias))
+        if user_idx < 0:
+            return []
+
+        offset = self.global_mean + self.user_bias[user_idx]
+        if self.ann_index is not None:
+            query = np.append(self.user_factors[user_idx], 1.0)
+            rated = self.user_item_matrix.getrow(user_idx).indices
+            top, scores = self.ann_index.search(query, top_n, exclude=rated)
+            return list(zip(self.item_index[top].tolist(), (scores + offset).tolist()))
+
+        scores = self.item_factors @ self.user_factors[user_idx]
+        scores += offset + self.item_bias
+
+        rated_mask = np.zeros(len(scores), dtype=bool)
+        rated_mask[self.user_item_matrix.getrow(user_idx).indices] = True
+        top = top_n_indices(scores, top_n, exclude=rated_mask)
+        return list(zip(self.item_index[top].tolist(), scores[top].tolist()))
+
+    def recommend_for_users(self, user_ids: list, top_n: int = 10) -> list:
+        """
+        Recommend top-N items for a batch of users; scoring the block is one GEMM.
+        Returns one list of (item_id, predicted_rating) per user, in input order.
+        """
+        results = [[] for _ in user_ids]
+        rows = self.user_rows(user_ids)
+        positions = np.flatnonzero(rows >= 0)
+        if not len(positions):
+            return results
+
+        rows = rows[positions]
+        scores, rated_mask = self.score_users(rows)
+        for row, (pos, top) in enumerate(zip(positions, top_n_rows(scores, top_n, rated_mask))):
+            results[pos] = list(zip(self.item_index[top].tolist(), scores[row, top].tolist()))
+        return results
@@ -0,0 +1,113 @@
+# app/models/memory.py
+
+import logging
+import numpy as np
+
+from app import metrics
+from app.config import MEMORY_BUDGET, MEMORY_BUDGET_ACTION, PRECISION
+
+logger = logging.getLogger(__name__)
+
+# Bytes of one CSR column index / indptr entry (scipy uses int32 below 2**31 entries)
+INDEX_BYTES = 4
+# Dense score buffers per similarity score while a kNN block is reduced: scores and a negated copy
+SCORE_COPIES = 2
+
+
+def float_dtype(precision=PRECISION) -> np.dtype:
+    """
+    Float dtype of a precision setting ("float32" or "float64").
+    """
+    dtype = np.dtype(precision)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError(f"Unsupported precision {precision!r}; use 'float32' or 'float64'.")
+    return dtype
+
+
+# -------------------------------
+# Footprint estimates (bytes)
+# -------------------------------
+
+def dense_bytes(n_rows: int, n_cols: int, dtype) -> int:
+    return int(n_rows) * int(n_cols) * np.dtype(dtype).itemsize
+
+
+def csr_bytes(n_rows: int, nnz: int, dtype) -> int:
+    return int(nnz) * (np.dtype(dtype).itemsize + INDEX_BYTES) + (int(n_rows) + 1) * INDEX_BYTES
+
+
+def knn_block_bytes(n_rows: int, dtype) -> int:
+    """
+    Bytes per block row of the blockwise kNN build: dense scores plus argpartition indices.
+    """
+    return int(n_rows) * (SCORE_COPIES * np.dtype(dtype).itemsize + np.dtype(np.intp).itemsize)
+
+
+def collaborative_footprint(n_users: int, n_items: int, n_ratings: int, co_ratings: int,
+                            similarity_type: str, dtype) -> dict:
+    """
+    Peak build bytes of CollaborativeFiltering per strategy:
+        dense:  rating matrix, its normalized copy and the dense N x N similarities
+        sparse: CSR ratings, normalized copy and CSR similarities
+    co_ratings: pairs of users sharing an item (user-based) or of items sharing
+        a user (item-based), i.e. the sum of squared rating counts on the other
+        axis; bounds the stored similarities.
+    """
+    n_sim = n_users if similarity_type == "user" else n_items
+    ratings = csr_bytes(n_users, n_ratings, dtype)
+    similarities = csr_bytes(n_sim, min(co_ratings, n_sim * n_sim), dtype)
+    return {
+        "dense": 2 * dense_bytes(n_users, n_items, dtype) + dense_bytes(n_sim, n_sim, dtype),
+        # The product builds the similarity entries once more before they are kept
+        "sparse": 2 * ratings + 2 * similarities,
+    }
+
+
+def content_footprint(n_items: int, tfidf_nnz: int, num_neighbors: int, dtype) -> dict:
+    """
+    Peak build bytes of ContentBasedFiltering's similarities per strategy:
+        dense: TF-IDF, its normalized copy and the dense N x N similarities
+        knn:   TF-IDF, normalized copy, the K-neighbor graph and one block row
+               (blocks grow to whatever is left of the budget, see knn_block_bytes)
+    """
+    tfidf = 2 * csr_bytes(n_items, tfidf_nnz, dtype)
+    return {
+        "dense": tfidf + dense_bytes(n_items, n_items, dtype),
+        "knn": tfidf + csr_bytes(n_items, n_items * num_neighbors, dtype) + knn_block_bytes(n_items, dtype),
+    }
+
+
+# -------------------------------
+# Budget
+# -------------------------------
+
+def choose_strategy(model: str, estimates: dict, preferred: str, budget: int = MEMORY_BUDGET,
+                    action: str = MEMORY_BUDGET_ACTION) -> str:
+    """
+    Build strategy of a model under a memory budget (bytes, None for no limit).
+    The preferred strategy is kept when its estimate fits. Otherwise action
+    "adapt" switches to the first strategy in estimates (in order) that fits,
+    and "refuse" (or nothing fitting) raises MemoryError before anything is
+    allocated. Estimates are exported as recsys_build_estimated_bytes gauges.
+    """
+    for strategy, size in estimates.items():
+        metrics.gauge("recsys_build_estimated_bytes", "Estimated peak bytes of a model build",
+                      model=model, strategy=strategy).set(size)
+    if budget is None or estimates[preferred] <= budget:
+        return preferred
+
+    if action == "adapt":
+        for strategy, size in estimates.items():
+            if size <= budget:
+                logger.warning(f"{model}: {preferred} build needs ~{_mib(estimates[preferred])} MiB, over the "
+                               f"{_mib(budget)} MiB budget; building {strategy} (~{_mib(size)} MiB) instead")
+                return strategy
+    elif action != "refuse":
+        raise ValueError(f"Unknown MEMORY_BUDGET_ACTION {action!r}; use 'adapt' or 'refuse'.")
+    sizes = ", ".join(f"{strategy} ~{_mib(size)} MiB" for strategy, size in estimates.items())
+    raise MemoryError(f"{model}: {preferred} build needs ~{_mib(estimates[preferred])} MiB, over the "
+                      f"{_mib(budget)} MiB memory budget (estimates: {sizes})")
+
+
+def _mib(size: int) -> str:
+    return f"{size / 2 ** 20:,.0f}"
@@ -0,0 +1,172 @@
+# app/models/popularity.py
+
+import numpy as np
+import pandas as pd
+
+from app.data.id_mapper import IdMapper
+from app.models.utils import top_n_indices
+from app.config import POPULARITY_SEGMENT_COLUMN, POPULARITY_TOP_N, TRENDING_HALF_LIFE_DAYS
+
+KINDS = ("popular", "trending")
+
+
+class PopularityRanker:
+    """
+    Non-personalized rankings for cold-start and fallback traffic:
+        popular:  rating events per item
+        trending: rating events decayed exponentially with their age
+    each globally and per item segment (e.g. genre). Every ranking is a
+    precomputed top-N array, so serving one is a dict lookup and a slice.
+    """
+
+    def __init__(self, ratings_df: pd.DataFrame, items_df: pd.DataFrame = None,
+                 segment_column: str = POPULARITY_SEGMENT_COLUMN, top_n: int = POPULARITY_TOP_N,
+                 half_life_days: float = TRENDING_HALF_LIFE_DAYS, item_mapper: IdMapper = None):
+        """
+        ratings_df: [user_id, item_id, ...] plus timestamp for trending
+            (without timestamps trending equals popular)
+        items_df: item metadata holding segment_column, for per-segment rankings
+        item_mapper: IdMapper shared with the models, so item filter masks line up
+        """
+        self.top_n = top_n
+        self.decay = np.log(2) / (half_life_days * 86_400)
+        self.item_index = item_mapper if item_mapper is not None else IdMapper()
+        self.counts = np.zeros(0)
+        self.trend = None
+        self.reference_time = None
+        self.segments = np.zeros(0, dtype=np.int64)
+        self.segment_codes = {}
+        self.rankings = {}
+
+        if items_df is not None and segment_column in items_df:
+            codes, names = pd.factorize(items_df[segment_column])
+            rows = self.item_index.extend(items_df["item_id"])
+            self._grow()
+            self.segments[rows] = codes
+            self.segment_codes = {name: code for code, name in enumerate(names.tolist())}
+        self.update(ratings_df)
+
+    @classmethod
+    def from_counts(cls, item_ids, counts, top_n: int = POPULARITY_TOP_N) -> "PopularityRanker":
+        """
+        Global popularity only, from per-item rating counts (e.g. a CF model
+        loaded from a bundle, where the raw ratings are not at hand).
+        """
+        ranker = cls(pd.DataFrame({"item_id": np.asarray(item_ids)[:0]}), top_n=top_n)
+        rows = ranker.item_index.extend(item_ids)
+        ranker._grow()
+        ranker.counts[rows] = counts
+        ranker._rerank(None)
+        return ranker
+
+    def _grow(self):
+        n_items = len(self.item_index)
+        grow = n_items - len(self.counts)
+        if grow > 0:
+            self.counts = np.pad(self.counts, (0, grow))
+            self.segments = np.pad(self.segments, (0, grow), constant_values=-1)
+            if self.trend is not None:
+                self.trend = np.pad(self.trend, (0, grow))
+
+    def update(self, ratings_df: pd.DataFrame, removed_df: pd.DataFrame = None):
+        """
+        Count new rating events in, and take removed ones (removed_df, e.g.
+        deleted ratings) out again. Trending scores are kept decayed to the
+        newest timestamp seen; events without a timestamp count as happening
+        then. The time of a removed rating is not kept, so a removal takes an
+        average event off its item's trending score. Untouched items keep
+        their relative order, so each ranking is re-selected from its current
+        top-N plus the touched items only (from every item once a ranked one
+        loses events).
+        """
+        first = not self.rankings
+        rows = self.item_index.extend(ratings_df["item_id"])
+        self._grow()
+        n_items = len(self.item_index)
+
+        timestamps = ratings_df["timestamp"].to_numpy(dtype=np.float64) if "timestamp" in ratings_df \
+            else np.full(len(rows), np.nan)
+        known = timestamps[~np.isnan(timestamps)]
+        if self.trend is None and len(known):
+            # Earlier events had no timestamps: they count as of the first one seen
+            self.trend = self.counts.astype(np.float64)
+            self.reference_time = known.max()
+        if self.trend is not None and len(rows):
+            newest = known.max() if len(known) else self.reference_time
+            if newest > self.reference_time:
+                self.trend *= np.exp(-self.decay * (newest - self.reference_time))
+                self.reference_time = newest
+            timestamps = np.where(np.isnan(timestamps), self.reference_time, timestamps)
+            weights = np.exp(-self.decay * (self.reference_time - timestamps))
+            self.trend += np.bincount(rows, weights=weights, minlength=n_items)
+        self.counts += np.bincount(rows, minlength=n_items)
+
+        lost = np.zeros(0, dtype=np.int64)
+        if removed_df is not None and len(removed_df):
+            removed = self.item_index.encode(removed_df["item_id"], limit=n_items)
+            removed = removed[removed >= 0]
+            removals = np.minimum(np.bincount(removed, minlength=n_items), self.counts)
+            if self.trend is not None:
+                share = np.divide(removals, self.counts, out=np.zeros(n_items), where=self.counts > 0)
+                self.trend *= 1 - share
+            self.counts = self.counts - removals
+            lost = np.unique(removed)
+
+        ranked_lost = any(np.isin(lost, ranking).any() for ranking in self.rankings.values())
+        self._rerank(None if first or ranked_lost else np.union1d(rows, lost))
+
+    def _scores(self, kind: str) -> np.ndarray:
+        return self.trend if kind == "trending" and self.trend is not None else self.counts
+
+    def _rerank(self, touched):
+        """
+        Re-select every ranking from all items (touched=None) or from its
+        previous top-N plus the touched items.
+        """
+        segments = [None, *self.segment_codes.values()]
+        for kind in KINDS:
+            scores = self._scores(kind)
+            for segment in segments:
+                if touched is None:
+                    candidates = np.arange(len(scores)) if segment is None else np.flatnonzero(self.segments == segment)
+                else:
+                    candidates = np.union1d(self.rankings.get((kind, segment), []), touched).astype(np.int64)
+                    if segment is not None:
+                        candidates = candidates[self.segments[candidates] == segment]
+                top = candidates[top_n_indices(scores[candidates], self.top_n)]
+                self.rankings[(kind, segment)] = top[scores[top] > 0]
+
+    def segment_of(self, item_ids):
+        """
+        Most common segment among the given items, or None.
+        """
+        rows = self.item_index.encode(item_ids)
+        codes = self.segments[rows[rows >= 0]]
+        codes = codes[codes >= 0]
+        if not len(codes):
+            return None
+        code = int(np.bincount(codes).argmax())
+        return next(name for name, value in self.segment_codes.items() if value == code)
+
+    def recommend(self, top_n: int = 10, kind: str = "popular", segment=None, exclude=None,
+                  allowed: np.ndarray = None) -> list:
+        """
+        Top-N (item_id, score) of a precomputed ranking; unknown segments use the global one.
+        exclude: item ids to leave out (e.g. the few the user already rated)
+        allowed: boolean item filter over the counted item positions; when it leaves
+            fewer than top_n items of the ranking, every allowed item is ranked
+        """
+        positions = self.rankings.get((kind, self.segment_codes.get(segment)), self.rankings[(kind, None)])
+        excluded = self.item_index.encode(exclude) if exclude is not None and len(exclude) else None
+        if excluded is not None:
+            positions = positions[~np.isin(positions, excluded)]
+        scores = self._scores(kind)
+        if allowed is not None:
+            positions = positions[allowed[positions]]
+            if len(positions) < top_n:
+                blocked = ~allowed | (scores <= 0)
+                if excluded is not None:
+                    blocked[excluded[excluded >= 0]] = True
+                positions = top_n_indices(scores, top_n, exclude=blocked)
+        top = positions[:top_n]
+        return list(zip(self.item_index[top].tolist(), scores[top].tolist()))
@@ -0,0 +1,287 @@
+# app/models/retrieval.py
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from app import metrics
+from app.data.id_mapper import IdMapper
+from app.models.hybrid import HybridRecommender
+from app.models.utils import top_n_indices, top_n_rows
+from app.config import RETRIEVAL_NEIGHBORS, RETRIEVAL_RECENT_ITEMS
+
+SOURCES = ("cf", "content", "popular")
+CANDIDATE_BUCKETS = (0, 10, 25, 50, 100, 200, 400, 800, 1600)
+
+
+class RetrievalPipeline:
+    """
+    Two-stage recommendation on top of a HybridRecommender. Cheap candidate
+    sources each propose a bounded number of items:
+        cf:      items from the user's nearest CF neighbors
+        content: content neighbors of the user's most recent items
+        popular: the most-rated items
+    The deduplicated union (a few hundred items) is the only thing the hybrid
+    blend scores, instead of the whole catalog. An item filter is applied
+    inside each source's selection; when too few filtered candidates remain,
+    the whole filtered catalog is scored instead.
+    """
+
+    def __init__(self, hybrid_model: HybridRecommender, limits: dict, ratings_df: pd.DataFrame = None,
+                 n_neighbors: int = RETRIEVAL_NEIGHBORS, n_recent: int = RETRIEVAL_RECENT_ITEMS,
+                 name: str = "default"):
+        """
+        limits: candidate limit per source, e.g. {"cf": 200, "content": 100, "popular": 50}
+        ratings_df: ratings with a timestamp column to find each user's recent
+            items (their top-rated items are used for users without any)
+        name: label of this pipeline's candidate-count metrics (e.g. the endpoint)
+        """
+        unknown = set(limits) - set(SOURCES)
+        if unknown:
+            raise ValueError(f"Unknown candidate sources: {sorted(unknown)}")
+        self.hybrid_model = hybrid_model
+        self.limits = dict(limits)
+        self.n_neighbors = n_neighbors
+        self.n_recent = n_recent
+        self.name = name
+        self._counts = {
+            source: metrics.histogram("recsys_retrieval_candidates", CANDIDATE_BUCKETS,
+                                      "Candidates proposed per request", pipeline=name, source=source)
+            for source in (*self.limits, "unique")
+        }
+        self.refresh(ratings_df)
+
+    def refresh(self, ratings_df: pd.DataFrame = None):
+        """
+        Rebuild the popular list and recent items from scratch (rating deltas
+        are folded in by update, catalog changes by align_items).
+        """
+        cf_model = self.hybrid_model.cf_model
+        self._axis = IdMapper.from_ids(self.hybrid_model.item_ids)
+
+        # Popular items on the item axis (CF columns come first); a margin covers rated ones
+        self._item_counts = np.asarray(cf_model.item_counts(), dtype=np.int64)
+        self._rank_popular()
+
+        # Recent items per user row; data holds their order (1 = oldest)
+        self._recent = None
+        self._recent_updates = {}
+        if ratings_df is not None and "timestamp" in ratings_df:
+            latest = ratings_df.sort_values("timestamp", kind="stable").groupby("user_id").tail(self.n_recent)
+            rows = cf_model.user_rows(latest["user_id"])
+            cols = cf_model.item_index.encode(latest["item_id"], limit=cf_model.user_item_matrix.shape[1])
+            order = latest.groupby("user_id").cumcount().to_numpy() + 1
+            known = (rows >= 0) & (cols >= 0)
+            self._recent = sparse.csr_matrix(
+                (order[known], (rows[known], cols[known])),
+                shape=(cf_model.user_item_matrix.shape[0], cf_model.user_item_matrix.shape[1]),
+            )
+
+    def update(self, delta_df: pd.DataFrame, previous: np.ndarray):
+        """
+        Fold ratings the CF model just applied into the popular list and the
+        recent items, touching only the delta's users and items.
+        delta_df: applied ratings [user_id, item_id, rating(, timestamp)], one row per pair
+        previous: rating of each row's pair before it was applied (0: none,
+            see CollaborativeFiltering.stored_ratings)
+        """
+        self.align_items()
+        cf_model = self.hybrid_model.cf_model
+        rows = cf_model.user_rows(delta_df["user_id"])
+        cols = cf_model.item_index.encode(delta_df["item_id"], limit=len(self._item_counts))
+        ratings = delta_df["rating"].to_numpy()
+
+        # New pairs add a rating to their item, removed ones take it away
+        change = (ratings != 0).astype(np.int64) - (np.asarray(previous) != 0)
+        known = cols >= 0
+        np.add.at(self._item_counts, cols[known], change[known])
+        if np.any(change[known & np.isin(cols, self._popular)] < 0):
+            self._rank_popular()
+        else:
+            # Counts only grew, so the list can only gain the items that changed
+            grown = np.unique(cols[known & (change > 0)])
+            self._rank_popular(np.union1d(self._popular, grown))
+
+        if self._recent is None:
+            return
+        order = np.argsort(delta_df["timestamp"].to_numpy(), kind="stable") if "timestamp" in delta_df \
+            else np.arange(len(delta_df))
+        for row, col, rating in zip(rows[order].tolist(), cols[order].tolist(), ratings[order].tolist()):
+            if row < 0 or col < 0:
+                continue
+            anchors = [anchor for anchor in self._recent_items(row) if anchor != col]
+            if rating != 0:
+                anchors.append(col)
+            self._recent_updates[row] = anchors[-self.n_recent:]
+
+    def align_items(self):
+        """
+        Follow catalog changes of the hybrid item axis (e.g. after add_items).
+        """
+        item_ids = self.hybrid_model.item_ids
+        if len(self._axis) != len(item_ids):
+            self._axis = IdMapper.from_ids(item_ids)
+        grow = self.hybrid_model.cf_model.user_item_matrix.shape[1] - len(self._item_counts)
+        if grow > 0:
+            self._item_counts = np.pad(self._item_counts, (0, grow))
+
+    def _rank_popular(self, pool: np.ndarray = None):
+        """
+        Most-rated item columns, best first, among pool (all items by default).
+        """
+        counts = self._item_counts if pool is None else self._item_counts[pool]
+        top = top_n_indices(counts, 4 * self.limits.get("popular", 0))
+        top = top[counts[top] > 0]
+        self._popular = top if pool is None else pool[top]
+
+    def _recent_items(self, user_row: int) -> list:
+        """
+        Item columns of a user's recent ratings, oldest first.
+        """
+        if user_row in self._recent_updates:
+            return self._recent_updates[user_row]
+        if self._recent is None or user_row >= self._recent.shape[0]:
+            return []
+        recent = self._recent[user_row]
+        return recent.indices[np.argsort(recent.data)].tolist()
+
+    def candidates(self, user_row: int, stats: dict = None, allowed: np.ndarray = None) -> np.ndarray:
+        """
+        Unrated candidate positions on the hybrid item axis for one CF user row.
+        stats (optional) receives per-source candidate counts and seconds.
+        allowed: boolean mask on the item axis of the items that may be proposed
+        """
+        return self.candidate_sets([user_row], stats, allowed)[0]
+
+    def candidate_sets(self, user_rows: np.ndarray, stats: dict = None, allowed: np.ndarray = None) -> list:
+        """
+        Candidate positions of a block of CF user rows, one array per row.
+        Each source runs once for the whole block; stats counts are summed over its rows.
+        """
+        cf_model = self.hybrid_model.cf_model
+        user_rows = np.asarray(user_rows)
+        ratings = cf_model.rating_rows(user_rows)
+        rated = np.split(ratings.indices, ratings.indptr[1:-1])
+        found = [[] for _ in user_rows]
+        for source, limit in self.limits.items():
+            with metrics.timed(f"retrieval.{source}") as timer:
+                if source == "cf":
+                    cf_allowed = allowed[:cf_model.user_item_matrix.shape[1]] if allowed is not None else None
+                    positions = cf_model.candidate_items(user_rows, limit, self.n_neighbors, cf_allowed)
+                elif source == "content":
+                    positions = self._content_candidates(user_rows, limit, ratings, allowed)
+                else:
+                    popular = self._popular if allowed is None else self._popular[allowed[self._popular]]
+                    positions = [popular[~np.isin(popular, row_rated)][:limit] for row_rated in rated]
+            for row_found, row_positions in zip(found, positions):
+                row_found.append(row_positions)
+            self._record(stats, source, [len(row_positions) for row_positions in positions], timer.elapsed)
+
+        with metrics.timed("retrieval.merge") as timer:
+            merged = [np.unique(np.concatenate(row_found)) if row_found else np.empty(0, dtype=np.int64)
+                      for row_found in found]
+        self._record(stats, "unique", [len(row_merged) for row_merged in merged], timer.elapsed)
+        return merged
+
+    def _content_candidates(self, user_rows: np.ndarray, limit: int, ratings: sparse.csr_matrix,
+                            allowed: np.ndarray = None) -> list:
+        """
+        Content neighbors of each user's recent (or else top-rated) items, split
+        evenly between them. The neighbor lists of all anchors in the block are
+        read with one similar_item_rows call.
+        """
+        cf_model = self.hybrid_model.cf_model
+        cb_model = self.hybrid_model.cb_model
+        anchors, per_anchor = [], []
+        for row, user_row in enumerate(user_rows.tolist()):
+            rated = ratings.indices[ratings.indptr[row]:ratings.indptr[row + 1]]
+            row_anchors = np.asarray(self._recent_items(user_row), dtype=np.int64)
+            if not len(row_anchors):
+                row_data = ratings.data[ratings.indptr[row]:ratings.indptr[row + 1]]
+                row_anchors = rated[top_n_indices(row_data, self.n_recent)]
+            anchors.append(row_anchors)
+            # Over-fetch a little, since rated neighbors are dropped afterwards
+            per_anchor.append(-(-limit // len(row_anchors)) + min(len(rated), limit) if len(row_anchors) else 0)
+
+        all_anchors = np.concatenate(anchors)
+        if not len(all_anchors):
+            return [np.empty(0, dtype=np.int64) for _ in anchors]
+        neighbors = cb_model.similar_item_rows(cf_model.item_index[all_anchors], max(per_anchor))
+
+        found = []
+        ends = np.cumsum([len(row_anchors) for row_anchors in anchors])
+        for row, (end, row_anchors, top) in enumerate(zip(ends, anchors, per_anchor)):
+            rows = [anchor_neighbors[:top] for anchor_neighbors in neighbors[end - len(row_anchors):end]]
+            if not rows:
+                found.append(np.empty(0, dtype=np.int64))
+                continue
+            rated = ratings.indices[ratings.indptr[row]:ratings.indptr[row + 1]]
+            positions = self._axis.encode(cb_model.item_index[np.concatenate(rows)])
+            positions = positions[(positions >= 0) & ~np.isin(positions, rated)]
+            if allowed is not None:
+                positions = positions[allowed[positions]]
+            found.append(pd.unique(positions)[:limit])
+        return found
+
+    def _record(self, stats: dict, source: str, counts: list, seconds: float):
+        for count in counts:
+            self._counts[source].observe(count)
+        if stats is not None:
+            stats.setdefault("candidates", {})[source] = sum(counts)
+            stats.setdefault("seconds", {})[source] = seconds
+
+    def retrieve(self, user_id, top_n: int = 10, allowed: np.ndarray = None):
+        """
+        Top-N (item_id, score) pairs of one user from its candidates only,
+        plus per-stage stats: {"candidates": {source: n}, "seconds": {stage: s}}.
+        allowed: boolean item filter on the hybrid item axis
+        """
+        stats = {}
+        return self._retrieve_block([user_id], top_n, allowed, stats)[0], stats
+
+    def recommend_for_user(self, user_id, top_n: int = 10, allowed: np.ndarray = None) -> list:
+        return self.retrieve(user_id, top_n, allowed)[0]
+
+    def recommend_for_users(self, user_ids: list, top_n: int = 10, allowed: np.ndarray = None) -> list:
+        """
+        Top-N lists of a batch of users: candidates are gathered for the whole
+        batch and their union is scored with one score_candidates block.
+        """
+        return self._retrieve_block(user_ids, top_n, allowed)
+
+    def _retrieve_block(self, user_ids, top_n: int, allowed: np.ndarray = None, stats: dict = None) -> list:
+        results = [[] for _ in user_ids]
+        user_rows = self.hybrid_model.user_rows(user_ids)
+        known = np.flatnonzero(user_rows >= 0)
+        if not len(known):
+            return results
+
+        scored, candidate_sets = [], []
+        for i, positions in zip(known.tolist(), self.candidate_sets(user_rows[known], stats, allowed)):
+            if allowed is not None and len(positions) < top_n:
+                # Too selective a filter for the candidate sources
+                if stats is not None:
+                    stats["filtered_fallback"] = True
+                results[i] = self.hybrid_model.recommend_for_user(user_ids[i], top_n, allowed)
+            else:
+                scored.append(i)
+                candidate_sets.append(positions)
+        if not scored:
+            return results
+
+        # One block over the union of the candidates; each row keeps only its own
+        positions = np.unique(np.concatenate(candidate_sets))
+        own = np.zeros((len(scored), len(positions)), dtype=bool)
+        for row, candidates in enumerate(candidate_sets):
+            own[row, np.searchsorted(positions, candidates)] = True
+        with metrics.timed("retrieval.score") as timer:
+            scores = self.hybrid_model.score_candidates(user_rows[scored], positions, own)
+        if stats is not None:
+            stats["seconds"]["score"] = timer.elapsed
+        with metrics.timed("retrieval.top_n") as timer:
+            item_ids = self.hybrid_model.item_ids
+            for row, (i, top) in enumerate(zip(scored, top_n_rows(scores, top_n, exclude=~own))):
+                results[i] = list(zip(item_ids[positions[top]].tolist(), scores[row, top].tolist()))
+        if stats is not None:
+            stats["seconds"]["top_n"] = timer.elapsed
+        return results
@@ -0,0 +1,212 @@
+# app/models/similarity.py
+
+import os
+import glob
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from app.models.memory import knn_block_bytes
+
+# Upper bound on the number of dense similarity scores held per block
+BLOCK_ELEMENTS = 2 ** 25
+
+
+def plan_blocks(n_rows: int, n_jobs: int = 1, memory_limit: int = None, dtype=np.float64):
+    """
+    (block_size, n_jobs) so that n_jobs blocks in flight stay under memory_limit bytes.
+    Without a limit, blocks hold at most BLOCK_ELEMENTS scores.
+    dtype: precision of the features, and so of the dense scores
+    """
+    n_jobs = max(1, n_jobs or 1)
+    row_bytes = knn_block_bytes(max(n_rows, 1), dtype)
+    if memory_limit is None:
+        return max(1, BLOCK_ELEMENTS // max(n_rows, 1)), n_jobs
+    # Fewer workers when even one row per worker would not fit
+    n_jobs = max(1, min(n_jobs, memory_limit // row_bytes))
+    return max(1, memory_limit // (row_bytes * n_jobs)), n_jobs
+
+
+def build_knn_graph(feature_matrix, k: int, block_size: int = None, n_jobs: int = 1,
+                    memory_limit: int = None, block_dir: str = None) -> sparse.csr_matrix:
+    """
+    Build a sparse kNN graph of cosine similarities between the rows of a
+    feature matrix, keeping at most K positive neighbors per row.
+    Rows are processed blockwise on n_jobs threads so the full N x N matrix
+    never exists; memory_limit (bytes) caps the dense blocks in flight.
+    With block_dir, reduced blocks go to disk first (see build_knn_blocks).
+    """
+    if block_dir is not None:
+        paths = build_knn_blocks(feature_matrix, k, block_dir, block_size, n_jobs, memory_limit)
+        return load_knn_blocks(paths, feature_matrix.shape[0])
+
+    features = normalize(sparse.csr_matrix(feature_matrix))
+    n_rows = features.shape[0]
+    k = min(k, max(n_rows - 1, 0))
+    planned_size, n_jobs = plan_blocks(n_rows, n_jobs, memory_limit, features.dtype)
+    size = block_size or planned_size
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        blocks = list(pool.map(lambda start: _reduce_block(features, start, min(start + size, n_rows), k),
+                               range(0, n_rows, size)))
+    return _assemble(blocks, n_rows)
+
+
+def build_knn_blocks(feature_matrix, k: int, block_dir: str, block_size: int = None, n_jobs: int = 1,
+                     memory_limit: int = None) -> list:
+    """
+    Compute the kNN graph block by block on n_jobs threads, writing each
+    reduced block to block_dir as soon as it is done. Returns the block
+    paths in row order; nothing larger than one dense block per thread is
+    held in memory. Blocks left over from a previous build are removed.
+    """
+    features = normalize(sparse.csr_matrix(feature_matrix))
+    n_rows = features.shape[0]
+    k = min(k, max(n_rows - 1, 0))
+    planned_size, n_jobs = plan_blocks(n_rows, n_jobs, memory_limit, features.dtype)
+    size = block_size or planned_size
+
+    os.makedirs(block_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(block_dir, "block-*.npz")):
+        os.remove(stale)
+
+    def write_block(start: int) -> str:
+        indices, scores, counts = _reduce_block(features, start, min(start + size, n_rows), k)
+        path = os.path.join(block_dir, f"block-{start:010d}.npz")
+        np.savez(path, indices=indices, scores=scores, counts=counts)
+        return path
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        return list(pool.map(write_block, range(0, n_rows, size)))
+
+
+def load_knn_blocks(paths: list, n_rows: int) -> sparse.csr_matrix:
+    """
+    Assemble the kNN graph from blocks written by build_knn_blocks.
+    """
+    blocks = []
+    for path in paths:
+        with np.load(path) as block:
+            blocks.append((block["indices"], block["scores"], block["counts"]))
+    return _assemble(blocks, n_rows)
+
+
+def update_knn_graph(graph: sparse.csr_matrix, feature_matrix, rows: np.ndarray, k: int) -> sparse.csr_matrix:
+    """
+    kNN graph after the feature rows in rows changed or were appended (the
+    graph is grown to the feature matrix). Their neighbor lists are recomputed,
+    stale edges pointing at them are dropped, and each of them joins the list
+    of any other row whose K-th neighbor it now beats. Rows that lost an edge
+    keep fewer than K neighbors until the next full build.
+    """
+    features = normalize(sparse.csr_matrix(feature_matrix))
+    n_rows = features.shape[0]
+    k = min(k, max(n_rows - 1, 0))
+    rows = np.unique(rows)
+    graph = sparse.csr_matrix(graph, copy=True)
+    graph.resize((n_rows, n_rows))
+
+    # Similarities of the changed rows against everything, self and non-positive dropped
+    block = sparse.coo_matrix(features[rows] @ features.T)
+    keep = (block.col != rows[block.row]) & (block.data > 0)
+    sources, targets, scores = rows[block.row[keep]], block.col[keep], block.data[keep]
+
+    changed = np.zeros(n_rows, dtype=bool)
+    changed[rows] = True
+    old = graph.tocoo()
+    kept = ~changed[old.row] & ~changed[old.col]
+    # Edges between two changed rows already appear in both directions in the block
+    reverse = ~changed[targets]
+
+    return _top_k_entries(
+        np.concatenate([old.row[kept], sources, targets[reverse]]),
+        np.concatenate([old.col[kept], targets, sources[reverse]]),
+        np.concatenate([old.data[kept], scores, scores[reverse]]),
+        n_rows, k,
+    )
+
+
+def _top_k_entries(rows: np.ndarray, cols: np.ndarray, scores: np.ndarray, n_rows: int, k: int):
+    """
+    CSR matrix keeping the K highest-scoring (row, col) entries of every row.
+    """
+    order = np.lexsort((-scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    starts = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n_rows))])
+    keep = np.arange(len(rows)) - starts[rows] < k
+
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows[keep], minlength=n_rows))])
+    return sparse.csr_matrix((scores[keep], cols[keep], indptr), shape=(n_rows, n_rows))
+
+
+def _reduce_block(features, start: int, stop: int, k: int):
+    """
+    Positive top-K neighbors of rows [start, stop) as flat (indices, scores, per-row counts).
+    """
+    block_indices, block_scores = _top_k_block(features, start, stop, k)
+    keep = block_scores > 0
+    return block_indices[keep], block_scores[keep], keep.sum(axis=1)
+
+
+def _assemble(blocks: list, n_rows: int) -> sparse.csr_matrix:
+    counts = [block[2] for block in blocks]
+    indptr = np.concatenate([np.zeros(1, dtype=np.int64)] + counts).cumsum()
+    return sparse.csr_matrix(
+        (np.concatenate([block[1] for block in blocks]) if blocks else np.empty(0),
+         np.concatenate([block[0] for block in blocks]) if blocks else np.empty(0, dtype=np.int64),
+         indptr),
+        shape=(n_rows, n_rows),
+    )
+
+
+def _top_k_block(features, start: int, stop: int, k: int):
+    """
+    Top-K neighbors (indices, scores) of rows [start, stop), self excluded.
+    """
+    scores = (features[start:stop] @ features.T).toarray()
+    rows = np.arange(stop - start)
+    scores[rows, start + rows] = -np.inf
+    if k == 0:
+        return np.empty((stop - start, 0), dtype=np.int64), np.empty((stop - start, 0))
+
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return top, np.take_along_axis(scores, top, axis=1)
+
+
+def neighbors_of(graph: sparse.csr_matrix, idx: int):
+    """
+    Neighbor indices and scores of one row, most similar first.
+    """
+    start, stop = graph.indptr[idx], graph.indptr[idx + 1]
+    indices, scores = graph.indices[start:stop], graph.data[start:stop]
+    order = np.argsort(-scores, kind="stable")
+    return indices[order], scores[order]
+
+
+def save_neighbor_graph(graph: sparse.csr_matrix, path: str, item_ids=None):
+    """
+    Save a kNN graph in scipy .npz format.
+    item_ids: ids of the graph rows, saved next to it (<path>.ids.npy) so
+        loaders can check the graph still matches their items
+    """
+    sparse.save_npz(path, graph)
+    if item_ids is not None:
+        np.save(_ids_path(path), np.asarray(item_ids), allow_pickle=False)
+
+
+def load_neighbor_graph(path: str, item_ids=None):
+    """
+    Load a kNN graph saved with save_neighbor_graph.
+    item_ids: ids the rows must have; returns None when the graph was saved
+        without ids or for other items (so the caller rebuilds it)
+    """
+    if item_ids is not None:
+        ids_path = _ids_path(path)
+        if not os.path.exists(ids_path) or not np.array_equal(np.load(ids_path), np.asarray(item_ids)):
+            return None
+    return sparse.load_npz(path).tocsr()
+
+
+def _ids_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".ids.npy"
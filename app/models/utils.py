@@ -0,0 +1,105 @@
+# app/models/utils.py
+
+import numpy as np
+from scipy import sparse
+
+
+def top_n_indices(scores: np.ndarray, top_n: int, exclude: np.ndarray = None,
+                  allowed: np.ndarray = None) -> np.ndarray:
+    """
+    Indices of the top-N scores in descending order.
+    Uses partial selection (argpartition) so only the N winners get sorted.
+    exclude: boolean mask of positions that must never be returned
+    allowed: boolean mask of the only positions that may be returned (e.g. an item filter)
+    """
+    exclude = _with_allowed(exclude, allowed)
+    if exclude is not None:
+        scores = np.where(exclude, -np.inf, scores)
+        available = scores.size - int(np.count_nonzero(exclude))
+    else:
+        available = scores.size
+
+    top_n = min(top_n, available)
+    if top_n <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    if top_n < scores.size:
+        candidates = np.argpartition(-scores, top_n - 1)[:top_n]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def top_n_rows(scores: np.ndarray, top_n: int, exclude: np.ndarray = None, allowed: np.ndarray = None) -> list:
+    """
+    Row-wise top-N for a (rows x items) score block.
+    Returns one index array per row, best first, with excluded positions dropped.
+    allowed: boolean item mask shared by all rows (e.g. an item filter)
+    """
+    exclude = _with_allowed(exclude, allowed)
+    if exclude is not None:
+        scores = np.where(exclude, -np.inf, scores)
+
+    n_cols = scores.shape[1]
+    top_n = min(top_n, n_cols)
+    if top_n <= 0:
+        return [np.empty(0, dtype=np.intp) for _ in range(scores.shape[0])]
+
+    if top_n < n_cols:
+        candidates = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+    else:
+        candidates = np.broadcast_to(np.arange(n_cols), scores.shape)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    ranked = np.take_along_axis(candidates, order, axis=1)
+    valid = np.take_along_axis(candidate_scores, order, axis=1) > -np.inf
+    return [row[keep] for row, keep in zip(ranked, valid)]
+
+
+def _with_allowed(exclude, allowed):
+    """
+    One exclusion mask from an exclude mask and an allowed mask (either may be None).
+    """
+    if allowed is None:
+        return exclude
+    return ~allowed if exclude is None else exclude | ~allowed
+
+
+def to_dense(matrix) -> np.ndarray:
+    """
+    Dense ndarray view of a scipy sparse matrix, ndarray or np.matrix.
+    """
+    if sparse.issparse(matrix):
+        return matrix.toarray()
+    return np.asarray(matrix)
+
+
+def replace_rows(matrix: sparse.csr_matrix, rows: np.ndarray, block: sparse.csr_matrix) -> sparse.csr_matrix:
+    """
+    CSR matrix with the given rows (sorted, unique) replaced by the rows of block.
+    Untouched rows are copied over as contiguous spans, so the Python-level work
+    is proportional to len(rows) rather than to the number of rows; the
+    data/indices arrays themselves are still copied, so this is O(nnz).
+    """
+    n_rows = matrix.shape[0]
+    block_lengths = np.diff(block.indptr)
+    lengths = np.diff(matrix.indptr)
+    lengths[rows] = block_lengths
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+
+    indices = np.empty(indptr[-1], dtype=np.result_type(matrix.indices, block.indices))
+    data = np.empty(indptr[-1], dtype=np.result_type(matrix.data, block.data))
+    bounds = np.concatenate([[-1], rows, [n_rows]])
+    for k in range(len(bounds) - 1):
+        # Untouched span of rows (bounds[k], bounds[k + 1])
+        start, stop = bounds[k] + 1, bounds[k + 1]
+        if start < stop:
+            src, dst = slice(matrix.indptr[start], matrix.indptr[stop]), slice(indptr[start], indptr[stop])
+            indices[dst], data[dst] = matrix.indices[src], matrix.data[src]
+        if k < len(rows):
+            row = rows[k]
+            src, dst = slice(block.indptr[k], block.indptr[k + 1]), slice(indptr[row], indptr[row + 1])
+            indices[dst], data[dst] = block.indices[src], block.data[src]
+
+    return sparse.csr_matrix((data, indices, indptr), shape=matrix.shape)
@@ -0,0 +1,189 @@
+# app/services/artifacts.py
+
+import os
+import json
+import time
+import logging
+import numpy as np
+from scipy import sparse
+
+from app.data.hashed_tfidf import HashedTfidf
+from app.data.id_mapper import IdMapper
+from app.models.collaborative import CollaborativeFiltering
+from app.models.content_based import ContentBasedFiltering
+from app.models.hybrid import HybridRecommender
+from app.config import BUNDLE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Bump when the array layout below changes incompatibly
+BUNDLE_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+
+# --------------------------
+# Flat array layout
+# --------------------------
+
+def collect_arrays(cf_model: CollaborativeFiltering, cb_model: ContentBasedFiltering,
+                   hybrid_model: HybridRecommender):
+    """
+    Flatten the fitted models into named NumPy arrays plus a JSON-able spec.
+    Sparse matrices are split into their CSR data/indices/indptr arrays.
+    """
+    arrays, matrices = {}, {}
+    cf_model.merge_updates()
+    ratings = cf_model._ratings_values()
+    arrays["cf.user_ids"] = np.asarray(cf_model.user_index[:ratings.shape[0]])
+    arrays["cf.item_ids"] = np.asarray(cf_model.item_index[:ratings.shape[1]])
+    _flatten("cf.ratings", ratings, arrays, matrices)
+    _flatten("cf.similarity", cf_model.similarity_matrix, arrays, matrices)
+
+    arrays["cb.item_ids"] = np.asarray(cb_model.item_index[:cb_model.tfidf_matrix.shape[0]])
+    _flatten("cb.tfidf", cb_model.tfidf_matrix, arrays, matrices)
+    if cb_model.neighbor_graph is not None:
+        _flatten("cb.neighbors", cb_model.neighbor_graph, arrays, matrices)
+    else:
+        _flatten("cb.similarity", cb_model.similarity_matrix, arrays, matrices)
+    content_spec = {"text_column": cb_model.text_column}
+    if cb_model.hasher is not None:
+        # Hashed features: the IDF state and raw counts add_items continues from
+        arrays["cb.doc_freq"] = cb_model.hasher.doc_freq
+        _flatten("cb.term_counts", cb_model.term_counts, arrays, matrices)
+        content_spec["hasher"] = {"n_docs": cb_model.hasher.n_docs, "stop_words": cb_model.hasher.stop_words}
+
+    spec = {
+        "collaborative": {"similarity_type": cf_model.similarity_type},
+        "content_based": content_spec,
+        "hybrid": {"alpha": hybrid_model.alpha},
+        "matrices": matrices,
+    }
+    return arrays, spec
+
+
+def restore_models(arrays: dict, spec: dict):
+    """
+    Rebuild (cf_model, cb_model, hybrid_model) from collect_arrays output.
+    The arrays are used as-is, so memory-mapped or shared buffers stay zero-copy.
+    """
+    matrices = spec["matrices"]
+    cf_items = IdMapper.from_ids(arrays["cf.item_ids"])
+    cb_ids = arrays["cb.item_ids"]
+    # Share one item mapper again when the CB ids are a prefix of the CF ids
+    shared = len(cb_ids) <= len(cf_items) and np.array_equal(cf_items[:len(cb_ids)], cb_ids)
+    content_spec = spec["content_based"]
+    tfidf_matrix = _unflatten("cb.tfidf", arrays, matrices)
+    hasher = None
+    if "hasher" in content_spec:
+        hasher = HashedTfidf.from_state(arrays["cb.doc_freq"], content_spec["hasher"]["n_docs"],
+                                        content_spec["hasher"]["stop_words"], tfidf_matrix.dtype)
+
+    cf_model = CollaborativeFiltering.from_arrays(
+        arrays["cf.user_ids"], cf_items,
+        _unflatten("cf.ratings", arrays, matrices),
+        _unflatten("cf.similarity", arrays, matrices),
+        similarity_type=spec["collaborative"]["similarity_type"],
+    )
+    cb_model = ContentBasedFiltering.from_arrays(
+        cf_items if shared else cb_ids, tfidf_matrix,
+        similarity_matrix=_unflatten("cb.similarity", arrays, matrices),
+        neighbor_graph=_unflatten("cb.neighbors", arrays, matrices),
+        text_column=content_spec["text_column"],
+        hasher=hasher, term_counts=_unflatten("cb.term_counts", arrays, matrices),
+    )
+    hybrid_model = HybridRecommender(cf_model, cb_model, alpha=spec["hybrid"]["alpha"])
+    return cf_model, cb_model, hybrid_model
+
+
+def _flatten(name: str, matrix, arrays: dict, matrices: dict):
+    if sparse.issparse(matrix):
+        matrix = sparse.csr_matrix(matrix)
+        arrays[f"{name}.data"] = matrix.data
+        arrays[f"{name}.indices"] = matrix.indices
+        arrays[f"{name}.indptr"] = matrix.indptr
+        matrices[name] = {"format": "csr", "shape": list(matrix.shape)}
+    else:
+        arrays[name] = np.asarray(matrix)
+        matrices[name] = {"format": "dense", "shape": list(np.shape(matrix))}
+
+
+def _unflatten(name: str, arrays: dict, matrices: dict):
+    if name not in matrices:
+        return None
+    if matrices[name]["format"] == "csr":
+        return sparse.csr_matrix(
+            (arrays[f"{name}.data"], arrays[f"{name}.indices"], arrays[f"{name}.indptr"]),
+            shape=tuple(matrices[name]["shape"]), copy=False,
+        )
+    return arrays[name]
+
+# --------------------------
+# On-disk bundle
+# --------------------------
+
+def save_bundle(cf_model: CollaborativeFiltering, cb_model: ContentBasedFiltering,
+                hybrid_model: HybridRecommender, root: str = BUNDLE_DIR, version: str = None) -> str:
+    """
+    Write the models as a versioned directory of .npy files under root and
+    point root/CURRENT at it. Returns the bundle path.
+    """
+    version = version or time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(root, version)
+    os.makedirs(path, exist_ok=True)
+
+    arrays, spec = collect_arrays(cf_model, cb_model, hybrid_model)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array, allow_pickle=array.dtype == object)
+
+    manifest = {"format": BUNDLE_FORMAT, "version": version, "created_at": time.time(),
+                "arrays": sorted(arrays), **spec}
+    with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Switch CURRENT atomically so readers never see a half-written bundle
+    pointer = os.path.join(root, CURRENT_FILE)
+    with open(pointer + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+    logger.info(f"Model bundle {version} saved to {path}")
+    return path
+
+
+def current_bundle_path(root: str = BUNDLE_DIR):
+    """
+    Path of the bundle root/CURRENT points at, or None.
+    """
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return os.path.join(root, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def load_bundle(path: str = None, mmap_mode: str = "r"):
+    """
+    Open a bundle (the current one by default) and rebuild the models on top
+    of memory-mapped arrays, so startup does no parsing and pages are shared
+    between processes by the OS. Returns (cf_model, cb_model, hybrid_model, manifest).
+    """
+    path = path or current_bundle_path()
+    if path is None:
+        raise FileNotFoundError(f"No current model bundle under {BUNDLE_DIR}")
+
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest["format"] != BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported bundle format {manifest['format']} (expected {BUNDLE_FORMAT})")
+
+    arrays = {}
+    for name in manifest["arrays"]:
+        file_path = os.path.join(path, f"{name}.npy")
+        try:
+            arrays[name] = np.load(file_path, mmap_mode=mmap_mode)
+        except ValueError:
+            # Object arrays (e.g. string ids) cannot be memory-mapped
+            arrays[name] = np.load(file_path, allow_pickle=True)
+
+    cf_model, cb_model, hybrid_model = restore_models(arrays, manifest)
+    logger.info(f"Model bundle {manifest['version']} loaded from {path}")
+    return cf_model, cb_model, hybrid_model, manifest
@@ -0,0 +1,108 @@
+# app/services/batching.py
+
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RequestCoalescer:
+    """
+    Merges concurrent single-user requests into batched scoring calls.
+    The first request of a batch waits at most `window` seconds for others to
+    join (up to max_batch_size); the whole batch is then scored with one
+    batch_fn(user_ids, top_n) call and each caller's Future gets its own list.
+    Callers block on recommend() from request threads, or await
+    recommend_async() from an event loop.
+    """
+
+    def __init__(self, batch_fn, window: float = 0.002, max_batch_size: int = 64):
+        """
+        batch_fn: callable(user_ids, top_n) -> one result list per user, in order
+        """
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self.batch_sizes = metrics.histogram(
+            "coalescer_batch_size", metrics.SIZE_BUCKETS, "Requests merged per batch")
+        self.queue_wait = metrics.histogram(
+            "coalescer_queue_wait_seconds", metrics.LATENCY_BUCKETS, "Time a request waited for its batch")
+
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="request-coalescer", daemon=True)
+        self._worker.start()
+
+    def submit(self, user_id, top_n: int = 10) -> Future:
+        """
+        Queue one request; the Future resolves to its top-N list.
+        """
+        future = Future()
+        self._queue.put((user_id, top_n, time.monotonic(), future))
+        return future
+
+    def recommend(self, user_id, top_n: int = 10) -> list:
+        return self.submit(user_id, top_n).result()
+
+    async def recommend_async(self, user_id, top_n: int = 10) -> list:
+        return await asyncio.wrap_future(self.submit(user_id, top_n))
+
+    def close(self):
+        """
+        Stop the worker once the requests already queued are served.
+        """
+        self._queue.put(None)
+        self._worker.join()
+
+    def stats(self) -> dict:
+        return {"batch_size": self.batch_sizes.snapshot(), "queue_wait_seconds": self.queue_wait.snapshot()}
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, closing = [first], False
+            deadline = first[2] + self.window
+            while len(batch) < self.max_batch_size:
+                try:
+                    # Requests already queued join even after the deadline
+                    request = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    closing = True
+                    break
+                batch.append(request)
+            self._dispatch(batch)
+            if closing:
+                return
+
+    def _dispatch(self, batch: list):
+        batch = [request for request in batch if request[3].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        now = time.monotonic()
+        for _, _, queued_at, _ in batch:
+            self.queue_wait.observe(now - queued_at)
+        self.batch_sizes.observe(len(batch))
+
+        # One call at the widest top_n; narrower requests get a prefix
+        try:
+            results = self.batch_fn([user_id for user_id, _, _, _ in batch],
+                                    max(top_n for _, top_n, _, _ in batch))
+        except Exception as e:
+            logger.error(f"Batched scoring failed for {len(batch)} requests: {e}")
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, top_n, _, future), result in zip(batch, results):
+            future.set_result(result[:top_n])
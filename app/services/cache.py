@@ -0,0 +1,110 @@
+# app/services/cache.py
+
+import time
+import threading
+from collections import OrderedDict, defaultdict
+
+# Rough in-memory cost of one cached (item_id, score) pair and of one entry
+ITEM_BYTES = 120
+ENTRY_BYTES = 200
+
+
+class ResultCache:
+    """
+    Bounded cache of recommendation lists keyed by (kind, id, top_n, variant).
+    Entries expire after ttl seconds; least recently used entries are evicted
+    once max_entries or max_bytes is exceeded. A lookup for a smaller top_n is
+    answered by slicing a cached longer list for the same (kind, id, variant).
+    A variant (e.g. an item filter) is a hashable qualifier of the list; the
+    variants of one (kind, id) are invalidated together.
+    """
+
+    def __init__(self, max_entries: int = 100_000, ttl: float = 300.0, max_bytes: int = 256 * 2 ** 20):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()           # (kind, id, top_n, variant) -> (expires_at, size, value)
+        self._top_ns = defaultdict(set)         # (kind, id) -> cached (top_n, variant) pairs
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, kind: str, key_id, top_n: int, variant=None):
+        """
+        Cached top-N list, or None on a miss.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached_ns = (n for n, cached_variant in self._top_ns.get((kind, key_id), ())
+                         if n >= top_n and cached_variant == variant)
+            for cached_n in sorted(cached_ns):
+                key = (kind, key_id, cached_n, variant)
+                expires_at, _, value = self._entries[key]
+                if expires_at <= now:
+                    self._remove(key)
+                    self.expirations += 1
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value[:top_n]
+            self.misses += 1
+            return None
+
+    def put(self, kind: str, key_id, top_n: int, value: list, variant=None):
+        size = ENTRY_BYTES + ITEM_BYTES * len(value)
+        if size > self.max_bytes:
+            return
+        key = (kind, key_id, top_n, variant)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, list(value))
+            self._top_ns[(kind, key_id)].add((top_n, variant))
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, kind: str, key_id):
+        """
+        Drop every cached top_n and variant for (kind, id), e.g. after a user's ratings change.
+        """
+        with self._lock:
+            for top_n, variant in list(self._top_ns.get((kind, key_id), ())):
+                self._remove((kind, key_id, top_n, variant))
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._top_ns.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        owner = key[:2]
+        self._top_ns[owner].discard(key[2:])
+        if not self._top_ns[owner]:
+            del self._top_ns[owner]
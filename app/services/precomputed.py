@@ -0,0 +1,127 @@
+# app/services/precomputed.py
+
+import os
+import json
+import time
+import shutil
+import logging
+import numpy as np
+
+from app.data.id_mapper import IdMapper
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+
+
+class PrecomputedStore:
+    """
+    Fixed-width top-N results per user, stored as memory-mapped .npy arrays:
+      user_ids.npy  (n_users,)          row -> user_id
+      item_ids.npy  (n_items,)          item position -> item_id
+      items.npy     (n_users, top_n)    item positions, -1 padded
+      scores.npy    (n_users, top_n)    float32 scores, NaN padded
+    """
+
+    def __init__(self, path: str, user_ids: np.ndarray, item_ids: np.ndarray,
+                 items: np.ndarray, scores: np.ndarray, created_at: float):
+        self.path = path
+        self.user_index = IdMapper.from_ids(user_ids)
+        self.item_ids = item_ids
+        self.items = items
+        self.scores = scores
+        self.created_at = created_at
+
+    @property
+    def top_n(self) -> int:
+        return self.items.shape[1]
+
+    @classmethod
+    def create(cls, path: str, user_ids, item_ids, top_n: int) -> "PrecomputedStore":
+        """
+        Allocate an empty store on disk; rows are filled through the memmaps.
+        Call finalize() once every row is written.
+        """
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+
+        user_ids, item_ids = np.asarray(user_ids), np.asarray(item_ids)
+        np.save(os.path.join(path, "user_ids.npy"), user_ids)
+        np.save(os.path.join(path, "item_ids.npy"), item_ids)
+        shape = (len(user_ids), top_n)
+        items = np.lib.format.open_memmap(
+            os.path.join(path, "items.npy"), mode="w+", dtype=np.int32, shape=shape)
+        scores = np.lib.format.open_memmap(
+            os.path.join(path, "scores.npy"), mode="w+", dtype=np.float32, shape=shape)
+        items[:] = -1
+        scores[:] = np.nan
+        return cls(path, user_ids, item_ids, items, scores, created_at=None)
+
+    def finalize(self, target: str = None):
+        """
+        Flush the arrays and write the metadata that marks the store complete.
+        If target is given, the store is moved there, replacing any previous one.
+        """
+        self.items.flush()
+        self.scores.flush()
+        self.created_at = time.time()
+        with open(os.path.join(self.path, META_FILE), "w") as f:
+            json.dump({"created_at": self.created_at, "top_n": self.top_n,
+                       "n_users": len(self.user_index)}, f)
+
+        if target is not None and target != self.path:
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.replace(self.path, target)
+            self.path = target
+        logger.info(f"Precomputed store written to {self.path}")
+
+    @classmethod
+    def open(cls, path: str):
+        """
+        Open a finished store read-only with mmap; returns None if there is none.
+        """
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            return cls(
+                path,
+                np.load(os.path.join(path, "user_ids.npy")),
+                np.load(os.path.join(path, "item_ids.npy")),
+                np.load(os.path.join(path, "items.npy"), mmap_mode="r"),
+                np.load(os.path.join(path, "scores.npy"), mmap_mode="r"),
+                created_at=meta["created_at"],
+            )
+        except Exception as e:
+            logger.error(f"Error opening precomputed store at {path}: {e}")
+        return None
+
+    def age(self) -> float:
+        """
+        Seconds since the store was finalized.
+        """
+        return time.time() - self.created_at
+
+    def write_rows(self, start: int, items: np.ndarray, scores: np.ndarray):
+        """
+        Write a block of consecutive user rows.
+        """
+        self.items[start:start + len(items)] = items
+        self.scores[start:start + len(scores)] = scores
+
+    def lookup(self, user_id, top_n: int):
+        """
+        O(1) lookup of a user's stored top-N as (item_id, score) pairs.
+        Returns None if the user is missing or top_n exceeds the stored width.
+        """
+        row = self.user_index.get(user_id)
+        if top_n > self.top_n or row < 0:
+            return None
+        positions = self.items[row, :top_n]
+        positions = positions[positions >= 0]
+        scores = self.scores[row, :len(positions)]
+        return list(zip(self.item_ids[positions].tolist(), scores.astype(float).tolist()))
@@ -1,43 +1,443 @@
 # app/services/recommender_service.py
 
+from app.data.load_data import clean_items_data, load_items_data, load_ratings_chunked
+from app.models.attributes import AttributeIndex
 from app.models.collaborative import CollaborativeFiltering
 from app.models.content_based import ContentBasedFiltering
 from app.models.hybrid import HybridRecommender
+from app.models.popularity import PopularityRanker
+from app.models.retrieval import RetrievalPipeline
+from app.models.similarity import load_neighbor_graph
+from app.services.artifacts import current_bundle_path, load_bundle
+from app.services.batching import RequestCoalescer
+from app.services.cache import ResultCache
+from app.services.precomputed import PrecomputedStore
+from app.services.shared_models import SharedModelClient
+from app.config import (
+    BUNDLE_DIR,
+    PRECOMPUTED_DIR,
+    PRECOMPUTED_MAX_AGE,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_TTL,
+    RESULT_CACHE_MAX_BYTES,
+    MICRO_BATCHING,
+    BATCH_WINDOW,
+    BATCH_MAX_SIZE,
+    SHARED_MODELS,
+    SHARED_MODELS_NAME,
+    RETRIEVAL_PIPELINES,
+    MIN_RATINGS_TO_PERSONALIZE,
+    FALLBACK_RANKING,
+    CONTENT_NUM_NEIGHBORS,
+    CONTENT_NEIGHBORS_FILE,
+    ANN_NUM_LISTS,
+    ANN_NUM_PROBE,
+    ANN_MIN_ITEMS,
+    ANN_CONTENT_FILE,
+    RATINGS_FILE,
+    ITEMS_FILE,
+    DUMMY_DATA
+)
+import os
+import asyncio
+import logging
 import pandas as pd
 
+logger = logging.getLogger(__name__)
+
 class RecommenderService:
-    def __init__(self):
+    def __init__(self, precomputed_dir: str = PRECOMPUTED_DIR, bundle_dir: str = BUNDLE_DIR,
+                 micro_batching: bool = MICRO_BATCHING, shared_models: bool = SHARED_MODELS,
+                 ann_min_items: int = ANN_MIN_ITEMS, dummy_data: bool = DUMMY_DATA):
         """
         Initializes and loads models + data.
-        In production, this can load pre-trained models from disk.
+        Models come from the current memory-mapped bundle under bundle_dir when
+        there is one (see scripts/build_bundle.py), otherwise they are built from data.
+        precomputed_dir: output of scripts/generate_recommendations.py, served
+            before falling back to live scoring (None disables it)
+        micro_batching: merge concurrent live recommend_for_user calls into
+            batched scoring through a RequestCoalescer
+        shared_models: attach zero-copy to the models a loader process publishes
+            in shared memory and follow its generation counter
+        ann_min_items: catalogs with at least this many items answer similar-item
+            requests from an IVF index (None: always exact)
+        dummy_data: build from a tiny built-in dataset instead of RATINGS_FILE
+            and ITEMS_FILE (tests and local development only); otherwise a
+            missing or unusable data file raises
+        Endpoints listed in RETRIEVAL_PIPELINES score only retrieved candidates.
+        Users with fewer than MIN_RATINGS_TO_PERSONALIZE ratings get a
+        precomputed popularity ranking instead of live scoring.
+        Item filters (e.g. {"genre": "comedy", "year": "1990-1999"}) need the
+        item metadata, so they are available when models are built from data.
         """
-        # Example datasets (replace with real loading logic)
-        self.ratings_df = self._load_ratings_data()
-        self.items_df = self._load_items_data()
+        self.bundle_version = None
+        self.shared_models = None
+        self.ann_min_items = ann_min_items
+        self.dummy_data = dummy_data
+        bundle_path = current_bundle_path(bundle_dir) if bundle_dir and not shared_models else None
+        if shared_models:
+            self.ratings_df = self.items_df = None
+            self.shared_models = SharedModelClient(SHARED_MODELS_NAME)
+            if not self.shared_models.refresh():
+                raise FileNotFoundError(f"No models published under {SHARED_MODELS_NAME}")
+            self._use_shared_models()
+        elif bundle_path is not None:
+            self.ratings_df = self.items_df = None
+            self.cf_model, self.cb_model, self.hybrid_model, manifest = load_bundle(bundle_path)
+            self.bundle_version = manifest["version"]
+        else:
+            self._build_models()
+        self._attach_ann_index()
+
+        self.pipelines = {}
+        self._build_pipelines()
+        self._build_popularity()
+        self.attributes = None
+        if self.items_df is not None:
+            self.attributes = AttributeIndex(self.items_df, self.cb_model.item_index)
+
+        # Offline top-N results, plus users whose ratings changed since they were built
+        self.precomputed = PrecomputedStore.open(precomputed_dir) if precomputed_dir else None
+        self.stale_users = set()
+
+        # Recent results for hot users and items
+        self.cache = ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL, RESULT_CACHE_MAX_BYTES)
+
+        self.coalescer = None
+        if micro_batching:
+            self.coalescer = RequestCoalescer(
+                lambda user_ids, top_n: self.hybrid_model.recommend_for_users(user_ids, top_n),
+                window=BATCH_WINDOW, max_batch_size=BATCH_MAX_SIZE,
+            )
 
-        # Initialize model instances
-        self.cf_model = CollaborativeFiltering(self.ratings_df, similarity_type="user")
-        self.cb_model = ContentBasedFiltering(self.items_df, text_column="description")
+    def _build_models(self):
+        # Ratings and item metadata from the data CSVs (dummy sets only when asked for)
+        if self.dummy_data:
+            self.ratings_df, self.items_df = self._dummy_ratings_data(), self._dummy_items_data()
+        else:
+            self.ratings_df = self._load_ratings_data()
+            self.items_df = self._load_items_data()
+
+        # Initialize model instances on one shared item id mapping
+        self.cb_model = ContentBasedFiltering(self.items_df, text_column="description",
+                                              num_neighbors=CONTENT_NUM_NEIGHBORS,
+                                              neighbor_graph=self._saved_neighbor_graph())
+        self.cf_model = CollaborativeFiltering(self.ratings_df, similarity_type="user",
+                                               item_mapper=self.cb_model.item_index)
         self.hybrid_model = HybridRecommender(self.cf_model, self.cb_model, alpha=0.7)
 
-    def recommend_for_user(self, user_id: int, top_n: int = 10) -> list:
+    def _saved_neighbor_graph(self):
+        """
+        Content kNN graph saved by scripts/train_content_based.py, when it was
+        built for these items; otherwise None and the model builds its own.
+        """
+        if not os.path.exists(CONTENT_NEIGHBORS_FILE):
+            return None
+        return load_neighbor_graph(CONTENT_NEIGHBORS_FILE, pd.unique(self.items_df["item_id"]))
+
+    def _attach_ann_index(self):
+        """
+        IVF index over the served content model's own TF-IDF rows: the one
+        saved by scripts/build_ann_index.py when it was built for these rows,
+        otherwise a new one. Smaller catalogs keep exact search.
+        """
+        n_items = self.cb_model.tfidf_matrix.shape[0]
+        if self.ann_min_items is None or n_items < self.ann_min_items:
+            return
+        if os.path.exists(ANN_CONTENT_FILE) and self.cb_model.load_ann_index(ANN_CONTENT_FILE) is not None:
+            return
+        self.cb_model.build_ann_index(ANN_NUM_LISTS, ANN_NUM_PROBE)
+
+    def _build_pipelines(self):
+        """
+        Two-stage retrieval pipelines of the endpoints configured for it.
+        """
+        self.pipelines = {
+            endpoint: RetrievalPipeline(self.hybrid_model, limits, self.ratings_df, name=endpoint)
+            for endpoint, limits in RETRIEVAL_PIPELINES.items() if limits
+        }
+
+    def _build_popularity(self):
+        """
+        Fallback rankings: global, per-genre and trending from the ratings,
+        or global counts from the CF model when only a bundle is loaded.
+        """
+        if self.ratings_df is not None:
+            self.popularity = PopularityRanker(self.ratings_df, self.items_df, item_mapper=self.cb_model.item_index)
+        else:
+            n_items = self.cf_model.user_item_matrix.shape[1]
+            self.popularity = PopularityRanker.from_counts(self.cf_model.item_index[:n_items],
+                                                           self.cf_model.item_counts())
+
+    def _use_shared_models(self):
+        self.cf_model, self.cb_model, self.hybrid_model = self.shared_models.models
+        self.bundle_version = self.shared_models.version
+
+    def _sync_models(self):
+        """
+        Switch to a newly published shared-memory generation, if any.
+        Results cached from the previous generation are dropped.
+        """
+        if self.shared_models is not None and self.shared_models.refresh():
+            self._use_shared_models()
+            self._attach_ann_index()
+            self._build_pipelines()
+            self._build_popularity()
+            self.cache.clear()
+
+    def recommend_for_user(self, user_id: int, top_n: int = 10, filters: dict = None) -> list:
         """
         Returns top-N hybrid recommendations for a user.
+        Served from the result cache, then the precomputed store, before live scoring.
+        filters: item attribute filters, applied inside the top-N selection
+        """
+        variant, recommendations = self._lookup_user(user_id, top_n, filters)
+        if recommendations is not None:
+            return recommendations
+        if self._coalesced(variant):
+            recommendations = self.coalescer.recommend(user_id, top_n)
+        else:
+            recommendations = self._score_user(user_id, top_n, filters)
+        self.cache.put("user", user_id, top_n, recommendations, variant)
+        return recommendations
+
+    async def recommend_for_user_async(self, user_id: int, top_n: int = 10, filters: dict = None) -> list:
+        """
+        recommend_for_user for asyncio servers: live scoring is awaited through
+        the coalescer, or runs on the default executor, instead of blocking the
+        event loop.
+        """
+        variant, recommendations = self._lookup_user(user_id, top_n, filters)
+        if recommendations is not None:
+            return recommendations
+        if self._coalesced(variant):
+            recommendations = await self.coalescer.recommend_async(user_id, top_n)
+        else:
+            loop = asyncio.get_running_loop()
+            recommendations = await loop.run_in_executor(None, self._score_user, user_id, top_n, filters)
+        self.cache.put("user", user_id, top_n, recommendations, variant)
+        return recommendations
+
+    def _lookup_user(self, user_id: int, top_n: int, filters: dict = None):
+        """
+        (cache variant, top-N) of a user served without live scoring: cached,
+        precomputed or the fallback ranking. The top-N is None when it must be scored.
+        """
+        self._sync_models()
+        variant = self._filter_key(filters)
+        recommendations = self._lookup_stored(user_id, top_n, variant)
+        if recommendations is None:
+            recommendations = self._fallback(user_id, top_n, filters)
+        return variant, recommendations
+
+    def _coalesced(self, variant) -> bool:
+        """
+        Whether live scoring goes through the coalescer, whose batches are
+        unfiltered whole-catalog scoring.
+        """
+        return self.coalescer is not None and variant is None and "user" not in self.pipelines
+
+    def _score_user(self, user_id: int, top_n: int, filters: dict = None) -> list:
+        """
+        Live top-N of one user: filtered, through the retrieval pipeline, or full hybrid scoring.
         """
+        if filters:
+            return self._recommend_filtered(user_id, top_n, filters)
+        if "user" in self.pipelines:
+            return self.pipelines["user"].recommend_for_user(user_id, top_n)
         return self.hybrid_model.recommend_for_user(user_id, top_n)
 
-    def recommend_similar_items(self, item_id: int, top_n: int = 10) -> list:
+    def _lookup_stored(self, user_id: int, top_n: int, variant=None):
+        """
+        Cached or precomputed top-N for a user, or None if it must be scored live.
+        Precomputed results are unfiltered, so filtered lookups only use the cache.
+        """
+        cached = self.cache.get("user", user_id, top_n, variant)
+        if cached is not None or variant is not None:
+            return cached
+
+        recommendations = self._lookup_precomputed(user_id, top_n)
+        if recommendations is not None:
+            self.cache.put("user", user_id, top_n, recommendations)
+        return recommendations
+
+    def _filter_key(self, filters: dict):
+        """
+        Cache variant of an item filter, or None without one.
+        Raises ValueError for filters that cannot be served.
+        """
+        if not filters:
+            return None
+        if self.attributes is None:
+            raise ValueError("Item filters need item metadata, which is not loaded")
+        return self.attributes.key(filters)
+
+    def _allowed(self, filters: dict, n_items: int):
+        """
+        Item filter mask over the first n_items shared item positions, or None without filters.
+        """
+        return self.attributes.mask(filters, n_items) if filters else None
+
+    def _recommend_filtered(self, user_id: int, top_n: int, filters: dict) -> list:
+        """
+        Live top-N with the filter mask applied inside the selection
+        (coalesced batches are unfiltered, so they are bypassed).
+        """
+        allowed = self._allowed(filters, len(self.hybrid_model.item_ids))
+        return self.pipelines.get("user", self.hybrid_model).recommend_for_user(user_id, top_n, allowed)
+
+    def _fallback(self, user_id: int, top_n: int, filters: dict = None):
+        """
+        Popularity top-N for a user with too few ratings to personalize, or None.
+        Users with a few ratings get the ranking of their items' most common
+        genre, without the items they rated.
+        """
+        row = self.cf_model.user_rows([user_id])
+        if self.cf_model.rating_counts(row)[0] >= MIN_RATINGS_TO_PERSONALIZE:
+            return None
+        rated = self.cf_model.item_index[self.cf_model.rating_rows(row).indices] if row[0] >= 0 else []
+        segment = self.popularity.segment_of(rated) if len(rated) else None
+        allowed = self._allowed(filters, len(self.popularity.counts))
+        return self.popularity.recommend(top_n, FALLBACK_RANKING, segment, exclude=rated, allowed=allowed)
+
+    def _lookup_precomputed(self, user_id: int, top_n: int):
+        if self.precomputed is None:
+            return None
+        if self.precomputed.age() > PRECOMPUTED_MAX_AGE:
+            # An expired store is never served again, so neither are its stale marks needed
+            self.precomputed = None
+            self.stale_users.clear()
+            return None
+        if user_id in self.stale_users:
+            return None
+        return self.precomputed.lookup(user_id, top_n)
+
+    def mark_user_updated(self, user_id: int):
+        """
+        Drop cached and precomputed results for a user whose ratings changed.
+        Only users the store holds are marked, so the set stays within its size.
+        """
+        if self.precomputed is not None and user_id in self.precomputed.user_index:
+            self.stale_users.add(user_id)
+        self.cache.invalidate("user", user_id)
+
+    def apply_ratings(self, delta_df: pd.DataFrame):
+        """
+        Apply new or changed ratings [user_id, item_id, rating] to the live models
+        incrementally and invalidate the affected users' results.
+        """
+        delta_df = delta_df.drop_duplicates(["user_id", "item_id"], keep="last")
+        previous = self.cf_model.stored_ratings(delta_df["user_id"], delta_df["item_id"])
+        self.cf_model.apply_ratings(delta_df)
+        self.hybrid_model.align_items()
+        # Only new pairs are rating events; edits leave the counts alone
+        rated = delta_df["rating"].to_numpy() != 0
+        self.popularity.update(delta_df[(previous == 0) & rated], removed_df=delta_df[(previous != 0) & ~rated])
+        for pipeline in self.pipelines.values():
+            pipeline.update(delta_df, previous)
+        for user_id in delta_df["user_id"].unique().tolist():
+            self.mark_user_updated(user_id)
+
+    def add_items(self, items_df: pd.DataFrame):
+        """
+        Add or update items [item_id, description] in the live content model
+        without a refit. Needs CONTENT_FEATURES = "hashed" (also for models
+        served from a bundle or shared memory, which carry the hasher state);
+        a fitted "tfidf" vocabulary cannot take new terms, so it raises
+        ValueError. Neighbor lists of other items can change too, so every
+        cached result is dropped.
+        """
+        self.cb_model.add_items(items_df)
+        self.hybrid_model.align_items()
+        if self.attributes is not None:
+            self.attributes.update(items_df)
+        for pipeline in self.pipelines.values():
+            pipeline.align_items()
+        self.cache.clear()
+
+    def recommend_for_users(self, user_ids: list, top_n: int = 10, filters: dict = None) -> list:
+        """
+        Returns top-N hybrid recommendations for a batch of users, in input order.
+        Each user is looked up like in recommend_for_user (cache, precomputed
+        store, fallback ranking for users with too few ratings); only the rest
+        are scored, as one batch.
+        filters: item attribute filters shared by the whole batch
+        """
+        self._sync_models()
+        variant = self._filter_key(filters)
+        results = [self._lookup_stored(user_id, top_n, variant) for user_id in user_ids]
+        for pos, user_id in enumerate(user_ids):
+            if results[pos] is None:
+                results[pos] = self._fallback(user_id, top_n, filters)
+        missing = [pos for pos, cached in enumerate(results) if cached is None]
+        if missing:
+            scorer = self.pipelines.get("users", self.hybrid_model)
+            allowed = self._allowed(filters, len(self.hybrid_model.item_ids))
+            batch = scorer.recommend_for_users([user_ids[pos] for pos in missing], top_n, allowed)
+            for pos, recommendations in zip(missing, batch):
+                results[pos] = recommendations
+                self.cache.put("user", user_ids[pos], top_n, recommendations, variant)
+        return results
+
+    def recommend_similar_items(self, item_id: int, top_n: int = 10, filters: dict = None) -> list:
         """
         Returns top-N content-based similar items.
+        filters: item attribute filters, applied inside the top-N selection
+        """
+        self._sync_models()
+        variant = self._filter_key(filters)
+        cached = self.cache.get("item", item_id, top_n, variant)
+        if cached is not None:
+            return cached
+
+        allowed = self._allowed(filters, self.cb_model.tfidf_matrix.shape[0])
+        recommendations = self.cb_model.recommend_similar_items(item_id, top_n, allowed)
+        self.cache.put("item", item_id, top_n, recommendations, variant)
+        return recommendations
+
+    def cache_stats(self) -> dict:
+        """
+        Hit/miss/eviction counters of the result cache.
         """
-        return self.cb_model.recommend_similar_items(item_id, top_n)
+        return self.cache.stats()
 
-    # 🔽 Dummy dataset loading functions below (replace in production)
+    def batching_stats(self) -> dict:
+        """
+        Batch-size and queue-wait histograms of the request coalescer.
+        """
+        if self.coalescer is None:
+            return {"enabled": False}
+        return {"enabled": True, "window": self.coalescer.window,
+                "max_batch_size": self.coalescer.max_batch_size, **self.coalescer.stats()}
+
+    # 🔽 Dataset loading (dummy datasets for tests and local development)
 
     def _load_ratings_data(self) -> pd.DataFrame:
+        """
+        Ratings [user_id, item_id, rating, timestamp] streamed from RATINGS_FILE
+        with compact dtypes (see load_ratings_chunked). A missing, unreadable
+        or empty file is logged and raised rather than served as dummy data.
+        """
+        ratings_df = load_ratings_chunked(RATINGS_FILE, strict=True)
+        if ratings_df.empty:
+            logger.error(f"No valid ratings in {RATINGS_FILE}")
+            raise ValueError(f"No valid ratings in {RATINGS_FILE}")
+        return ratings_df
+
+    def _load_items_data(self) -> pd.DataFrame:
+        """
+        Cleaned item metadata from ITEMS_FILE; like the ratings, a missing,
+        unreadable or empty file is logged and raised.
+        """
+        items_df = clean_items_data(load_items_data(ITEMS_FILE, strict=True))
+        if items_df.empty:
+            logger.error(f"No valid items in {ITEMS_FILE}")
+            raise ValueError(f"No valid items in {ITEMS_FILE}")
+        return items_df
+
+    def _dummy_ratings_data(self) -> pd.DataFrame:
         """
         Dummy ratings DataFrame with [user_id, item_id, rating]
-        Replace with real data loading logic (e.g., from database, CSV, etc.)
         """
         data = {
             "user_id": [1, 1, 2, 2, 3],
@@ -46,10 +446,9 @@ class RecommenderService:
         }
         return pd.DataFrame(data)
 
-    def _load_items_data(self) -> pd.DataFrame:
+    def _dummy_items_data(self) -> pd.DataFrame:
         """
         Dummy items DataFrame with [item_id, description]
-        Replace with real metadata (e.g., title, genre, description, etc.)
         """
         data = {
             "item_id": [101, 102, 103, 104],
@@ -0,0 +1,192 @@
+# app/services/shared_models.py
+
+import json
+import struct
+import logging
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+from app.services.artifacts import collect_arrays, restore_models
+from app.config import SHARED_MODELS_NAME
+
+logger = logging.getLogger(__name__)
+
+# Control segment: [sequence: int64][manifest length: int64][manifest JSON]
+CONTROL_SIZE = 1 << 20
+HEADER = struct.Struct("<qq")
+ALIGNMENT = 64
+
+
+class SharedModelPublisher:
+    """
+    Loader side: copies the model arrays of each new model version into one
+    shared-memory segment and announces it through a small control segment.
+    The control segment holds a sequence counter (odd while a manifest is
+    being written), so readers never see a half-written manifest; the model
+    generation is sequence // 2.
+    """
+
+    def __init__(self, name: str = SHARED_MODELS_NAME):
+        self.name = name
+        try:
+            self.control = shared_memory.SharedMemory(name=f"{name}-control", create=True, size=CONTROL_SIZE)
+            HEADER.pack_into(self.control.buf, 0, 0, 0)
+        except FileExistsError:
+            # Take over from a previous loader; workers keep their generation
+            self.control = shared_memory.SharedMemory(name=f"{name}-control")
+        self._segments = []
+
+    @property
+    def generation(self) -> int:
+        return HEADER.unpack_from(self.control.buf, 0)[0] // 2
+
+    def publish(self, cf_model, cb_model, hybrid_model, version: str = None) -> int:
+        """
+        Publish a model version and return its generation number.
+        The segment of the previous generation stays until the next publish,
+        so workers that are switching can still attach to it.
+        """
+        arrays, spec = collect_arrays(cf_model, cb_model, hybrid_model)
+        generation = self.generation + 1
+        segment_name = f"{self.name}-g{generation}"
+
+        layout, size = {}, 0
+        for array_name, array in arrays.items():
+            array = _shareable(array)
+            arrays[array_name] = array
+            layout[array_name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": size}
+            size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+        segment = shared_memory.SharedMemory(name=segment_name, create=True, size=max(size, 1))
+        for array_name, array in arrays.items():
+            entry = layout[array_name]
+            target = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf, offset=entry["offset"])
+            target[...] = array
+
+        manifest = json.dumps({"generation": generation, "segment": segment_name, "version": version,
+                               "arrays": layout, **spec}).encode()
+        if HEADER.size + len(manifest) > CONTROL_SIZE:
+            segment.close()
+            segment.unlink()
+            raise ValueError(f"Model manifest of {len(manifest)} bytes does not fit the control segment")
+
+        # Sequence goes odd, manifest is written, sequence goes even again
+        sequence = HEADER.unpack_from(self.control.buf, 0)[0]
+        HEADER.pack_into(self.control.buf, 0, sequence + 1, 0)
+        self.control.buf[HEADER.size:HEADER.size + len(manifest)] = manifest
+        HEADER.pack_into(self.control.buf, 0, sequence + 2, len(manifest))
+
+        self._segments.append(segment)
+        while len(self._segments) > 2:
+            self._release(self._segments.pop(0))
+        logger.info(f"Published model generation {generation} ({size / 2 ** 20:.1f} MB) as {segment_name}")
+        return generation
+
+    def close(self):
+        """
+        Remove every segment; attached workers keep their mappings until they exit.
+        """
+        for segment in self._segments:
+            self._release(segment)
+        self._segments = []
+        self.control.close()
+        self.control.unlink()
+
+    @staticmethod
+    def _release(segment: shared_memory.SharedMemory):
+        segment.close()
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedModelClient:
+    """
+    Worker side: attaches to the published arrays zero-copy and rebuilds
+    read-only models on top of them. refresh() is cheap (one read of the
+    control header) and switches to a new generation when one is published.
+    """
+
+    def __init__(self, name: str = SHARED_MODELS_NAME):
+        self.name = name
+        self.control = _attach(f"{name}-control")
+        self.generation = 0
+        self.version = None
+        self.models = None
+        self._segment = None
+        self._retired = []
+
+    def published_generation(self) -> int:
+        return HEADER.unpack_from(self.control.buf, 0)[0] // 2
+
+    def refresh(self) -> bool:
+        """
+        Attach to the latest generation if it changed. Returns True on a switch.
+        """
+        if self.published_generation() == self.generation:
+            return False
+
+        manifest = self._read_manifest()
+        segment = _attach(manifest["segment"])
+        arrays = {}
+        for array_name, entry in manifest["arrays"].items():
+            array = np.ndarray(tuple(entry["shape"]), dtype=np.dtype(entry["dtype"]),
+                               buffer=segment.buf, offset=entry["offset"])
+            array.flags.writeable = False
+            arrays[array_name] = array
+
+        self.models = restore_models(arrays, manifest)
+        if self._segment is not None:
+            self._retired.append(self._segment)
+        self._segment = segment
+        self.generation, self.version = manifest["generation"], manifest["version"]
+        self._close_retired()
+        logger.info(f"Attached to shared model generation {self.generation}")
+        return True
+
+    def _read_manifest(self) -> dict:
+        while True:
+            sequence, length = HEADER.unpack_from(self.control.buf, 0)
+            if sequence % 2 == 0 and length:
+                manifest = bytes(self.control.buf[HEADER.size:HEADER.size + length])
+                if HEADER.unpack_from(self.control.buf, 0)[0] == sequence:
+                    return json.loads(manifest)
+            if sequence == 0:
+                raise FileNotFoundError(f"No models published under {self.name}")
+
+    def _close_retired(self):
+        """
+        Unmap older generations once no arrays from them are referenced any more.
+        """
+        still_used = []
+        for segment in self._retired:
+            try:
+                segment.close()
+            except BufferError:
+                still_used.append(segment)
+        self._retired = still_used
+
+
+def _shareable(array: np.ndarray) -> np.ndarray:
+    """
+    Contiguous, fixed-width copy of an array; object ids (e.g. strings) become unicode.
+    """
+    array = np.asarray(array)
+    if array.dtype == object:
+        array = array.astype(str)
+    return np.ascontiguousarray(array)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to an existing segment without letting this process's resource
+    tracker unlink it on exit (the publisher owns its lifetime).
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always registers attached segments
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
@@ -19,6 +19,15 @@ os.makedirs(MODEL_DIR, exist_ok=True)
 
 RATINGS_FILE = os.path.join(DATA_DIR, 'ratings.csv')
 ITEMS_FILE = os.path.join(DATA_DIR, 'items.csv')
+DUMMY_DATA = os.environ.get("RECSYS_DUMMY_DATA") == "1"   # Build from a tiny built-in dataset instead (tests/dev only)
+
+# -----------------------------
+# PRECISION & MEMORY BUDGET
+# -----------------------------
+
+PRECISION = "float32"         # Float dtype of every model matrix: "float32" or "float64"
+MEMORY_BUDGET = None          # Peak bytes a model build may use (None: no limit), e.g. 8 * 1024 ** 3
+MEMORY_BUDGET_ACTION = "adapt"   # Over budget: "adapt" (sparse CF / blockwise kNN content) or "refuse"
 
 # -----------------------------
 # COLLABORATIVE FILTERING
@@ -34,8 +43,36 @@ LEARNING_RATE = 0.01
 # -----------------------------
 
 TFIDF_MAX_FEATURES = 1000
+CONTENT_FEATURES = "tfidf"    # "tfidf" (fitted vocabulary) or "hashed" (incremental, supports add_items)
+HASHING_N_FEATURES = 2 ** 18  # Hash buckets of the "hashed" features
+CONTENT_VECTORIZE_JOBS = os.cpu_count()   # Processes hashing large batches of descriptions
 TFIDF_MATRIX_FILE = os.path.join(MODEL_DIR, 'tfidf_matrix.npz')
 TFIDF_VECTORIZER_FILE = os.path.join(MODEL_DIR, 'tfidf_vectorizer.pkl')
+CONTENT_NUM_NEIGHBORS = 50    # Neighbors kept per item in the kNN graph
+CONTENT_NEIGHBORS_FILE = os.path.join(MODEL_DIR, 'content_neighbors.npz')
+CONTENT_BLOCKS_DIR = os.path.join(MODEL_DIR, 'content_blocks')   # Reduced kNN blocks of the offline build
+SIMILARITY_N_JOBS = os.cpu_count()   # Threads computing similarity blocks
+SIMILARITY_MEMORY_LIMIT = 1024 * 1024 * 1024   # Bytes of dense similarity blocks in flight
+
+# -----------------------------
+# APPROXIMATE NEAREST NEIGHBORS
+# -----------------------------
+
+ANN_NUM_LISTS = 256           # k-means lists in the IVF index
+ANN_NUM_PROBE = 8             # Lists scanned per query (recall/latency knob)
+ANN_MIN_ITEMS = 10_000        # Catalogs with fewer items are searched exactly (no index is served)
+ANN_ITEM_FACTORS_FILE = os.path.join(MODEL_DIR, 'ann_item_factors.npz')
+ANN_CONTENT_FILE = os.path.join(MODEL_DIR, 'ann_content.npz')
+
+# -----------------------------
+# EVALUATION
+# -----------------------------
+
+EVAL_TOP_K = 10               # Cutoff of precision/recall/NDCG/MAP
+EVAL_RELEVANCE_THRESHOLD = 4.0   # Test ratings at or above this count as relevant
+EVAL_FOLDS = 5
+EVAL_BATCH_SIZE = 512         # Users scored per block
+EVAL_WORKERS = os.cpu_count()
 
 # -----------------------------
 # HYBRID MODEL
@@ -43,6 +80,74 @@ TFIDF_VECTORIZER_FILE = os.path.join(MODEL_DIR, 'tfidf_vectorizer.pkl')
 
 HYBRID_MODEL_FILE = os.path.join(MODEL_DIR, 'hybrid_model.pkl')
 
+# -----------------------------
+# COLD START & FALLBACK
+# -----------------------------
+
+MIN_RATINGS_TO_PERSONALIZE = 5   # Users with fewer ratings get the fallback ranking
+FALLBACK_RANKING = "trending"     # "popular" or "trending"
+POPULARITY_TOP_N = 100        # Width of each precomputed popularity ranking
+POPULARITY_SEGMENT_COLUMN = "genre"   # Item column with per-segment rankings
+TRENDING_HALF_LIFE_DAYS = 7   # Age at which a rating counts half towards trending
+
+# -----------------------------
+# ITEM FILTERS
+# -----------------------------
+
+ITEM_FILTER_COLUMNS = ("genre", "year", "category")   # Item columns accepted as ?genre=...&year=... filters
+FILTER_MASK_CACHE = 256       # Decoded filter masks kept for repeated filters
+
+# -----------------------------
+# CANDIDATE RETRIEVAL
+# -----------------------------
+
+RETRIEVAL_PIPELINES = {       # Endpoint -> candidate limit per source; None scores the whole catalog
+    "user": None,             # e.g. {"cf": 200, "content": 100, "popular": 50}
+    "users": None,
+}
+RETRIEVAL_NEIGHBORS = 50      # Similar users (or anchor items) read by the "cf" source
+RETRIEVAL_RECENT_ITEMS = 5    # Latest rated items whose content neighbors the "content" source returns
+
+# -----------------------------
+# MODEL BUNDLES
+# -----------------------------
+
+BUNDLE_DIR = os.path.join(MODEL_DIR, 'bundles')   # Versioned .npy bundles + CURRENT pointer
+
+# -----------------------------
+# SHARED-MEMORY MODELS
+# -----------------------------
+
+SHARED_MODELS = False         # Workers attach to models published by scripts/publish_shared_models.py
+SHARED_MODELS_NAME = "recsys-models"   # Shared-memory segment name prefix
+SHARED_MODELS_POLL = 5        # Seconds between bundle checks in the loader process
+
+# -----------------------------
+# OFFLINE PRECOMPUTATION
+# -----------------------------
+
+PRECOMPUTED_DIR = os.path.join(MODEL_DIR, 'precomputed')
+PRECOMPUTED_TOP_N = 50        # Width of the stored top-N rows
+PRECOMPUTED_MAX_AGE = 24 * 3600   # Seconds before the whole store counts as stale
+PRECOMPUTE_CHUNK_SIZE = 1024  # Users scored per block
+PRECOMPUTE_WORKERS = os.cpu_count()
+
+# -----------------------------
+# RESULT CACHE
+# -----------------------------
+
+RESULT_CACHE_MAX_ENTRIES = 100_000
+RESULT_CACHE_TTL = 300        # Seconds
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# -----------------------------
+# REQUEST MICRO-BATCHING
+# -----------------------------
+
+MICRO_BATCHING = False        # Coalesce concurrent live user requests into one batched scoring call
+BATCH_WINDOW = 0.002          # Seconds the first request of a batch waits for others
+BATCH_MAX_SIZE = 64           # Requests merged into one batch at most
+
 # -----------------------------
 # API SETTINGS
 # -----------------------------
@@ -0,0 +1,150 @@
+# app/scripts/benchmark.py
+
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+import scipy
+
+from app.data.synthetic import generate_items, generate_ratings
+from app.models.collaborative import CollaborativeFiltering
+from app.models.content_based import ContentBasedFiltering
+from app.models.hybrid import HybridRecommender
+from app.config import CONTENT_NUM_NEIGHBORS
+
+SCALES = {
+    "small": {"n_users": 1_000, "n_items": 2_000, "n_ratings": 50_000},
+    "medium": {"n_users": 5_000, "n_items": 10_000, "n_ratings": 300_000},
+    "large": {"n_users": 20_000, "n_items": 40_000, "n_ratings": 2_000_000},
+}
+
+# Dense mode is skipped when one N x M float64 matrix would exceed this
+DENSE_LIMIT_BYTES = 2 * 1024 ** 3
+
+
+def dense_bytes(size: dict) -> int:
+    """
+    Largest dense matrix of a scale: user x item ratings or a user/item similarity matrix.
+    """
+    n_users, n_items = size["n_users"], size["n_items"]
+    return 8 * max(n_users * n_items, n_users ** 2, n_items ** 2)
+
+
+def measure(fn, queries: list = None) -> dict:
+    """
+    Call fn() once, or fn(query) for every query; return per-call latency stats
+    and the peak memory of one extra traced call (tracing is kept out of the
+    timed calls since it slows allocation down). The last return value is
+    kept under "value" (removed before output).
+    """
+    calls = [()] if queries is None else [(query,) for query in queries]
+    latencies, value = [], None
+    for args in calls:
+        started = time.perf_counter()
+        value = fn(*args)
+        latencies.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    fn(*calls[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "calls": len(calls),
+        "total_s": float(latencies.sum() / 1000),
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "peak_mb": peak / 2 ** 20,
+        "value": value,
+    }
+
+
+def run_scale(scale: str, mode: str, queries: int, seed: int) -> list:
+    """
+    Time the training and serving hot paths at one scale.
+    mode: "dense" (dense CF matrices, full CB similarity) or
+          "sparse" (CSR CF matrices, kNN CB graph)
+    """
+    size = SCALES[scale]
+    sparse = mode == "sparse"
+    ratings_df = generate_ratings(**size, seed=seed)
+    items_df = generate_items(size["n_items"], seed=seed)
+
+    rng = np.random.default_rng(seed)
+    users = rng.choice(ratings_df["user_id"].unique(), size=queries).tolist()
+    items = rng.choice(items_df["item_id"].to_numpy(), size=queries).tolist()
+
+    stages = []
+
+    def record(stage: str, fn, queries: list = None):
+        result = measure(fn, queries)
+        value = result.pop("value")
+        stages.append({"scale": scale, "mode": mode, "stage": stage, **size,
+                       "n_ratings_unique": len(ratings_df), **result})
+        print(f"  {scale:<7} {mode:<6} {stage:<36} mean {result['mean_ms']:10.2f} ms  "
+              f"p95 {result['p95_ms']:10.2f} ms  peak {result['peak_mb']:9.1f} MB")
+        return value
+
+    cf_user = record("cf.prepare[user]",
+                     lambda: CollaborativeFiltering(ratings_df, similarity_type="user", sparse=sparse))
+    record("cf.recommend_for_user[user]", cf_user.recommend_for_user, users)
+    cf_item = record("cf.prepare[item]",
+                     lambda: CollaborativeFiltering(ratings_df, similarity_type="item", sparse=sparse))
+    record("cf.recommend_for_user[item]", cf_item.recommend_for_user, users)
+    del cf_item
+
+    num_neighbors = CONTENT_NUM_NEIGHBORS if sparse else None
+    cb = record("cb.prepare",
+                lambda: ContentBasedFiltering(items_df.copy(), num_neighbors=num_neighbors))
+    record("cb.recommend_similar_items", cb.recommend_similar_items, items)
+
+    hybrid = record("hybrid.prepare", lambda: HybridRecommender(cf_user, cb, alpha=0.7))
+    record("hybrid.recommend_for_user", hybrid.recommend_for_user, users)
+    return stages
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "scipy": scipy.__version__, "machine": platform.machine(), "timestamp": time.time()}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark model training and serving on synthetic data.")
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=sorted(SCALES))
+    parser.add_argument("--modes", nargs="+", default=["dense", "sparse"], choices=["dense", "sparse"])
+    parser.add_argument("--queries", type=int, default=100, help="requests timed per serving stage")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark.json")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = {"environment": environment(), "results": [], "skipped": []}
+
+    for scale in args.scales:
+        for mode in args.modes:
+            size = SCALES[scale]
+            if mode == "dense" and dense_bytes(size) > DENSE_LIMIT_BYTES:
+                report["skipped"].append({"scale": scale, "mode": mode, "reason": "dense matrices too large"})
+                print(f"📌 Skipping {scale}/{mode}: dense matrices too large")
+                continue
+            print(f"📌 Benchmarking {scale}/{mode} ({size})")
+            report["results"].extend(run_scale(scale, mode, args.queries, args.seed))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Wrote {len(report['results'])} timings to {args.output}")
+
+if __name__ == "__main__":
+    main()
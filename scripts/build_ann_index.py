@@ -0,0 +1,55 @@
+# app/scripts/build_ann_index.py
+
+import joblib
+import numpy as np
+
+from app.models.ann import recall_at_k
+from app.services.recommender_service import RecommenderService
+from app.config import (
+    COLLAB_MODEL_FILE,
+    ANN_NUM_LISTS,
+    ANN_NUM_PROBE,
+    ANN_ITEM_FACTORS_FILE,
+    ANN_CONTENT_FILE
+)
+
+RECALL_K = 10
+RECALL_QUERIES = 1000
+
+
+def report_recall(name, index, vectors, queries):
+    report = recall_at_k(index, vectors, queries[:RECALL_QUERIES], k=RECALL_K)
+    for n_probe, recall in report.items():
+        print(f"  {name}: n_probe={n_probe:<4} recall@{RECALL_K}={recall:.4f}")
+
+
+def build_item_factor_index():
+    print("\n📌 Building ANN index over collaborative item factors...")
+    model = joblib.load(COLLAB_MODEL_FILE)
+    vectors = model.item_vectors()
+    index = model.build_ann_index(ANN_NUM_LISTS, ANN_NUM_PROBE)
+    model.save_ann_index(ANN_ITEM_FACTORS_FILE)
+    print(f"✅ Saved item factor index to {ANN_ITEM_FACTORS_FILE}")
+
+    # User queries carry a trailing 1 to pick up the item bias column
+    queries = np.hstack([model.user_factors, np.ones((len(model.user_factors), 1))])
+    report_recall("item factors", index, vectors, queries)
+
+
+def build_content_index():
+    print("\n📌 Building ANN index over the served TF-IDF vectors...")
+    # The served content model (current bundle, or built from data), so the
+    # index rows are its item positions; the service checks their ids on load
+    cb_model = RecommenderService(precomputed_dir=None, ann_min_items=None).cb_model
+    index = cb_model.build_ann_index(ANN_NUM_LISTS, ANN_NUM_PROBE)
+    cb_model.save_ann_index(ANN_CONTENT_FILE)
+    print(f"✅ Saved content index to {ANN_CONTENT_FILE}")
+    report_recall("content", index, cb_model.tfidf_matrix, cb_model.tfidf_matrix)
+
+
+def main():
+    build_item_factor_index()
+    build_content_index()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+# app/scripts/build_bundle.py
+
+import time
+
+from app.services.artifacts import save_bundle
+from app.services.recommender_service import RecommenderService
+from app.config import BUNDLE_DIR
+
+
+def main():
+    print("📌 Building models from data...")
+    started = time.perf_counter()
+    service = RecommenderService(precomputed_dir=None, bundle_dir=None)
+    print(f"✅ Models built in {time.perf_counter() - started:.1f}s")
+    graph = service.cb_model.neighbor_graph
+    if graph is not None:
+        print(f"✅ Content similarities: top-{service.cb_model.num_neighbors} neighbor graph "
+              f"({graph.nnz:,} entries)")
+
+    path = save_bundle(service.cf_model, service.cb_model, service.hybrid_model, root=BUNDLE_DIR)
+    print(f"✅ Saved model bundle to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,85 +1,55 @@
 # app/scripts/evaluate_models.py
 
+import argparse
+import time
 import pandas as pd
-import joblib
-from surprise import Dataset, Reader
-from surprise.model_selection import train_test_split
-from surprise import accuracy
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
-from scipy import sparse
 
 from app.config import (
-    RATINGS_FILE,
-    ITEMS_FILE,
-    COLLAB_MODEL_FILE,
-    TFIDF_MATRIX_FILE,
-    TFIDF_VECTORIZER_FILE
+    EVAL_TOP_K,
+    EVAL_RELEVANCE_THRESHOLD,
+    EVAL_FOLDS,
+    EVAL_WORKERS
 )
-from app.data.load_data import load_ratings_data, load_items_data
+from app.data.load_data import load_ratings_chunked, load_items_data
+from app.models.evaluation import MODEL_BUILDERS, cross_validate, kfold_splits, time_splits
 
 
-def evaluate_collaborative():
-    print("\n📌 Evaluating Collaborative Filtering Model...")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Cross-validate the recommendation models with ranking metrics.")
+    parser.add_argument("--models", nargs="+", default=sorted(MODEL_BUILDERS), choices=sorted(MODEL_BUILDERS))
+    parser.add_argument("--split", default="kfold", choices=["kfold", "time"])
+    parser.add_argument("--folds", type=int, default=EVAL_FOLDS, help="folds, or time splits with --split time")
+    parser.add_argument("--k", type=int, default=EVAL_TOP_K)
+    parser.add_argument("--threshold", type=float, default=EVAL_RELEVANCE_THRESHOLD)
+    parser.add_argument("--workers", type=int, default=EVAL_WORKERS)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="optional CSV of per-split results")
+    return parser.parse_args()
 
-    # Load model
-    model = joblib.load(COLLAB_MODEL_FILE)
 
-    # Load and prepare data
-    ratings_df = load_ratings_data()
-    reader = Reader(rating_scale=(0.0, 5.0))
-    data = Dataset.load_from_df(ratings_df[['user_id', 'item_id', 'rating']], reader)
-    trainset, testset = train_test_split(data, test_size=0.2, random_state=42)
-
-    # Evaluate
-    predictions = model.test(testset)
-    rmse = accuracy.rmse(predictions)
-    mae = accuracy.mae(predictions)
-
-    print(f"✅ Collaborative Filtering RMSE: {rmse:.4f}, MAE: {mae:.4f}")
-
-
-def evaluate_content_based(top_n=5):
-    print("\n📌 Evaluating Content-Based Filtering Model...")
-
-    # Load data and TF-IDF model
+def main():
+    args = parse_args()
+    ratings_df = load_ratings_chunked()
     items_df = load_items_data()
-    tfidf_matrix = sparse.load_npz(TFIDF_MATRIX_FILE)
-    tfidf_vectorizer = joblib.load(TFIDF_VECTORIZER_FILE)
-
-    # Compute similarity matrix
-    similarity_matrix = cosine_similarity(tfidf_matrix)
 
-    # Recommend for each item and calculate precision-like metric
-    correct = 0
-    total = 0
-
-    for idx, row in items_df.iterrows():
-        item_idx = idx
-        sim_scores = list(enumerate(similarity_matrix[item_idx]))
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-        top_similar_items = [i[0] for i in sim_scores[1:top_n + 1]]
-
-        # Dummy metric: whether any top similar item has same category (or tag)
-        target_tag = row.get("tag") or row.get("category")
-        if not target_tag:
-            continue
-
-        for similar_item_idx in top_similar_items:
-            similar_item_tag = items_df.iloc[similar_item_idx].get("tag") or items_df.iloc[similar_item_idx].get(
-                "category")
-            if similar_item_tag == target_tag:
-                correct += 1
-                break
-        total += 1
-
-    precision = correct / total if total > 0 else 0
-    print(f"✅ Content-Based Top-{top_n} Precision (by tag/category match): {precision:.4f}")
-
-
-def main():
-    evaluate_collaborative()
-    evaluate_content_based()
+    if args.split == "time":
+        splits = time_splits(ratings_df, args.folds)
+    else:
+        splits = kfold_splits(ratings_df, args.folds, args.seed)
+
+    print(f"📌 Evaluating {', '.join(args.models)} on {len(splits)} {args.split} splits "
+          f"with {args.workers} workers...")
+    started = time.perf_counter()
+    results = cross_validate(args.models, ratings_df, items_df, splits, args.k, args.threshold, args.workers)
+    elapsed = time.perf_counter() - started
+
+    summary = results.drop(columns="split").groupby("model").mean()
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.float_format", "{:.4f}".format):
+        print(summary)
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"✅ Wrote per-split results to {args.output}")
+    print(f"✅ Evaluation complete in {elapsed:.1f}s")
 
 
 if __name__ == "__main__":
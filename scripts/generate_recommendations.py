@@ -1,114 +1,85 @@
 # app/scripts/generate_recommendations.py
 
-import joblib
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+import argparse
+import time
 import numpy as np
-from surprise import Dataset, Reader
-from surprise import SVD
-from scipy import sparse
+from concurrent.futures import ProcessPoolExecutor
 
 from app.config import (
-    RATINGS_FILE,
-    ITEMS_FILE,
-    COLLAB_MODEL_FILE,
-    TFIDF_MATRIX_FILE,
-    TFIDF_VECTORIZER_FILE,
-    TOP_N
+    PRECOMPUTED_DIR,
+    PRECOMPUTED_TOP_N,
+    PRECOMPUTE_CHUNK_SIZE,
+    PRECOMPUTE_WORKERS
 )
+from app.services.precomputed import PrecomputedStore
+from app.services.recommender_service import RecommenderService
 
-from app.data.load_data import load_ratings_data, load_items_data
+# Model shared with each worker process by the pool initializer
+_hybrid_model = None
 
 
-def get_unrated_items(user_id, ratings_df, items_df):
-    rated_items = ratings_df[ratings_df['user_id'] == user_id]['item_id'].unique()
-    return items_df[~items_df['item_id'].isin(rated_items)]
+def _init_worker(hybrid_model):
+    global _hybrid_model
+    _hybrid_model = hybrid_model
 
 
-def recommend_collaborative(user_id, ratings_df, items_df, model, top_n=TOP_N):
-    print("\n🔷 Collaborative Filtering Recommendations")
-    unrated_items = get_unrated_items(user_id, ratings_df, items_df)
+def _score_chunk(start: int, stop: int, top_n: int):
+    """
+    Score user rows [start, stop) as one block; runs inside a worker process.
+    """
+    items, scores = _hybrid_model.recommend_block(np.arange(start, stop), top_n)
+    return start, items, scores
 
-    predictions = [
-        (item_id, model.predict(str(user_id), str(item_id)).est)
-        for item_id in unrated_items['item_id']
-    ]
-    top_items = sorted(predictions, key=lambda x: x[1], reverse=True)[:top_n]
-    for i, (item_id, score) in enumerate(top_items, start=1):
-        title = items_df[items_df['item_id'] == item_id]['title'].values[0]
-        print(f"{i}. {title} (Predicted rating: {score:.2f})")
 
+def generate_all_recommendations(service: RecommenderService, output_dir: str = PRECOMPUTED_DIR,
+                                 top_n: int = PRECOMPUTED_TOP_N, chunk_size: int = PRECOMPUTE_CHUNK_SIZE,
+                                 workers: int = PRECOMPUTE_WORKERS) -> PrecomputedStore:
+    """
+    Score every known user in chunks across a process pool and write the
+    fixed-width top-N rows to a memory-mapped store.
+    """
+    hybrid_model = service.hybrid_model
+    cf_model = hybrid_model.cf_model
+    user_ids = cf_model.user_index[:cf_model.user_item_matrix.shape[0]]
+    n_users = len(user_ids)
 
-def recommend_content_based(user_id, ratings_df, items_df, tfidf_matrix, top_n=TOP_N):
-    print("\n🔷 Content-Based Filtering Recommendations")
-    user_ratings = ratings_df[ratings_df['user_id'] == user_id]
-    if user_ratings.empty:
-        print("No user history found. Content-based filtering needs at least one rated item.")
-        return
+    # Build next to the live store and swap it in once complete
+    store = PrecomputedStore.create(output_dir + ".tmp", user_ids, hybrid_model.item_ids, top_n)
+    chunks = [(start, min(start + chunk_size, n_users)) for start in range(0, n_users, chunk_size)]
 
-    # Assume last rated item is most recent preference
-    last_item_id = user_ratings.sort_values(by='timestamp', ascending=False).iloc[0]['item_id']
-    last_item_idx = items_df.index[items_df['item_id'] == last_item_id].tolist()
-    if not last_item_idx:
-        print("Last item not found in item dataset.")
-        return
-    last_item_idx = last_item_idx[0]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(hybrid_model,)) as pool:
+        futures = [pool.submit(_score_chunk, start, stop, top_n) for start, stop in chunks]
+        for done, future in enumerate(futures, start=1):
+            start, items, scores = future.result()
+            store.write_rows(start, items, scores)
+            print(f"  scored chunk {done}/{len(chunks)}")
 
-    similarity_scores = cosine_similarity(tfidf_matrix[last_item_idx], tfidf_matrix).flatten()
-    similar_indices = similarity_scores.argsort()[::-1][1:top_n + 1]
+    store.finalize(target=output_dir)
+    return store
 
-    for i, idx in enumerate(similar_indices, start=1):
-        item_id = items_df.iloc[idx]['item_id']
-        title = items_df.iloc[idx]['title']
-        print(f"{i}. {title} (Similarity score: {similarity_scores[idx]:.2f})")
 
-
-def recommend_hybrid(user_id, ratings_df, items_df, collab_model, tfidf_matrix, alpha=0.5, top_n=TOP_N):
-    print("\n🔷 Hybrid Filtering Recommendations")
-    unrated_items = get_unrated_items(user_id, ratings_df, items_df)
-
-    hybrid_scores = []
-    for idx, row in unrated_items.iterrows():
-        item_id = row['item_id']
-
-        # Collaborative score
-        collab_score = collab_model.predict(str(user_id), str(item_id)).est
-
-        # Content score: similarity with user's last item
-        user_ratings = ratings_df[ratings_df['user_id'] == user_id]
-        if user_ratings.empty:
-            content_score = 0
-        else:
-            last_item_id = user_ratings.sort_values(by='timestamp', ascending=False).iloc[0]['item_id']
-            try:
-                last_idx = items_df.index[items_df['item_id'] == last_item_id].tolist()[0]
-                current_idx = items_df.index[items_df['item_id'] == item_id].tolist()[0]
-                content_score = cosine_similarity(tfidf_matrix[last_idx], tfidf_matrix[current_idx])[0][0]
-            except IndexError:
-                content_score = 0
-
-        hybrid_score = alpha * collab_score + (1 - alpha) * content_score
-        hybrid_scores.append((item_id, hybrid_score))
-
-    top_items = sorted(hybrid_scores, key=lambda x: x[1], reverse=True)[:top_n]
-    for i, (item_id, score) in enumerate(top_items, start=1):
-        title = items_df[items_df['item_id'] == item_id]['title'].values[0]
-        print(f"{i}. {title} (Hybrid score: {score:.2f})")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Precompute top-N recommendations for all users.")
+    parser.add_argument("--output-dir", default=PRECOMPUTED_DIR)
+    parser.add_argument("--top-n", type=int, default=PRECOMPUTED_TOP_N)
+    parser.add_argument("--chunk-size", type=int, default=PRECOMPUTE_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=PRECOMPUTE_WORKERS)
+    return parser.parse_args()
 
 
 def main():
-    user_id = input("Enter user_id to get recommendations: ").strip()
-
-    # Load data
-    ratings_df = load_ratings_data()
-    items_df = load_items_data()
-    tfidf_matrix = sparse.load_npz(TFIDF_MATRIX_FILE)
-    collab_model = joblib.load(COLLAB_MODEL_FILE)
-
-    # Generate recommendations
-    recommend_collaborative(user_id, ratings_df, items_df, collab_model)
-    recommend_content_based(user_id, ratings_df, items_df, tfidf_matrix)
-    recommend_hybrid(user_id, ratings_df, items_df, collab_model, tfidf_matrix)
+    args = parse_args()
+    print("📌 Building models for bulk scoring...")
+    service = RecommenderService(precomputed_dir=None)
+
+    started = time.perf_counter()
+    store = generate_all_recommendations(
+        service, args.output_dir, args.top_n, args.chunk_size, args.workers
+    )
+    elapsed = time.perf_counter() - started
+    print(f"✅ Precomputed top-{store.top_n} for {len(store.user_index)} users "
+          f"in {elapsed:.1f}s -> {store.path}")
 
 if __name__ == "__main__":
     main()
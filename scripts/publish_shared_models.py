@@ -0,0 +1,57 @@
+# app/scripts/publish_shared_models.py
+
+import argparse
+import time
+
+from app.services.artifacts import current_bundle_path, load_bundle
+from app.services.recommender_service import RecommenderService
+from app.services.shared_models import SharedModelPublisher
+from app.config import BUNDLE_DIR, SHARED_MODELS_NAME, SHARED_MODELS_POLL
+
+
+def load_models(bundle_dir: str):
+    """
+    Models of the current bundle, or freshly built ones when there is no bundle.
+    """
+    path = current_bundle_path(bundle_dir)
+    if path is None:
+        service = RecommenderService(precomputed_dir=None, bundle_dir=None)
+        return service.cf_model, service.cb_model, service.hybrid_model, None
+    cf_model, cb_model, hybrid_model, manifest = load_bundle(path)
+    return cf_model, cb_model, hybrid_model, manifest["version"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Publish the model arrays in shared memory for the API workers "
+                    "(run with SHARED_MODELS = True) and republish when the bundle changes.")
+    parser.add_argument("--name", default=SHARED_MODELS_NAME)
+    parser.add_argument("--bundle-dir", default=BUNDLE_DIR)
+    parser.add_argument("--poll", type=float, default=SHARED_MODELS_POLL)
+    parser.add_argument("--once", action="store_true", help="publish once and exit (segments are removed)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    publisher = SharedModelPublisher(args.name)
+    published, generation = None, None
+    try:
+        while True:
+            bundle_path = current_bundle_path(args.bundle_dir)
+            if generation is None or bundle_path != published:
+                print("📌 Loading models...")
+                cf_model, cb_model, hybrid_model, version = load_models(args.bundle_dir)
+                generation = publisher.publish(cf_model, cb_model, hybrid_model, version=version)
+                published = bundle_path
+                print(f"✅ Published generation {generation} (bundle {version}) as {args.name}")
+            if args.once:
+                break
+            time.sleep(args.poll)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,30 @@
 # app/scripts/train_collaborative.py
 
 import pandas as pd
-from surprise import Dataset, Reader, SVD
-from surprise.model_selection import train_test_split
+import numpy as np
+from sklearn.model_selection import train_test_split
 import joblib
 import os
 
-from app.data.load_data import load_ratings_data, clean_ratings_data
+from app.data.load_data import load_ratings_chunked
+from app.models.matrix_factorization import MatrixFactorization
 from app.config import RATINGS_FILE, COLLAB_MODEL_FILE, NUM_FACTORS, NUM_EPOCHS, LEARNING_RATE
 
-def prepare_dataset_for_surprise(ratings_df: pd.DataFrame):
+def train_mf_model(ratings_df: pd.DataFrame):
     """
-    Converts a DataFrame into a Surprise-compatible dataset
+    Train the in-repo matrix factorization model (vectorized mini-batch SGD).
     """
-    reader = Reader(rating_scale=(0.0, 5.0))
-    data = Dataset.load_from_df(ratings_df[['user_id', 'item_id', 'rating']], reader)
-    return data
-
-def train_svd_model(ratings_df: pd.DataFrame):
-    """
-    Train an SVD (matrix factorization) model using Surprise.
-    """
-    # Convert data to Surprise format
-    data = prepare_dataset_for_surprise(ratings_df)
-    trainset, testset = train_test_split(data, test_size=0.2, random_state=42)
-
-    # Define the SVD model
-    algo = SVD(n_factors=NUM_FACTORS, n_epochs=NUM_EPOCHS, lr_all=LEARNING_RATE)
+    train_df, test_df = train_test_split(ratings_df, test_size=0.2, random_state=42)
 
     # Train the model
     print("Training collaborative filtering model...")
-    algo.fit(trainset)
+    algo = MatrixFactorization(
+        train_df, n_factors=NUM_FACTORS, n_epochs=NUM_EPOCHS, learning_rate=LEARNING_RATE
+    )
 
     # Evaluate
-    predictions = algo.test(testset)
-    from surprise import accuracy
-    rmse = accuracy.rmse(predictions)
+    predictions = algo.predict_ratings(test_df["user_id"], test_df["item_id"])
+    rmse = np.sqrt(np.mean((test_df["rating"].to_numpy() - predictions) ** 2))
     print(f"✅ RMSE on test set: {rmse:.4f}")
 
     return algo
@@ -48,14 +37,14 @@ def save_model(model, model_path: str):
     print(f"✅ Model saved to {model_path}")
 
 def main():
-    # Load and clean ratings data
-    ratings_df = load_ratings_data()
-    ratings_df = clean_ratings_data(ratings_df)
+    # Load ratings data (cleaned and validated chunk by chunk)
+    ratings_df = load_ratings_chunked()
 
     # Train the model
-    model = train_svd_model(ratings_df)
+    model = train_mf_model(ratings_df)
 
     # Save the model
     save_model(model, COLLAB_MODEL_FILE)
 
-if __name__
+if __name__ == "__main__":
+    main()
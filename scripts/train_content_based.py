@@ -1,44 +1,67 @@
 # app/scripts/train_content_based.py
 
-import pandas as pd
+import argparse
 import joblib
-from sklearn.metrics.pairwise import cosine_similarity
 from scipy import sparse
 
-from app.data.load_data import load_items_data
-from app.data.preprocessing import vectorize_item_descriptions
-from app.config import TFIDF_MATRIX_FILE, TFIDF_VECTORIZER_FILE
+from app.data.load_data import clean_items_data, load_items_data
+from app.models.content_based import ContentBasedFiltering
+from app.models.similarity import plan_blocks
+from app.config import (
+    ITEMS_FILE,
+    TFIDF_MATRIX_FILE,
+    TFIDF_VECTORIZER_FILE,
+    CONTENT_NUM_NEIGHBORS,
+    CONTENT_NEIGHBORS_FILE,
+    CONTENT_BLOCKS_DIR,
+    SIMILARITY_N_JOBS,
+    SIMILARITY_MEMORY_LIMIT,
+    PRECISION
+)
 
-def train_content_based_model():
+def train_content_based_model(n_jobs: int = SIMILARITY_N_JOBS, memory_limit: int = SIMILARITY_MEMORY_LIMIT,
+                              block_dir: str = CONTENT_BLOCKS_DIR) -> ContentBasedFiltering:
     """
-    Train content-based filtering model using TF-IDF + cosine similarity.
+    Train content-based filtering model using TF-IDF + a top-K cosine neighbor graph.
+    The model is fitted exactly like the served one (cleaned items, same
+    features), so RecommenderService can load the saved graph as is.
+    The graph is built blockwise on n_jobs threads with at most memory_limit
+    bytes of dense similarities in flight; reduced blocks go to block_dir.
     """
-    # Load item metadata
-    items_df = load_items_data()
+    # Load and clean item metadata, as the service does
+    items_df = clean_items_data(load_items_data(ITEMS_FILE))
+    if items_df.empty:
+        raise ValueError(f"No usable items in {ITEMS_FILE}.")
 
-    # TF-IDF vectorization of item descriptions
-    tfidf_matrix, tfidf_vectorizer = vectorize_item_descriptions(items_df)
+    block_size, workers = plan_blocks(items_df["item_id"].nunique(), n_jobs, memory_limit, PRECISION)
+    print(f"📌 Building neighbor blocks of about {block_size} items on {workers} threads...")
+    model = ContentBasedFiltering(items_df, text_column="description", num_neighbors=CONTENT_NUM_NEIGHBORS,
+                                  n_jobs=n_jobs, memory_limit=memory_limit, block_dir=block_dir)
 
-    if tfidf_matrix is None:
-        raise ValueError("TF-IDF vectorization failed. Check item descriptions.")
-
-    # Save TF-IDF vectorizer
-    joblib.dump(tfidf_vectorizer, TFIDF_VECTORIZER_FILE)
+    # Save the TF-IDF vectorizer (the hasher for hashed features) and matrix
+    joblib.dump(model.hasher if model.hasher is not None else model.vectorizer, TFIDF_VECTORIZER_FILE)
     print(f"✅ Saved TF-IDF vectorizer to {TFIDF_VECTORIZER_FILE}")
-
-    # Save TF-IDF matrix (sparse format)
-    sparse.save_npz(TFIDF_MATRIX_FILE, tfidf_matrix)
+    sparse.save_npz(TFIDF_MATRIX_FILE, model.tfidf_matrix)
     print(f"✅ Saved TF-IDF matrix to {TFIDF_MATRIX_FILE}")
 
-    # Optionally: Compute similarity matrix (not saved here to save space)
-    similarity_matrix = cosine_similarity(tfidf_matrix)
-    print("✅ Cosine similarity matrix computed (not saved).")
+    # Keep only the top-K neighbors per item; the full N x N matrix is never built
+    model.save_neighbor_graph(CONTENT_NEIGHBORS_FILE)
+    print(f"✅ Saved top-{model.num_neighbors} neighbor graph to {CONTENT_NEIGHBORS_FILE}")
+
+    return model
 
-    return similarity_matrix
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the content-based model and its kNN graph.")
+    parser.add_argument("--jobs", type=int, default=SIMILARITY_N_JOBS, help="similarity threads")
+    parser.add_argument("--memory-limit-mb", type=int, default=SIMILARITY_MEMORY_LIMIT // 2 ** 20,
+                        help="dense similarity blocks in flight, in MB")
+    parser.add_argument("--block-dir", default=CONTENT_BLOCKS_DIR)
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
     print("📌 Training content-based model...")
-    similarity_matrix = train_content_based_model()
+    train_content_based_model(args.jobs, args.memory_limit_mb * 2 ** 20, args.block_dir)
     print("✅ Content-based model training complete.")
 
 if __name__ == "__main__":
@@ -0,0 +1,5 @@
+import os
+
+# The API module builds its service at import time; without data files it
+# needs the built-in dummy dataset, which must be asked for explicitly
+os.environ.setdefault("RECSYS_DUMMY_DATA", "1")
@@ -0,0 +1,167 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+from flask import Flask
+from werkzeug.datastructures import MultiDict
+
+from app.api import routes
+from app.config import PRECOMPUTED_MAX_AGE
+from app.services import recommender_service
+from app.services.precomputed import PrecomputedStore
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(routes.api_blueprint, url_prefix="/api")
+    return app.test_client()
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """
+    A fresh service on the built-in dummy data (no genre column), served by
+    the routes for this test only.
+    """
+    service = recommender_service.RecommenderService(precomputed_dir=None, bundle_dir=None, dummy_data=True)
+    monkeypatch.setattr(routes, "recommender", service)
+    return service
+
+
+@pytest.fixture
+def captured(monkeypatch, service):
+    """
+    Replace the service's recommend calls with stubs recording their arguments.
+    """
+    calls = {}
+
+    def recommend_for_user(user_id, top_n=10, filters=None):
+        calls["user"] = (user_id, top_n, filters)
+        return [[101, 1.0]]
+
+    def recommend_for_users(user_ids, top_n=10, filters=None):
+        calls["users"] = (user_ids, top_n, filters)
+        return [[[101, 1.0]] for _ in user_ids]
+
+    monkeypatch.setattr(service, "recommend_for_user", recommend_for_user)
+    monkeypatch.setattr(service, "recommend_for_users", recommend_for_users)
+    return calls
+
+
+# -------------------------------
+# Filter parsing
+# -------------------------------
+
+def test_filters_keep_only_indexed_columns():
+    args = MultiDict({"genre": "comedy,drama", "year": "1990-1999", "top_n": "5", "color": "red"})
+    assert routes._filters(args) == {"genre": "comedy,drama", "year": "1990-1999"}
+
+
+def test_filters_empty_without_filter_parameters():
+    assert routes._filters(MultiDict({"top_n": "5"})) == {}
+
+
+def test_user_route_passes_query_filters(client, captured):
+    response = client.get("/api/recommend/user/7?top_n=3&genre=comedy&year=1990-")
+    assert response.status_code == 200
+    assert captured["user"] == (7, 3, {"genre": "comedy", "year": "1990-"})
+    assert response.get_json() == {"user_id": 7, "recommendations": [[101, 1.0]]}
+
+
+def test_batch_route_prefers_body_filters(client, captured):
+    response = client.post("/api/recommend/users?genre=drama",
+                           json={"user_ids": [1, 2], "top_n": 2, "filters": {"genre": "comedy"}})
+    assert response.status_code == 200
+    assert captured["users"] == ([1, 2], 2, {"genre": "comedy"})
+
+    client.post("/api/recommend/users?genre=drama", json={"user_ids": [1]})
+    assert captured["users"] == ([1], 10, {"genre": "drama"})
+
+
+def test_unindexed_filter_is_a_bad_request(client, service):
+    # The dummy items carry no genre column, so the filter cannot be applied
+    response = client.get("/api/recommend/user/1?genre=comedy")
+    assert response.status_code == 400
+    assert "genre" in response.get_json()["error"]
+
+
+def test_invalid_top_n_is_a_bad_request(client, service):
+    assert client.get("/api/recommend/user/1?top_n=many").status_code == 400
+
+
+def test_apply_ratings_counts_only_new_pairs_as_popularity_events(service):
+    user_id, item_id = int(service.cf_model.user_index.ids[0]), int(service.cf_model.item_index.ids[0])
+    rated = service.cf_model.stored_ratings([user_id], [item_id])[0]
+    new_user = int(service.cf_model.user_index.ids.max()) + 1
+    position = service.popularity.item_index.get(item_id)
+    before = service.popularity.counts[position]
+
+    service.apply_ratings(pd.DataFrame({"user_id": [user_id, new_user], "item_id": [item_id, item_id],
+                                        "rating": [5.0 if rated != 5.0 else 4.0, 3.0]}))
+    assert service.popularity.counts[position] == before + (1 if rated == 0 else 0) + 1
+
+
+# -------------------------------
+# Service data loading
+# -------------------------------
+
+@pytest.mark.parametrize("content, error", [
+    (None, FileNotFoundError),
+    ("user,item\n1,101\n", KeyError),                        # required columns missing
+    ("user_id,item_id,rating\nx,101,4\n1,101,abc\n", ValueError),   # no valid row
+])
+def test_service_refuses_unusable_ratings(tmp_path, monkeypatch, content, error):
+    path = tmp_path / "ratings.csv"
+    if content is not None:
+        path.write_text(content)
+    monkeypatch.setattr(recommender_service, "RATINGS_FILE", str(path))
+    with pytest.raises(error):
+        recommender_service.RecommenderService(precomputed_dir=None, bundle_dir=None, dummy_data=False)
+
+
+# -------------------------------
+# Precomputed results
+# -------------------------------
+
+def test_single_and_batch_requests_read_the_precomputed_store(tmp_path):
+    store = PrecomputedStore.create(str(tmp_path / "build"), [1, 2], [101, 102, 103, 104], top_n=2)
+    store.write_rows(0, np.array([[3, 2], [0, 1]]), np.array([[9.0, 8.0], [7.0, 6.0]]))
+    store.finalize(str(tmp_path / "store"))
+    service = recommender_service.RecommenderService(precomputed_dir=str(tmp_path / "store"), bundle_dir=None,
+                                                     dummy_data=True)
+
+    expected = [[(104, 9.0), (103, 8.0)], [(101, 7.0), (102, 6.0)]]
+    assert service.recommend_for_users([1, 2], top_n=2) == expected
+    assert [service.recommend_for_user(user_id, top_n=2) for user_id in (1, 2)] == expected
+
+    # Only users the store holds are marked stale
+    service.apply_ratings(pd.DataFrame({"user_id": [1, 7], "item_id": [103, 101], "rating": [4.0, 5.0]}))
+    assert service.stale_users == {1}
+    assert service.recommend_for_users([1, 2], top_n=2)[1] == expected[1]
+    assert service.recommend_for_users([1], top_n=2)[0] != expected[0]
+
+    # An expired store is released together with its stale marks
+    service.precomputed.created_at -= PRECOMPUTED_MAX_AGE + 1
+    service.cache.clear()
+    assert service.recommend_for_user(2, top_n=2) != expected[1]
+    assert service.precomputed is None
+    assert not service.stale_users
+
+
+# -------------------------------
+# Async serving
+# -------------------------------
+
+@pytest.mark.parametrize("micro_batching", [False, True])
+def test_async_recommendations_match_sync(monkeypatch, micro_batching):
+    monkeypatch.setattr(recommender_service, "MIN_RATINGS_TO_PERSONALIZE", 0)
+    service = recommender_service.RecommenderService(precomputed_dir=None, bundle_dir=None,
+                                                     micro_batching=micro_batching, dummy_data=True)
+    for user_id in (1, 2, 3):
+        expected = service.hybrid_model.recommend_for_user(user_id, 3)
+        assert asyncio.run(service.recommend_for_user_async(user_id, top_n=3)) == expected
+        assert service.cache.get("user", user_id, 3) == expected
+    if service.coalescer is not None:
+        service.coalescer.close()
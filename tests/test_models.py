@@ -0,0 +1,265 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.data.id_mapper import IdMapper
+from app.data.synthetic import generate_items, generate_ratings
+from app.models.collaborative import CollaborativeFiltering
+from app.models.content_based import ContentBasedFiltering
+from app.models.evaluation import evaluate_model, kfold_splits
+from app.models.hybrid import HybridRecommender
+from app.models.matrix_factorization import MatrixFactorization
+from app.models.popularity import PopularityRanker
+from app.models.retrieval import RetrievalPipeline
+from app.models.utils import to_dense
+from app.services.artifacts import collect_arrays, restore_models
+
+
+@pytest.fixture(scope="module")
+def ratings_df():
+    return generate_ratings(n_users=200, n_items=150, n_ratings=4000, seed=7)
+
+
+def _apply_in_batches(model, ratings_df, start, batch_size=200, seed=0):
+    """
+    Feed the rows after start to model.apply_ratings, mixed with edits and
+    removals of earlier ratings. Returns the ratings a rebuild should see.
+    """
+    rng = np.random.default_rng(seed)
+    current = ratings_df.iloc[:start]
+    for offset in range(start, len(ratings_df), batch_size):
+        edited = current.sample(10, random_state=offset).assign(rating=rng.integers(1, 6, 10).astype(float))
+        removed = current.sample(3, random_state=offset + 1).assign(rating=0.0)
+        delta = pd.concat([ratings_df.iloc[offset:offset + batch_size], edited, removed])
+        delta = delta.drop_duplicates(["user_id", "item_id"], keep="last")
+        model.apply_ratings(delta)
+
+        current = pd.concat([current, delta]).drop_duplicates(["user_id", "item_id"], keep="last")
+        current = current[current["rating"] != 0]
+    return current
+
+
+# -------------------------------
+# Collaborative filtering
+# -------------------------------
+
+@pytest.mark.parametrize("sparse", [True, False])
+@pytest.mark.parametrize("similarity_type", ["user", "item"])
+def test_incremental_updates_match_a_rebuild(ratings_df, sparse, similarity_type):
+    start = len(ratings_df) // 2
+    model = CollaborativeFiltering(ratings_df.iloc[:start], similarity_type=similarity_type, sparse=sparse)
+    current = _apply_in_batches(model, ratings_df, start)
+    rebuilt = CollaborativeFiltering(current, similarity_type=similarity_type, sparse=sparse)
+
+    users = model.user_index.encode(rebuilt.user_index.ids)
+    items = model.item_index.encode(rebuilt.item_index.ids)
+    model.merge_updates()
+    np.testing.assert_allclose(to_dense(model._ratings_values())[np.ix_(users, items)],
+                               to_dense(rebuilt._ratings_values()))
+
+    axis = users if similarity_type == "user" else items
+    np.testing.assert_allclose(to_dense(model.similarity_matrix)[np.ix_(axis, axis)],
+                               to_dense(rebuilt.similarity_matrix), atol=1e-5)
+
+
+def test_pending_corrections_are_read_before_merging(ratings_df):
+    start = len(ratings_df) - 1
+    model = CollaborativeFiltering(ratings_df.iloc[:start], similarity_type="user", sparse=True)
+    model.apply_ratings(ratings_df.iloc[start:])
+    assert model._pending
+
+    user_ids = ratings_df["user_id"].unique()[:20]
+    rows = model.user_rows(user_ids)
+    scores, rated_mask = model.score_users(rows)
+    recommendations = model.recommend_for_user(user_ids[0], top_n=5)
+
+    model.merge_updates()
+    assert not model._pending
+    merged_scores, merged_mask = model.score_users(rows)
+    np.testing.assert_allclose(scores, merged_scores, atol=1e-6)
+    np.testing.assert_array_equal(rated_mask, merged_mask)
+    assert [item for item, _ in recommendations] == [item for item, _ in model.recommend_for_user(user_ids[0], 5)]
+
+
+def test_new_users_and_items_get_rows(ratings_df):
+    model = CollaborativeFiltering(ratings_df, similarity_type="user", sparse=True)
+    new_user, new_item = 10 ** 6, int(ratings_df["item_id"].max()) + 1
+    old_item = int(ratings_df["item_id"].iloc[0])
+    model.apply_ratings(pd.DataFrame({"user_id": [new_user, new_user], "item_id": [new_item, old_item],
+                                      "rating": [5.0, 4.0]}))
+    assert sorted(model.get_rated_items(new_user)) == sorted([new_item, old_item])
+    assert model.rating_counts(model.user_rows([new_user])).tolist() == [2]
+
+
+def test_parallel_mf_training_converges_like_one_thread(ratings_df):
+    test_df = ratings_df.sample(frac=0.2, random_state=0)
+    train_df = ratings_df.drop(test_df.index)
+    test_df = test_df[test_df["user_id"].isin(train_df["user_id"]) & test_df["item_id"].isin(train_df["item_id"])]
+
+    def held_out_rmse(n_jobs):
+        model = MatrixFactorization(train_df, n_factors=10, n_epochs=20, batch_size=64, n_jobs=n_jobs)
+        predicted = model.predict_ratings(test_df["user_id"], test_df["item_id"])
+        return np.sqrt(np.mean((predicted - test_df["rating"].to_numpy()) ** 2))
+
+    baseline = np.sqrt(np.mean((test_df["rating"] - train_df["rating"].mean()) ** 2))
+    single, parallel = held_out_rmse(1), held_out_rmse(4)
+    assert single < 0.9 * baseline
+    assert parallel == pytest.approx(single, rel=0.03)
+
+
+# -------------------------------
+# Evaluation metrics
+# -------------------------------
+
+class _FixedScores:
+    """
+    Model stub scoring two users over four items with fixed scores.
+    """
+
+    def __init__(self):
+        self.user_index = IdMapper(np.array([1, 2]))
+        self.item_index = IdMapper(np.array([10, 20, 30, 40]))
+        self.scores = np.array([[0.9, 0.8, 0.1, 0.5],
+                                [0.1, 0.2, 0.9, 0.3]])
+        self.rated = np.array([[False, False, False, False],
+                               [False, False, True, False]])
+
+    def user_rows(self, user_ids):
+        return self.user_index.encode(user_ids)
+
+    def score_users(self, user_rows):
+        return self.scores[user_rows], self.rated[user_rows]
+
+
+def test_evaluate_model_ranking_metrics():
+    # User 1 gets [10, 20] (hit at rank 2 of 2 relevant), user 2 gets [40, 20] (hit at rank 1 of 1)
+    test_df = pd.DataFrame({"user_id": [1, 1, 1, 2, 3],
+                            "item_id": [20, 40, 30, 40, 10],
+                            "rating": [5.0, 4.0, 1.0, 5.0, 5.0]})
+    result = evaluate_model(_FixedScores(), test_df, k=2, threshold=4.0)
+
+    dcg_user1 = 1 / np.log2(3)
+    assert result["users"] == 2
+    assert result["skipped_users"] == 1
+    assert result["precision@2"] == pytest.approx(0.5)
+    assert result["recall@2"] == pytest.approx((0.5 + 1.0) / 2)
+    assert result["ndcg@2"] == pytest.approx((dcg_user1 / (1 + dcg_user1) + 1.0) / 2)
+    assert result["map@2"] == pytest.approx((0.25 + 1.0) / 2)
+    assert result["coverage"] == pytest.approx(3 / 4)
+
+
+def test_kfold_splits_partition_the_rows(ratings_df):
+    splits = kfold_splits(ratings_df, n_folds=4)
+    tests = np.concatenate([test for _, test in splits])
+    assert np.array_equal(np.sort(tests), np.arange(len(ratings_df)))
+    for train, test in splits:
+        assert not np.intersect1d(train, test).size
+
+
+# -------------------------------
+# Content-based
+# -------------------------------
+
+def test_hashed_model_restored_from_arrays_can_add_items():
+    items_df = generate_items(n_items=120, seed=3)
+    cb_model = ContentBasedFiltering(items_df.iloc[:100].copy(), features="hashed", num_neighbors=10)
+    cf_model = CollaborativeFiltering(generate_ratings(n_users=50, n_items=100, n_ratings=800),
+                                      item_mapper=cb_model.item_index, sparse=True)
+    _, restored, _ = restore_models(*collect_arrays(cf_model, cb_model, HybridRecommender(cf_model, cb_model)))
+
+    new_items = items_df.iloc[100:].copy()
+    cb_model.add_items(new_items)
+    restored.add_items(new_items)
+    np.testing.assert_array_equal(restored.hasher.doc_freq, cb_model.hasher.doc_freq)
+    np.testing.assert_allclose(restored.tfidf_matrix.toarray(), cb_model.tfidf_matrix.toarray(), atol=1e-6)
+
+
+# -------------------------------
+# Candidate retrieval
+# -------------------------------
+
+def test_retrieval_update_follows_rating_deltas():
+    ratings_df = generate_ratings(n_users=150, n_items=200, n_ratings=3000, seed=5)
+    cb_model = ContentBasedFiltering(generate_items(n_items=200, seed=5), num_neighbors=10)
+    cf_model = CollaborativeFiltering(ratings_df, sparse=True, item_mapper=cb_model.item_index)
+    hybrid = HybridRecommender(cf_model, cb_model)
+    pipeline = RetrievalPipeline(hybrid, {"cf": 50, "content": 20, "popular": 10}, ratings_df)
+
+    delta = ratings_df.sample(20, random_state=1).assign(timestamp=ratings_df["timestamp"].max() + 1)
+    delta.loc[delta.index[:3], "user_id"] = 10 ** 6
+    delta.loc[delta.index[3:6], "rating"] = 0.0
+    delta = delta.drop_duplicates(["user_id", "item_id"], keep="last")
+    previous = cf_model.stored_ratings(delta["user_id"], delta["item_id"])
+    cf_model.apply_ratings(delta)
+    hybrid.align_items()
+    pipeline.update(delta, previous)
+
+    np.testing.assert_array_equal(pipeline._item_counts, cf_model.item_counts())
+    _, stats = pipeline.retrieve(10 ** 6, 5)
+    assert stats["candidates"]["content"] > 0
+
+
+@pytest.mark.parametrize("similarity_type,num_neighbors", [("item", 10), ("user", None)])
+def test_retrieval_batch_matches_single_users(similarity_type, num_neighbors):
+    ratings_df = generate_ratings(n_users=120, n_items=180, n_ratings=2500, seed=4)
+    cb_model = ContentBasedFiltering(generate_items(n_items=180, seed=4), num_neighbors=num_neighbors)
+    cf_model = CollaborativeFiltering(ratings_df, similarity_type=similarity_type, sparse=True,
+                                      item_mapper=cb_model.item_index)
+    pipeline = RetrievalPipeline(HybridRecommender(cf_model, cb_model),
+                                 {"cf": 40, "content": 20, "popular": 10}, ratings_df)
+    user_ids = ratings_df["user_id"].drop_duplicates().head(12).tolist() + [10 ** 6]
+    allowed = np.arange(len(pipeline.hybrid_model.item_ids)) % 3 != 0
+
+    for mask in (None, allowed):
+        batch = pipeline.recommend_for_users(user_ids, 5, mask)
+        for user_id, recommendations in zip(user_ids, batch):
+            single = pipeline.recommend_for_user(user_id, 5, mask)
+            assert [item for item, _ in recommendations] == [item for item, _ in single]
+            np.testing.assert_allclose([score for _, score in recommendations],
+                                       [score for _, score in single], rtol=1e-5)
+    assert batch[-1] == []
+
+
+def test_saved_ann_index_is_reused_only_for_the_same_rows(tmp_path):
+    items_df = generate_items(n_items=200, seed=2)
+    model = ContentBasedFiltering(items_df.copy(), num_neighbors=10)
+    model.build_ann_index(n_lists=8, n_probe=8)
+    path = str(tmp_path / "ann_content.npz")
+    model.save_ann_index(path)
+
+    same = ContentBasedFiltering(items_df.copy(), num_neighbors=10)
+    assert same.load_ann_index(path) is not None
+    item_id = int(items_df["item_id"].iloc[3])
+    assert same.recommend_similar_items(item_id, 5) == model.recommend_similar_items(item_id, 5)
+
+    shifted = ContentBasedFiltering(items_df.iloc[1:].copy(), num_neighbors=10)
+    assert shifted.load_ann_index(path) is None
+    assert shifted.ann_index is None
+
+
+# -------------------------------
+# Popularity
+# -------------------------------
+
+def test_popularity_counts_events_without_timestamps_as_current():
+    ratings_df = pd.DataFrame({"user_id": [1, 2, 3], "item_id": [10, 10, 20],
+                               "timestamp": [0, 0, 30 * 86_400]})
+    ranker = PopularityRanker(ratings_df, half_life_days=1)
+    assert [item for item, _ in ranker.recommend(2, "trending")] == [20, 10]
+
+    ranker.update(pd.DataFrame({"user_id": [4, 5], "item_id": [10, 10]}))
+    assert ranker.trend[ranker.item_index.get(10)] == pytest.approx(2, abs=1e-6)
+    assert [item for item, _ in ranker.recommend(2, "trending")] == [10, 20]
+
+
+def test_popularity_removals_lower_counts_and_rankings():
+    ratings_df = pd.DataFrame({"user_id": [1, 2, 3, 4, 5], "item_id": [10, 10, 10, 20, 20],
+                               "timestamp": [100, 100, 100, 100, 100]})
+    ranker = PopularityRanker(ratings_df, top_n=1)
+    assert ranker.recommend(1, "popular") == [(10, 3.0)]
+
+    ranker.update(ratings_df.iloc[:0], removed_df=ratings_df.iloc[:2])
+    assert ranker.counts[ranker.item_index.encode([10, 20])].tolist() == [1.0, 2.0]
+    assert ranker.trend[ranker.item_index.get(10)] == pytest.approx(1.0)
+    assert [item for item, _ in ranker.recommend(1, "popular")] == [20]
+    assert [item for item, _ in ranker.recommend(1, "trending")] == [20]
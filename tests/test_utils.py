@@ -0,0 +1,176 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from app.data.id_mapper import IdMapper
+from app.data.load_data import load_ratings_chunked
+from app.models.utils import replace_rows, to_dense, top_n_indices, top_n_rows
+
+
+# -------------------------------
+# Top-N selection
+# -------------------------------
+
+def test_top_n_indices_returns_best_first():
+    scores = np.array([0.1, 0.9, 0.5, 0.7])
+    assert top_n_indices(scores, 3).tolist() == [1, 3, 2]
+
+
+def test_top_n_indices_skips_excluded_and_disallowed():
+    scores = np.array([0.1, 0.9, 0.5, 0.7])
+    exclude = np.array([False, True, False, False])
+    allowed = np.array([True, True, True, False])
+    assert top_n_indices(scores, 3, exclude=exclude, allowed=allowed).tolist() == [2, 0]
+
+
+def test_top_n_indices_with_nothing_available():
+    scores = np.array([0.1, 0.9])
+    assert len(top_n_indices(scores, 5, exclude=np.array([True, True]))) == 0
+    assert len(top_n_indices(scores, 0)) == 0
+
+
+def test_top_n_rows_matches_top_n_indices_per_row():
+    rng = np.random.default_rng(0)
+    scores = rng.random((6, 20))
+    exclude = rng.random((6, 20)) < 0.3
+    allowed = rng.random(20) < 0.8
+    rows = top_n_rows(scores, 5, exclude=exclude, allowed=allowed)
+    for row, top in enumerate(rows):
+        expected = top_n_indices(scores[row], 5, exclude=exclude[row], allowed=allowed)
+        assert top.tolist() == expected.tolist()
+
+
+def test_top_n_rows_drops_excluded_positions():
+    scores = np.array([[0.3, 0.2, 0.1]])
+    exclude = np.array([[True, False, True]])
+    assert [top.tolist() for top in top_n_rows(scores, 3, exclude=exclude)] == [[1]]
+
+
+# -------------------------------
+# Sparse helpers
+# -------------------------------
+
+def test_replace_rows_swaps_only_the_given_rows():
+    matrix = sparse.random(8, 6, density=0.4, format="csr", random_state=1)
+    rows = np.array([0, 3, 7])
+    block = sparse.random(3, 6, density=0.5, format="csr", random_state=2)
+
+    expected = matrix.toarray()
+    expected[rows] = block.toarray()
+    result = replace_rows(matrix, rows, block)
+    assert result.shape == matrix.shape
+    np.testing.assert_array_equal(result.toarray(), expected)
+
+
+def test_replace_rows_with_empty_rows():
+    matrix = sparse.csr_matrix(np.arange(12, dtype=float).reshape(4, 3))
+    block = sparse.csr_matrix((1, 3))
+    result = replace_rows(matrix, np.array([2]), block)
+    assert result[2].nnz == 0
+    np.testing.assert_array_equal(result[[0, 1, 3]].toarray(), matrix[[0, 1, 3]].toarray())
+
+
+def test_to_dense_accepts_sparse_and_arrays():
+    array = np.eye(3)
+    np.testing.assert_array_equal(to_dense(sparse.csr_matrix(array)), array)
+    np.testing.assert_array_equal(to_dense(array), array)
+
+
+# -------------------------------
+# IdMapper
+# -------------------------------
+
+@pytest.mark.parametrize("ids", [
+    np.array([5, 3, 9]),                        # compact integers: lookup table
+    np.array([5, 3, 10 ** 12]),                 # sparse integers: hash index
+    np.array(["b", "a", "c"], dtype=object),    # strings: hash index
+])
+def test_id_mapper_round_trip(ids):
+    mapper = IdMapper(ids)
+    assert len(mapper) == 3
+    codes = mapper.encode(ids)
+    assert codes.tolist() == [0, 1, 2]
+    assert mapper.decode(codes).tolist() == ids.tolist()
+    assert mapper.get(ids[1]) == 1
+    assert ids[2] in mapper
+
+
+def test_id_mapper_unknown_ids_and_limit():
+    mapper = IdMapper(np.array([5, 3, 9]))
+    assert mapper.encode([3, 4, -1, 9]).tolist() == [1, -1, -1, 2]
+    assert mapper.encode([5, 3, 9], limit=2).tolist() == [0, 1, -1]
+    assert mapper.get(9, limit=2) == -1
+    assert mapper.get("x") == -1
+    with pytest.raises(KeyError):
+        mapper.get_loc(4)
+
+
+def test_id_mapper_extend_appends_new_ids_only():
+    mapper = IdMapper(np.array([5, 3]))
+    codes = mapper.extend(np.array([3, 7, 7, 11]))
+    assert codes.tolist() == [1, 2, 2, 3]
+    assert mapper.ids.tolist() == [5, 3, 7, 11]
+    assert mapper.encode([5, 3, 7, 11]).tolist() == [0, 1, 2, 3]
+
+
+def test_id_mapper_extend_switches_from_table_to_hash():
+    mapper = IdMapper(np.arange(10))
+    mapper.extend([10 ** 12, 10])
+    assert mapper.encode([0, 9, 10 ** 12, 10]).tolist() == [0, 9, 10, 11]
+    assert mapper.get(10 ** 12) == 10
+
+
+def test_id_mapper_hash_mode_appends_one_id_at_a_time():
+    mapper = IdMapper(np.array([f"u{i}" for i in range(100)], dtype=object))
+    for k in range(30):
+        mapper.extend([f"new{k}"])
+    assert len(mapper) == 130
+    assert mapper.get("new3") == 103
+    assert mapper.encode(["u7", "new29", "missing"]).tolist() == [7, 129, -1]
+    assert mapper.decode([100, 129]).tolist() == ["new0", "new29"]
+
+
+def test_id_mapper_from_ids_keeps_existing_views():
+    mapper = IdMapper.from_ids(np.arange(5))
+    view = mapper.ids
+    mapper.extend([7])
+    assert view.tolist() == [0, 1, 2, 3, 4]
+    assert mapper.ids.tolist() == [0, 1, 2, 3, 4, 7]
+
+
+def test_id_mapper_fit_encode_sorts():
+    mapper, codes = IdMapper.fit_encode([30, 10, 20, 10])
+    assert mapper.ids.tolist() == [10, 20, 30]
+    assert codes.tolist() == [2, 0, 1, 0]
+
+
+# -------------------------------
+# Ratings loading
+# -------------------------------
+
+def test_load_ratings_chunked_drops_only_malformed_rows(tmp_path):
+    path = tmp_path / "ratings.csv"
+    path.write_text("user_id,item_id,rating,timestamp\n"
+                    "1,101,4.5,100\n"
+                    "2,11,abc,101\n"     # malformed rating
+                    "3,,2,102\n"         # missing item
+                    "x,5,3,103\n"        # malformed user
+                    "4,7,9,104\n"        # rating out of range
+                    "5,8,3,\n"           # missing timestamp: kept as 0
+                    "6.5,9,1,105\n"      # non-integral id
+                    "7,10,2,106\n")
+    df = load_ratings_chunked(str(path), chunksize=3, use_cache=False)
+    assert df["user_id"].tolist() == [1, 5, 7]
+    assert df["item_id"].tolist() == [101, 8, 10]
+    assert df["rating"].tolist() == [4.5, 3.0, 2.0]
+    assert df["timestamp"].tolist() == [100, 0, 106]
+    assert df.dtypes.tolist() == [np.int32, np.int32, np.float32, np.int64]
+
+
+def test_load_ratings_chunked_reads_its_cache(tmp_path):
+    path = tmp_path / "ratings.csv"
+    path.write_text("user_id,item_id,rating\n1,101,4\n2,102,5\n")
+    first = load_ratings_chunked(str(path))
+    assert (tmp_path / "ratings.csv.cache" / "meta.json").exists()
+    cached = load_ratings_chunked(str(path))
+    assert cached.equals(first)